@@ -0,0 +1,76 @@
+"""
+Compares creating items one POST at a time with creating them in a single bulk POST.
+Run from a project's directory (eg. example/src), with CouchDB running:
+
+    python ../../benchmarks/bulk_writes.py [RESOURCE] [COUNT]
+
+The resource's database is deleted and re-created before each run.
+"""
+from typing import *
+import io
+import json
+import sys
+import time
+
+from restapiboys import database
+from restapiboys.endpoints import get_resource_config_of_route
+from restapiboys.server import requests_handler
+
+
+def request(method: str, path: str, body: Any) -> str:
+    body_bytes = json.dumps(body).encode("utf-8")
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "CONTENT_LENGTH": str(len(body_bytes)),
+        "wsgi.input": io.BytesIO(body_bytes),
+        "wsgi.url_scheme": "http",
+        "HTTP_HOST": "localhost",
+        "HTTP_USER_AGENT": "Mozilla/5.0 (X11; Linux x86_64; rv:75.0) Gecko/20100101 Firefox/75.0",
+    }
+    response = {}
+
+    def start_response(status, headers):
+        response["status"] = status
+
+    b"".join(requests_handler(environ, start_response))
+    return response["status"]
+
+
+def make_items(count: int) -> List[Dict[str, Any]]:
+    return [{"name": f"Subject {i}", "color": "#ff0000"} for i in range(count)]
+
+
+def reset(database_name: str) -> None:
+    database.delete_database(database_name)
+    database.create_database(database_name)
+
+
+def run(route: str, count: int) -> None:
+    resource = get_resource_config_of_route(route)
+    items = make_items(count)
+
+    reset(resource.identifier)
+    start = time.perf_counter()
+    for item in items:
+        request("POST", route, item)
+    one_by_one = time.perf_counter() - start
+
+    reset(resource.identifier)
+    start = time.perf_counter()
+    request("POST", route, items)
+    bulk = time.perf_counter() - start
+
+    database.delete_database(resource.identifier)
+    print(f"{count} items on {route}")
+    print(f"  one POST per item: {one_by_one:.3f}s ({count / one_by_one:.0f} items/s)")
+    print(f"  one bulk POST:     {bulk:.3f}s ({count / bulk:.0f} items/s)")
+    print(f"  speedup:           {one_by_one / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    run(
+        sys.argv[1] if len(sys.argv) > 1 else "/subjects",
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+    )
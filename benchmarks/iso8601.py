@@ -0,0 +1,51 @@
+"""
+Compares the checks of `date`, `time` and `datetime` values of restapiboys.iso8601
+with parsing them with arrow, which the validator used before.
+Run with restapiboys and arrow installed:
+
+    poetry run python benchmarks/iso8601.py [NUMBER]
+"""
+from typing import *
+import sys
+import timeit
+
+import arrow
+
+from restapiboys import iso8601
+
+# Formats of arrow.get, for each type
+ARROW_PATTERNS = {
+    "date": "YYYY-MM-DDZZ",
+    "time": "HH:mm:ssZZ",
+    "datetime": "YYYY-MM-DD[T]HH:mm:ssZZ",
+}
+
+VALUES = {
+    "date": ["2026-03-01+01:00", "2024-02-29Z", "2026-02-30Z"],
+    "time": ["08:00:00+01:00", "23:59:59Z", "08:60:00Z"],
+    "datetime": ["2026-03-01T08:00:00+01:00", "2026-03-31T23:59:59Z", "2026-03-01 08:00:00"],
+}
+
+
+def check_with_arrow(value: str, pattern: str) -> bool:
+    try:
+        arrow.get(value, pattern)
+        return True
+    except (arrow.parser.ParserError, ValueError):
+        return False
+
+
+def run(number: int) -> None:
+    print(f"Checking values (best of 5, µs per value)")
+    print(f"  {'value':<32}{'arrow':>10}{'iso8601':>10}{'speedup':>10}")
+    for type_name, values in VALUES.items():
+        check, pattern = iso8601.CHECKS[type_name], ARROW_PATTERNS[type_name]
+        for value in values:
+            before = min(timeit.repeat(lambda: check_with_arrow(value, pattern), number=number, repeat=5))
+            after = min(timeit.repeat(lambda: check(value), number=number, repeat=5))
+            before, after = before / number * 1e6, after / number * 1e6
+            print(f"  {value:<32}{before:>10.2f}{after:>10.2f}{before / after:>9.0f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
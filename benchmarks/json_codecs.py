@@ -0,0 +1,66 @@
+"""
+Compares the encoding and decoding time of the installed JSON codecs on documents
+shaped like the example's homework, and the request body parsing before and after
+`Request.json` (decoded to str then parsed twice, versus parsed once from bytes).
+Run with restapiboys installed:
+
+    poetry run python benchmarks/json_codecs.py [COUNT]
+"""
+from typing import *
+import json
+import sys
+import timeit
+from uuid import uuid4
+
+from restapiboys import codec
+
+
+def make_document(index: int) -> Dict[str, Any]:
+    return {
+        "_id": str(uuid4()),
+        "_rev": f"3-{uuid4().hex}",
+        "title": f"Exercices {index} à {index + 5}, page {index * 2}",
+        "subject": str(uuid4()),
+        "type": "exercise",
+        "due_at": "2026-03-01T08:00:00+01:00",
+        "completed_at": None,
+        "progress": index % 100 / 100,
+        "is_late": index % 3 == 0,
+        "notes": [str(uuid4()) for _ in range(index % 4)],
+        "grades": [],
+        "created_at": "2026-02-20T17:42:03+01:00",
+        "updated_at": "2026-02-21T09:12:45+01:00",
+    }
+
+
+def measure(function: Callable[[], Any], number: int) -> float:
+    """
+    Best time of 5 runs, in milliseconds
+    """
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1000
+
+
+def run(count: int) -> None:
+    documents = [make_document(i) for i in range(count)]
+    body = json.dumps(documents[0]).encode("utf-8")
+    page = json.dumps(documents).encode("utf-8")
+
+    print(f"Encoding and decoding {count} documents (best of 5, ms)")
+    print(f"  {'codec':<12}{'encode':>10}{'decode':>10}")
+    for name, implementation in codec.get_codecs().items():
+        encode = measure(lambda: implementation.dumps(documents), 10)
+        decode = measure(lambda: implementation.loads(page), 10)
+        print(f"  {name:<12}{encode:>10.3f}{decode:>10.3f}")
+    encode = measure(lambda: json.dumps(documents).encode("utf-8"), 10)
+    decode = measure(lambda: json.loads(page), 10)
+    print(f"  {'json':<12}{encode:>10.3f}{decode:>10.3f}")
+
+    print("Parsing a request body (µs)")
+    before = measure(lambda: [json.loads(body.decode("utf-8")) for _ in range(2)], 10000)
+    after = measure(lambda: codec.loads(body), 10000)
+    print(f"  decoded to str, parsed twice: {before * 1000:.2f}")
+    print(f"  parsed once from bytes ({codec.codec.name}): {after * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
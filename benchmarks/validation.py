@@ -0,0 +1,56 @@
+"""
+Measures how many request bodies of the example's homework resource are validated per second.
+Run from example/src, with restapiboys installed:
+
+    poetry run python ../../benchmarks/validation.py [NUMBER]
+"""
+from typing import *
+from uuid import uuid4
+import sys
+import timeit
+
+from restapiboys.endpoints import get_registry
+from restapiboys.validation import validate_item_data
+
+BODIES = {
+    "valid": {
+        "title": "Exercices 4 à 9, page 12",
+        "subject": str(uuid4()),
+        "type": "exercise",
+        "due_at": "2026-03-01T08:00:00+01:00",
+        "progress": 0.5,
+        "notes": [str(uuid4()), str(uuid4())],
+    },
+    "valid, without dates": {
+        "title": "Exercices 4 à 9, page 12",
+        "subject": str(uuid4()),
+        "type": "exercise",
+        "progress": 0.5,
+        "notes": [str(uuid4()), str(uuid4())],
+    },
+    "wrong types": {
+        "title": 12,
+        "subject": str(uuid4()),
+        "type": "exercise",
+        "due_at": "2026-03-01T08:00:00+01:00",
+        "progress": "half",
+    },
+    "missing fields": {"title": "Exercices 4 à 9, page 12"},
+}
+
+
+def run(number: int) -> None:
+    resource = get_registry().by_identifier["homework"]
+    # Compile the validator before measuring
+    validate_item_data({}, "POST", resource)
+    print(f"Validating homework (best of 5, validations per second)")
+    for name, body in BODIES.items():
+        method = "PATCH" if name == "valid, without dates" else "POST"
+        best = min(
+            timeit.repeat(lambda: validate_item_data(body, method, resource), number=number, repeat=5)
+        )
+        print(f"  {name:<22}{number / best:>12,.0f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -7,7 +7,7 @@ import re
 URL_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
 
 def now() -> str:
-  return datetime.datetime.now().isoformat()
+  return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 def is_url(maybe_url) -> bool:
   return URL_PATTERN.match(maybe_url) is not None
@@ -0,0 +1,122 @@
+"""
+ASGI application, the asyncio counterpart of `restapiboys.server.requests_handler`.
+Requests are handled by the same code, only CouchDB is queried with `restapiboys.async_database`,
+so that a worker can keep handling requests while waiting for the database.
+"""
+from restapiboys import async_database as database
+from restapiboys.config import get_api_config
+from restapiboys.http import PayloadTooLargeError, Request, Response, StatusCode
+from restapiboys.compression import compress_response
+from restapiboys.routing import RouteKind, get_router
+from restapiboys.server import (
+    check_custom_route_response,
+    get_internal_error_response,
+    handle_endpoint,
+    is_static,
+    log_response,
+    record_timings,
+    route_request,
+)
+from restapiboys import log, metrics
+from functools import partial
+from typing import *
+import asyncio
+
+
+async def application(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    try:
+        config = get_api_config()
+        timings = metrics.start_timing(config.metrics)
+        body = await read_body(scope, receive, config.max_request_body_size)
+        req = Request.from_asgi_scope(scope, body)
+    except PayloadTooLargeError as error:
+        await send_response(send, Response(StatusCode.PAYLOAD_TOO_LARGE, {}, {"error": str(error)}))
+        return
+    except Exception as exception:
+        log.critical(str(exception))
+        await send_response(send, Response(StatusCode.INTERNAL_SERVER_ERROR))
+        return
+    match = None
+    try:
+        with metrics.timed("route"):
+            match, res = route_request(req, config)
+        if res is None and match.kind is RouteKind.custom:
+            # Custom routes are regular functions, don't block the event loop with them
+            res = await asyncio.get_running_loop().run_in_executor(
+                None, partial(match.handler, req, **match.params)
+            )
+            res = check_custom_route_response(req, res)
+        elif res is None:
+            res = await database.run(handle_endpoint(req, match))
+        with metrics.timed("compress"):
+            res = compress_response(req, res, config.compression, static=is_static(match))
+        record_timings(req, res, match, timings, config)
+    except Exception as exception:
+        res = get_internal_error_response(exception, config)
+    await send_response(send, res)
+    log_response(req, res)
+
+
+async def handle_lifespan(receive: Callable, send: Callable) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Parse the endpoints and build the router before accepting requests
+            get_router()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await database.close_client()
+            cache = database.get_cache()
+            if cache:
+                cache.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def read_body(scope: Dict[str, Any], receive: Callable, max_size: Optional[int] = None) -> bytes:
+    """
+    Reads the body of a request, without reading more than `max_size` bytes.
+    Raises `PayloadTooLargeError` if the body is larger.
+    The body's size is not limited if `max_size` is `None`.
+    """
+    error = PayloadTooLargeError(f"The request body must not be larger than {max_size} bytes")
+    for name, value in scope.get("headers", []):
+        if name.lower() == b"content-length" and value.isdigit() and max_size is not None and int(value) > max_size:
+            raise error
+    body = bytearray()
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        if max_size is not None and len(body) > max_size:
+            raise error
+        more_body = message.get("more_body", False)
+    return bytes(body)
+
+
+async def send_response(send: Callable, res: Response) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": int(res.status[:3]),
+            "headers": [
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in res.headers
+            ],
+        }
+    )
+    if not res.is_streamed:
+        await send({"type": "http.response.body", "body": res.body})
+        return
+    if isinstance(res.body, AsyncIterator):
+        async for chunk in res.body:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    else:
+        for chunk in res.body:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
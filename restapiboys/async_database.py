@@ -0,0 +1,141 @@
+"""
+Runs the operations of `restapiboys.couchdb` with httpx, for the ASGI application.
+Requires httpx (`poetry install -E asgi`).
+"""
+from typing import *
+from restapiboys.config import DatabaseConfig, DatabaseCredentials, get_api_config, get_db_credentials
+from restapiboys.couchdb import (
+    Concurrently,
+    CouchRequest,
+    DocumentStream,
+    Operation,
+    get_cache,
+    log_request,
+    parse_all_docs_header,
+    parse_all_docs_line,
+)
+from restapiboys import codec, log, metrics
+import asyncio
+import httpx
+
+
+class AsyncCouchClient:
+    """
+    HTTP client of the ASGI application. Connections are kept open,
+    so that many requests to CouchDB can be in flight at once.
+    """
+
+    def __init__(self, config: DatabaseConfig, credentials: DatabaseCredentials):
+        self.client = httpx.AsyncClient(
+            base_url=f"http://{config.host}:{config.port}",
+            auth=(credentials.username, credentials.password),
+            # Don't cap the number of requests in flight, only the connections kept alive
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=config.pool_size,
+            ),
+            timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+        )
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        data: Union[dict, list, None] = None,
+        headers: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+    ) -> httpx.Response:
+        if data is not None:
+            headers = {**(headers or {}), "Content-Type": "application/json"}
+        req = self.client.build_request(
+            method,
+            "/" + url,
+            content=codec.dumps(data) if data is not None else None,
+            headers=headers,
+            params=params,
+        )
+        return await self.client.send(req, stream=stream)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+_client: Optional[AsyncCouchClient] = None
+
+
+def get_client() -> AsyncCouchClient:
+    """
+    Gets the `AsyncCouchClient` of this process, creating it on the first call.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncCouchClient(get_api_config().database, get_db_credentials())
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def run(operation: Operation) -> Any:
+    """
+    Runs `operation`, making the requests of concurrent operations at the same time
+    """
+    response = None
+    try:
+        while True:
+            step = operation.send(response)
+            if type(step) is Concurrently:
+                response = list(await asyncio.gather(*(run(concurrent) for concurrent in step.operations)))
+            else:
+                response = await send(step)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def send(request: CouchRequest) -> Any:
+    log_request(request)
+    with metrics.timed("db"):
+        res = await get_client().request(*request)
+    if not request.stream:
+        return res
+    if res.is_error:
+        return DocumentStream(None, aiter_docs(res))
+    lines = res.aiter_lines()
+    try:
+        first_line = await lines.__anext__()
+    except StopAsyncIteration:
+        first_line = ""
+    header = parse_all_docs_header(first_line.encode("utf-8"))
+    return DocumentStream(
+        (header or {}).get("update_seq"),
+        aiter_docs(res, lines, first_line if header is None else None),
+    )
+
+
+async def aiter_docs(
+    res: httpx.Response, lines: Optional[AsyncIterator[str]] = None, first_line: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterates over the documents of the `lines` of the `_all_docs` response `res`,
+    starting with `first_line` if it was read to look for the response's header
+    """
+    try:
+        if res.is_error:
+            await res.aread()
+            log.error("DB: Error while listing items: {}", res.json())
+            return
+        if first_line is not None:
+            row = parse_all_docs_line(first_line.encode("utf-8"))
+            if row is not None:
+                yield row["doc"]
+        async for line in lines:
+            row = parse_all_docs_line(line.encode("utf-8"))
+            if row is not None:
+                yield row["doc"]
+    finally:
+        await res.aclose()
@@ -0,0 +1,193 @@
+"""
+Read-through cache of CouchDB documents, per worker.
+Only documents read by ID are cached (an item, and the items of ?expand=),
+collections are always listed from CouchDB.
+Entries are evicted least-recently-used first when the cache is full, expire after a TTL,
+and are invalidated as soon as the database's _changes feed reports a change to them.
+"""
+from collections import OrderedDict
+from typing import *
+from restapiboys import log
+from restapiboys.config import CacheConfig
+import threading
+import time
+
+# In seconds, before following the _changes feed again after an error
+CHANGES_RETRY_DELAY = 5
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "evictions", "invalidations")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    size: int
+    # time.monotonic() after which the entry is stale
+    expires_at: float
+
+
+class DocumentCache:
+    """
+    `make_client` creates the `CouchClient` used to follow the _changes feeds,
+    separate from the one handling requests since each feed keeps a connection busy.
+    """
+
+    def __init__(self, config: CacheConfig, make_client: Callable[[], Any]):
+        self.config = config
+        self.make_client = make_client
+        self.stats = CacheStats()
+        self.size = 0
+        self.entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self.followers: Dict[str, ChangesFollower] = {}
+        # Number of invalidations of each database's documents, cached or not
+        self.generations: Dict[str, int] = {}
+        # Entries are invalidated from the followers' threads
+        self.lock = threading.RLock()
+
+    def get(self, database: str, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get((database, key))
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self.remove((database, key))
+                self.stats.misses += 1
+                return None
+            self.entries.move_to_end((database, key))
+            self.stats.hits += 1
+            return entry.value
+
+    def get_generation(self, database: str) -> int:
+        """
+        Gets the generation of the documents of `database`, to give to `set`.
+        Get it before reading the document to cache.
+        """
+        with self.lock:
+            return self.generations.get(database, 0)
+
+    def set(self, database: str, key: str, value: Any, size: int, generation: Optional[int] = None) -> None:
+        """
+        Caches `value`, unless documents of `database` were invalidated since `generation`:
+        `value` may have been read before a change, reported while it was being read.
+        """
+        if size > self.config.max_bytes:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generations.get(database, 0):
+                return
+            self.remove((database, key))
+            self.entries[(database, key)] = CacheEntry(
+                value, size, time.monotonic() + self.config.ttl
+            )
+            self.size += size
+            while (
+                len(self.entries) > self.config.max_entries
+                or self.size > self.config.max_bytes
+            ):
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.stats.evictions += 1
+
+    def invalidate(self, database: str, key: str) -> None:
+        with self.lock:
+            self.generations[database] = self.generations.get(database, 0) + 1
+            if self.remove((database, key)):
+                self.stats.invalidations += 1
+
+    def clear(self, database: str) -> None:
+        with self.lock:
+            self.generations[database] = self.generations.get(database, 0) + 1
+            for cache_key in [k for k in self.entries if k[0] == database]:
+                self.remove(cache_key)
+                self.stats.invalidations += 1
+
+    def remove(self, cache_key: Tuple[str, str]) -> bool:
+        entry = self.entries.pop(cache_key, None)
+        if entry is None:
+            return False
+        self.size -= entry.size
+        return True
+
+    def watch(self, database: str) -> bool:
+        """
+        Starts following the _changes feed of `database`, if not already done.
+        Must be called before reading the documents to cache.
+        Returns whether the changes are followed yet: documents must not be cached before that.
+        Changes reported while a document is read are caught by `set`'s `generation`.
+        """
+        with self.lock:
+            follower = self.followers.get(database)
+            if follower is None:
+                follower = ChangesFollower(self, database, self.make_client())
+                self.followers[database] = follower
+                follower.start()
+        return follower.ready.is_set()
+
+    def stop(self) -> None:
+        for follower in self.followers.values():
+            follower.stopped.set()
+
+
+class ChangesFollower(threading.Thread):
+    """
+    Invalidates the cached documents of `database` when they change,
+    by long-polling its _changes feed.
+    The last sequence seen is tracked, so that reconnecting only gets the changes
+    that happened since.
+    """
+
+    def __init__(self, cache: DocumentCache, database: str, client: Any):
+        super().__init__(name=f"changes-follower-{database}", daemon=True)
+        self.cache = cache
+        self.database = database
+        self.client = client
+        self.stopped = threading.Event()
+        # Set once the current sequence is known: nothing that changes after it gets missed
+        self.ready = threading.Event()
+        self.since: Optional[str] = None
+
+    def get_update_seq(self) -> Optional[str]:
+        try:
+            return self.client.request("GET", self.database).json().get("update_seq")
+        except Exception as error:
+            log.warn("Cache: Can't get the update sequence of {0}: {1}", self.database, str(error))
+            return None
+
+    def run(self) -> None:
+        # Answer before the client's read timeout
+        timeout = int(self.client.timeout[1] * 1000 * 0.8)
+        while not self.stopped.is_set():
+            if self.since is None:
+                # Fetched here rather than by the reader that started following the changes,
+                # so that it doesn't wait for it
+                self.since = self.get_update_seq()
+                if self.since is None:
+                    self.stopped.wait(CHANGES_RETRY_DELAY)
+                    continue
+                self.ready.set()
+            try:
+                res = self.client.request(
+                    "GET",
+                    f"{self.database}/_changes",
+                    params={"feed": "longpoll", "since": self.since, "timeout": timeout},
+                )
+                body = res.json()
+                if "results" not in body:
+                    raise ValueError(body)
+            except Exception as error:
+                log.warn("Cache: Error while following changes of {0}: {1}", self.database, str(error))
+                self.stopped.wait(CHANGES_RETRY_DELAY)
+                continue
+            for change in body["results"]:
+                self.cache.invalidate(self.database, change["id"])
+            self.since = body["last_seq"]
+        self.client.close()
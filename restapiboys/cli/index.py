@@ -12,6 +12,10 @@ Options:
                             error    - Error messages
                             critical - Show only critical messages
   -q --quiet            Equivalent of --log=critical
+  --log-format=FORMAT   Output of log messages [default: pretty]
+                        Possible values:
+                            pretty - Colored text, for humans
+                            json   - One JSON object per line, for log collectors
   -v --verbose          Equivalent of --log=debug
   -c --config=FILEPATH  Specify the configuration file path [default: config.yaml]
 
@@ -22,6 +26,10 @@ Command 'start' options:
   -w --watch                   Restart webserver when code changes
   --workers=INTEGER|'auto'     Number of gunicorn workers to boot [default: auto]
   --debug-gunicorn             Set gunicorn's log-level to "debug"
+  --engine=ENGINE              Application to serve [default: wsgi]
+                               Possible values:
+                                   wsgi - Synchronous workers, one request at a time per worker
+                                   asgi - Asyncio workers, requires `poetry install -E asgi`
   --no-start-couchdb           Don't start CouchDB. Notice that the service will not 
                                be started when already running, even without this option.
                                Useful if you don't have access to `sudo`, since
@@ -30,9 +38,9 @@ Command 'start' options:
 """
 from enum import Enum
 import os
-from logging import getLogger
 from typing import *
 from importlib import import_module
+from restapiboys import log
 from restapiboys.cli import start, manage_db
 import docopt
 
@@ -43,9 +51,6 @@ class CommandNotFoundError(Exception):
     pass
 
 
-logger = getLogger()
-
-
 def entry_point() -> None:
     args = docopt.docopt(__doc__)
     if args["--quiet"]:
@@ -54,7 +59,10 @@ def entry_point() -> None:
         os.environ["log-level"] = "DEBUG"
     else:
         os.environ["log-level"] = args.get("--log", "INFO").upper()
-    logger.setLevel(os.environ.get("log-level", "INFO"))
+    os.environ["log-format"] = args["--log-format"]
+    # Already imported: the environment variables are only read by the workers
+    log.set_level(os.environ["log-level"])
+    log.set_format(os.environ["log-format"])
     subcommand = args["<command>"]
     dispatch_subcommand(subcommand, args)
 
@@ -1,6 +1,7 @@
-from restapiboys.endpoints import get_endpoints
+from restapiboys.endpoints import get_registry
 from restapiboys.log import info, warn, error
-from restapiboys.database import COUCHDB_PORT, create_database, database_exists
+from restapiboys.database import create_database, create_index, database_exists, get_client
+from restapiboys.filtering import get_index_definitions
 from typing import *
 import webbrowser
 import platform
@@ -9,7 +10,8 @@ import initsystem
 def run(args: Dict[str, Any]) -> None:
     start_couchdb_service()
     create_databases()
-    url = f'http://127.0.0.1:{COUCHDB_PORT}/_utils/'
+    create_indexes()
+    url = f'{get_client().base_url}/_utils/'
     info('Opening {} in your webbrowser...', url)
     webbrowser.open(url)
 
@@ -25,7 +27,7 @@ def create_databases() -> None:
     ```
     """
     
-    databases_names = [ r.identifier for r in get_endpoints() ]
+    databases_names = list(get_registry().by_identifier.keys())
     missing_databases = []
 
     for name in databases_names:
@@ -40,6 +42,17 @@ def create_databases() -> None:
             if not created:
                 error('\t  Could not create {}', db_name)
 
+def create_indexes() -> None:
+    """
+    Creates the indexes used to filter and sort on fields declared `filterable`.
+    Existing indexes are left untouched.
+    """
+    for resource in get_registry().resources:
+        for definition in get_index_definitions(resource):
+            info('\t- Indexing {} on {}', resource.identifier, definition['index']['fields'][0])
+            if not create_index(resource.identifier, definition):
+                error('\t  Could not create index {}', definition['name'])
+
 def start_couchdb_service():
     couchdb = initsystem.Service('couchdb')
     if not couchdb.is_running():
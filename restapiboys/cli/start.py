@@ -7,6 +7,12 @@ from typing import *
 from restapiboys import log
 from initsystem import Service
 
+# Gunicorn application and worker class for each --engine
+ENGINES = {
+    "wsgi": ("restapiboys.server:requests_handler", None),
+    "asgi": ("restapiboys.asgi:application", "uvicorn.workers.UvicornWorker"),
+}
+
 WATCH_FILES = (
     get_path("endpoints/*.{yaml,py}"),
     get_path("functions/*.py"),
@@ -20,6 +26,10 @@ def run(args: dict):
     bound_address = "%s:%s" % (args["--address"], args["--port"])
     scheme = "http" if args["--address"] in ("localhost", "127.0.0.1") else "https"
     workers_count = get_workers_count(args["--workers"])
+    if args["--engine"] not in ENGINES:
+        log.critical("Unknown engine {}. Use one of {}", args["--engine"], ", ".join(ENGINES))
+        return
+    application, worker_class = ENGINES[args["--engine"]]
     couchdb = Service("couchdb") if not args['--no-couchdb-start'] else None
 
     try:
@@ -44,6 +54,7 @@ def run(args: dict):
             "workers": workers_count,
             "log-level": "debug" if args["--debug-gunicorn"] else "error",
             "reload": args["--watch"],
+            "worker-class": worker_class,
             # "reload-extra-file": project_yaml_files if args["--watch"] else None,
         }
 
@@ -51,7 +62,7 @@ def run(args: dict):
             log.info("Watching for file changes...")
 
         subprocess.call(
-            ["poetry", "run", "gunicorn", "restapiboys.server:requests_handler"]
+            ["poetry", "run", "gunicorn", application]
             + config_dict_to_cli_args(config)
         )
     except KeyboardInterrupt:
@@ -0,0 +1,69 @@
+"""
+JSON encoding and decoding, with the fastest library installed:
+orjson, then ujson, then simplejson.
+All codecs encode to and decode from UTF-8 bytes, so that bodies don't need to be decoded to `str` first.
+"""
+from typing import *
+import simplejson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class Codec(NamedTuple):
+    name: str
+    dumps: Callable[[Any], bytes]
+    # Accepts bytes and str
+    loads: Callable[[Union[bytes, str]], Any]
+    # Raised by `loads` on malformed JSON
+    decode_error: Type[Exception]
+
+
+def encode_default(obj: Any) -> Any:
+    """
+    Encodes the types the codecs don't know about
+    """
+    if hasattr(obj, "_asdict"):
+        return obj._asdict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def get_codecs() -> Dict[str, Codec]:
+    """
+    Gets the installed codecs, fastest first
+    """
+    codecs = {}
+    if orjson is not None:
+        codecs["orjson"] = Codec(
+            "orjson",
+            lambda obj: orjson.dumps(obj, default=encode_default),
+            orjson.loads,
+            orjson.JSONDecodeError,
+        )
+    if ujson is not None:
+        codecs["ujson"] = Codec(
+            "ujson",
+            lambda obj: ujson.dumps(obj, ensure_ascii=False, default=encode_default).encode("utf-8"),
+            ujson.loads,
+            ujson.JSONDecodeError,
+        )
+    codecs["simplejson"] = Codec(
+        "simplejson",
+        lambda obj: simplejson.dumps(obj, default=encode_default).encode("utf-8"),
+        simplejson.loads,
+        simplejson.JSONDecodeError,
+    )
+    return codecs
+
+
+codec = next(iter(get_codecs().values()))
+dumps = codec.dumps
+loads = codec.loads
+DecodeError = codec.decode_error
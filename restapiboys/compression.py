@@ -0,0 +1,176 @@
+"""
+Compression of responses, negotiated with the request's Accept-Encoding.
+gzip is always available, br and zstd when brotli and zstandard are installed
+(`poetry install -E compression`).
+Streamed responses are compressed chunk by chunk, flushing after each chunk
+so that clients still get the data as it is produced.
+"""
+from functools import lru_cache
+from typing import *
+from restapiboys.config import CompressionConfig
+from restapiboys.http import Request, Response, StatusCode
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Levels used for payloads compressed once and cached
+MAXIMUM_LEVELS = {"gzip": 9, "br": 11, "zstd": 19}
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        # 16 + 15: gzip header, biggest window
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.process(chunk) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+ENCODERS = {"gzip": GzipEncoder, "br": BrotliEncoder, "zstd": ZstdEncoder}
+
+
+def get_available_encodings(config: CompressionConfig) -> List[str]:
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [encoding for encoding in config.encodings if installed.get(encoding)]
+
+
+def get_level(encoding: str, config: CompressionConfig) -> int:
+    return {"gzip": config.gzip_level, "br": config.brotli_level, "zstd": config.zstd_level}[
+        encoding
+    ]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    Gets the quality value of each encoding of an Accept-Encoding header
+    """
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_encoding(header: Optional[str], available: List[str]) -> Optional[str]:
+    """
+    Chooses the encoding the client prefers among `available`,
+    using the order of `available` to break ties. `None` to send the response as-is.
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0.0)), -index, encoding)
+        for index, encoding in enumerate(available)
+    ]
+    candidates = [c for c in candidates if c[0] > 0]
+    return max(candidates)[2] if candidates else None
+
+
+@lru_cache(maxsize=256)
+def compress_once(body: bytes, encoding: str) -> bytes:
+    """
+    Compresses payloads that don't change, as much as possible since it is only done once
+    """
+    encoder = ENCODERS[encoding](MAXIMUM_LEVELS[encoding])
+    return encoder.compress(body) + encoder.finish()
+
+
+def compress_stream(body: Iterator[bytes], encoder: Any) -> Iterator[bytes]:
+    for chunk in body:
+        compressed = encoder.compress(chunk)
+        if compressed:
+            yield compressed
+    yield encoder.finish()
+
+
+async def acompress_stream(body: AsyncIterator[bytes], encoder: Any) -> AsyncIterator[bytes]:
+    async for chunk in body:
+        compressed = encoder.compress(chunk)
+        if compressed:
+            yield compressed
+    yield encoder.finish()
+
+
+def compress_response(
+    req: Request, res: Response, config: CompressionConfig, static: bool = False
+) -> Response:
+    """
+    Compresses the body of `res` with the encoding negotiated with the client.
+    `static` responses are always the same for the same body,
+    their compressed version is computed once and cached.
+    """
+    if not config.enabled or res.status == StatusCode.NOT_MODIFIED.value:
+        return res
+    headers = dict(res.headers)
+    if "Content-Encoding" in headers:
+        return res
+    if not res.is_streamed and len(res.body) < config.minimum_size:
+        return res
+    # The response depends on Accept-Encoding, caches must know it
+    headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(req.header("Accept-Encoding"), get_available_encodings(config))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        # The compressed bytes are a different representation of the same version
+        if "ETag" in headers and not headers["ETag"].startswith("W/"):
+            headers["ETag"] = "W/" + headers["ETag"]
+        if res.is_streamed:
+            encoder = ENCODERS[encoding](get_level(encoding, config))
+            if isinstance(res.body, AsyncIterator):
+                res.body = acompress_stream(res.body, encoder)
+            else:
+                res.body = compress_stream(res.body, encoder)
+        else:
+            if static:
+                res.body = compress_once(res.body, encoding)
+            else:
+                encoder = ENCODERS[encoding](get_level(encoding, config))
+                res.body = encoder.compress(res.body) + encoder.finish()
+            headers["Content-Length"] = str(len(res.body))
+    res.headers = list(headers.items())
+    return res
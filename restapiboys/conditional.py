@@ -0,0 +1,84 @@
+"""
+Conditional requests: ETags derived from CouchDB revisions, If-None-Match and If-Match.
+Items are tagged with their `_rev`, collections with their database's `update_seq`,
+so that checking whether a client's copy is still fresh doesn't need the documents.
+"""
+from typing import *
+from restapiboys.http import Request
+import hashlib
+import re
+import urllib.parse
+
+# Query parameters that change the representation of an item
+ITEM_REPRESENTATION_PARAMETERS = ("fields",)
+
+# <number of revisions>-<hash>
+REVISION_PATTERN = re.compile(r"^\d+-[0-9a-zA-Z]+$")
+
+
+class PreconditionError(ValueError):
+    """ Used when If-Match can't be the current revision of a document """
+
+    pass
+
+
+def get_item_etag(rev: Optional[str], req: Request) -> Optional[str]:
+    if rev is None:
+        return None
+    variant = {k: v for k, v in req.query.items() if k in ITEM_REPRESENTATION_PARAMETERS}
+    if not variant:
+        return rev
+    # The same revision has a different ETag for each ?fields=
+    return f"{rev}-{hash_etag_parts(urllib.parse.urlencode(variant))[:8]}"
+
+
+def get_collection_etag(update_seq: Optional[str], req: Request) -> Optional[str]:
+    if update_seq is None:
+        return None
+    # Each page and filter of the collection is a different representation
+    query = urllib.parse.urlencode(sorted(req.query.items()))
+    return hash_etag_parts(update_seq, query)[:16]
+
+
+def hash_etag_parts(*parts: str) -> str:
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def parse_etags(header: str) -> List[str]:
+    """
+    Gets the entity tags of an If-None-Match or If-Match header, without quotes nor weakness indicator
+    """
+    etags = []
+    for etag in header.split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        etags.append(etag.strip('"'))
+    return etags
+
+
+def is_not_modified(req: Request, etag: Optional[str]) -> bool:
+    """
+    Checks if the client's copy, given by If-None-Match, is still the current one
+    """
+    header = req.header("If-None-Match")
+    if header is None or etag is None:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+def get_expected_rev(req: Request) -> Optional[str]:
+    """
+    Gets the revision given by If-Match, that the client expects to be the current one.
+    Returns `None` if any revision is fine (no If-Match, or If-Match: *)
+    """
+    header = req.header("If-Match")
+    if header is None:
+        return None
+    etags = parse_etags(header)
+    if "*" in etags:
+        return None
+    if len(etags) != 1 or not REVISION_PATTERN.match(etags[0]):
+        raise PreconditionError("If-Match must be the ETag of the document's current revision")
+    return etags[0]
@@ -3,6 +3,7 @@ from restapiboys.utils import get_path, replace_whitespace_in_keys, resolve_syno
 from typing import *
 from restapiboys import log
 from enum import Enum
+from functools import lru_cache
 import dotenv
 import os
 from pathlib import Path
@@ -12,7 +13,12 @@ API_CONFIG_KEYS_SYNONYMS = {
     'verify_accounts_via': ['verify_accounts_with', 'verify_via', 'verify_with'],
     'reset_passwords_via': ['reset_passwords_with'],
     'users': ['accounts'],
-    'https': ['ssl', 'http over ssl']
+    'https': ['ssl', 'http over ssl'],
+    'database': ['couchdb', 'db'],
+    'cache': ['document_cache', 'documents_cache'],
+    'compression': ['compress', 'compress_responses'],
+    'max_request_body_size': ['max_body_size', 'maximum_request_body_size'],
+    'metrics': ['monitoring', 'prometheus'],
 }
 
 class GlobalConfigError(Exception):
@@ -44,6 +50,45 @@ class ContactInfo(NamedTuple):
     name: Optional[str] = None
     email: Optional[str] = None
 
+class DatabaseConfig(NamedTuple):
+    host: str = '127.0.0.1'
+    port: int = 5984
+    # Maximum number of kept-alive connections to CouchDB, per worker
+    pool_size: int = 10
+    # In seconds
+    connect_timeout: float = 3.05
+    read_timeout: float = 30
+
+class CacheConfig(NamedTuple):
+    # Keep documents read by ID in memory, per worker
+    enabled: bool = False
+    max_entries: int = 1000
+    # Approximate size of the cached documents, as JSON
+    max_bytes: int = 16 * 1024 * 1024
+    # In seconds. Entries are also invalidated as soon as CouchDB reports a change
+    ttl: float = 60
+
+class CompressionConfig(NamedTuple):
+    enabled: bool = True
+    # Smaller responses are sent as-is, in bytes
+    minimum_size: int = 1024
+    # By order of preference. br requires brotli, zstd requires zstandard
+    encodings: List[str] = ['br', 'zstd', 'gzip']
+    gzip_level: int = 6
+    brotli_level: int = 4
+    zstd_level: int = 3
+
+class MetricsConfig(NamedTuple):
+    # Serve the requests' timings at `route`, in Prometheus' format
+    enabled: bool = False
+    # Send the timings of each request in a Server-Timing header
+    server_timing: bool = False
+    route: str = '/metrics'
+    # Where the workers write their metrics to be merged, a temporary directory by default
+    directory: Optional[str] = None
+    # In seconds, between two writes of a worker's metrics
+    flush_interval: float = 1
+
 class DatabaseCredentials(NamedTuple):
     username: str
     password: str
@@ -55,8 +100,19 @@ class APIConfig(NamedTuple):
     https: bool = True
     domain_name: str = 'localhost'
     documentation_url: str = 'localhost/specs'
+    database: DatabaseConfig = DatabaseConfig()
+    cache: CacheConfig = CacheConfig()
+    compression: CompressionConfig = CompressionConfig()
+    # In bytes, larger requests are refused with 413 Payload Too Large. None to not limit it
+    max_request_body_size: Optional[int] = 10 * 1024 * 1024
+    metrics: MetricsConfig = MetricsConfig()
 
-def get_api_config():
+@lru_cache(maxsize=None)
+def get_api_config() -> APIConfig:
+    """
+    Gets the API's configuration, parsing config.yaml on the first call only:
+    its changes are applied by restarting the workers (--watch does it).
+    """
     filepath = get_path('config.yaml')
     parsed = yaml.load_file(filepath)
     parsed = replace_whitespace_in_keys(parsed)
@@ -64,6 +120,10 @@ def get_api_config():
     log.debug('Parsed api config (resolved synonyms): {}', parsed)
     parsed['users'] = UsersConfig(**parsed['users']) if 'users' in parsed.keys() else UsersConfig()
     parsed['contact_info'] = ContactInfo(**parsed['contact_info']) if 'contact_info' in parsed.keys() else ContactInfo()
+    parsed['database'] = DatabaseConfig(**parsed['database']) if 'database' in parsed.keys() else DatabaseConfig()
+    parsed['cache'] = CacheConfig(**parsed['cache']) if 'cache' in parsed.keys() else CacheConfig()
+    parsed['compression'] = CompressionConfig(**parsed['compression']) if 'compression' in parsed.keys() else CompressionConfig()
+    parsed['metrics'] = MetricsConfig(**parsed['metrics']) if 'metrics' in parsed.keys() else MetricsConfig()
     return APIConfig(**parsed)
 
 def get_db_credentials():
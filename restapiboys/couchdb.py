@@ -0,0 +1,424 @@
+"""
+CouchDB operations, written once for the WSGI and the ASGI applications.
+An operation is a generator: it yields the `CouchRequest`s to make and is sent back their responses.
+`restapiboys.database` runs operations with requests, `restapiboys.async_database` with httpx.
+
+Operations are composed with `yield from`, and yielding `Concurrently(operations)`
+runs several of them at once (one after the other with requests).
+Responses have the `status_code`, `headers`, `content` and `json()` of both libraries.
+Streamed requests are answered with a `DocumentStream` of an `_all_docs` response.
+"""
+from typing import *
+from uuid import UUID
+from restapiboys.config import get_api_config, get_db_credentials
+from restapiboys.cache import DocumentCache
+from restapiboys import codec, log
+import json
+import os
+
+T = TypeVar("T")
+
+
+class CouchRequest(NamedTuple):
+    method: str
+    url: str
+    data: Union[dict, list, None] = None
+    headers: Dict[str, Any] = {}
+    params: Dict[str, Any] = {}
+    # Answered with a `DocumentStream`, the documents being read one at a time
+    stream: bool = False
+
+
+class DocumentStream(NamedTuple):
+    # Sequence of the database when CouchDB listed the documents, if requested with `update_seq`
+    update_seq: Optional[str]
+    # Iterator, or async iterator, over the documents
+    docs: Union[Iterator[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]
+
+
+class Concurrently(NamedTuple):
+    # Answered with the results of the operations, in order
+    operations: List["Operation"]
+
+
+Operation = Generator[Union[CouchRequest, Concurrently], Any, T]
+
+
+class RevisionConflictError(Exception):
+    """ Used when writing a document with a revision that is not its current one """
+
+    pass
+
+
+class FindError(Exception):
+    """ Used when CouchDB can't run a Mango query. `status_code` is the one of its response """
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def make_request_with_credentials(
+    method: str,
+    url: str,
+    data: Union[dict, list, None] = None,
+    headers: Optional[Dict[str, Any]] = None,
+    params: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+) -> CouchRequest:
+    return CouchRequest(method, url, data, headers or {}, params or {"include_docs": True}, stream)
+
+
+def log_request(request: CouchRequest) -> None:
+    log.debug("Requesting CouchDB:")
+    log.debug("\t{0} /{1}", request.method, request.url)
+    if request.headers:
+        log.verbatim.debug(
+            log.lazy(lambda: "\t" + "\n\t".join([f"{k}: {v}" for k, v in request.headers.items()]))
+        )
+    if request.data:
+        log.verbatim.debug(log.lazy(lambda: "\t" + json.dumps(request.data)))
+    if request.params:
+        log.debug("\t With params {}", log.lazy(serialize_query_string, request.params))
+
+
+def serialize_query_string(params: Dict[str, str]) -> str:
+    return "?" + "&".join([f"{k}={v}" for k, v in params.items()])
+
+
+def is_ok(res: Any) -> bool:
+    return res.status_code < 400
+
+
+_cache: Optional[DocumentCache] = None
+_cache_pid: Optional[int] = None
+
+
+def get_cache() -> Optional[DocumentCache]:
+    """
+    Gets the `DocumentCache` of this process, `None` if caching is disabled.
+    """
+    global _cache, _cache_pid
+    # Imported here, the database module runs this one's operations
+    from restapiboys.database import CouchClient
+
+    if _cache_pid != os.getpid():
+        config = get_api_config()
+        _cache = (
+            DocumentCache(config.cache, lambda: CouchClient(config.database, get_db_credentials()))
+            if config.cache.enabled
+            else None
+        )
+        _cache_pid = os.getpid()
+    return _cache
+
+
+def get_watching_cache(database: str) -> Optional[DocumentCache]:
+    """
+    Gets the `DocumentCache` of this process if documents of `database` can be cached,
+    that is if caching is enabled and the database's changes are followed.
+    """
+    cache = get_cache()
+    return cache if cache and cache.watch(database) else None
+
+
+def invalidate_cached(database: str, uuid: Union[UUID, str]) -> None:
+    cache = get_cache()
+    if cache:
+        cache.invalidate(database, str(uuid))
+
+
+def create_database(name: str) -> Operation[bool]:
+    res = yield make_request_with_credentials("PUT", name)
+    # Check if response has gone well
+    return res.json().get("ok", False)
+
+
+def create_item(database: str, uuid: UUID, data: Dict[str, Any]) -> Operation[Dict[str, Any]]:
+    res = yield make_request_with_credentials("PUT", f"{database}/{uuid}", data)
+    ok = res.json().get('ok', False)
+    if ok:
+        invalidate_cached(database, uuid)
+        # CouchDB only adds _id and _rev to the document: no need to read it back
+        return {**data, "_id": res.json()["id"], "_rev": res.json()["rev"]}
+    else:
+        log.error('DB: Error while creating item: {}', res.json())
+        return res.json()
+
+
+def create_items(database: str, items: List[Dict[str, Any]]) -> Operation[List[Dict[str, Any]]]:
+    """
+    Creates all of `items` with a single request, each item having its `_id` set.
+    Returns, in order, each created document or the error CouchDB gave for it.
+    """
+    res = yield make_request_with_credentials("POST", f"{database}/_bulk_docs", {"docs": items})
+    results = res.json()
+    if type(results) is not list:
+        log.error("DB: Error while creating items in bulk: {}", results)
+        return [results] * len(items)
+    created = []
+    for data, result in zip(items, results):
+        if "error" in result:
+            log.error("DB: Error while creating item: {}", result)
+            created.append(result)
+        else:
+            created.append({**data, "_id": result["id"], "_rev": result["rev"]})
+    return created
+
+
+def update_item(
+    database: str, uuid: UUID, data: Dict[str, Any], rev: Optional[str] = None
+) -> Operation[Dict[str, Any]]:
+    """
+    Replaces the document `uuid` with `data`.
+    `rev` is the current revision of the document, fetched from the database if not given.
+    Raises `RevisionConflictError` if `rev` is not the current revision.
+    """
+    rev = rev or (yield from get_rev(database, uuid))
+    data = {**data, "_rev": rev}
+    res = yield make_request_with_credentials('PUT', f"{database}/{uuid}", data, params={'rev': rev})
+    ok = res.json().get('ok', False)
+    invalidate_cached(database, uuid)
+    if res.status_code == 409:
+        raise RevisionConflictError(f"Revision {rev} of {uuid} is not the current one")
+    if ok:
+        return {**data, "_id": res.json()["id"], "_rev": res.json()["rev"]}
+    else:
+        log.error('DB: Error while updating item #{0}: {1}', str(uuid), res.json())
+        return res.json()
+
+
+def read_item(
+    database: str, uuid: UUID, fields: Optional[List[str]] = None, cached: bool = True
+) -> Operation[Dict[str, Any]]:
+    """
+    Gets the document `uuid`, with only the given `fields` if any.
+    Whole documents are read from the cache if enabled, unless `cached` is False:
+    use that to get the current revision of a document before writing it.
+    Raises `FindError` if CouchDB can't get the `fields`.
+    """
+    if fields is not None:
+        docs, _ = yield from find_page(database, {"_id": str(uuid)}, [], 1, fields=fields)
+        return docs[0] if docs else {"error": "not_found", "reason": "missing"}
+    cache = get_watching_cache(database) if cached else None
+    if cache:
+        # Before reading, so that a change reported during the read is not cached over
+        generation = cache.get_generation(database)
+        doc = cache.get(database, str(uuid))
+        if doc is not None:
+            return dict(doc)
+    res = yield make_request_with_credentials("GET", f"{database}/{uuid}")
+    doc = res.json()
+    if cache and is_ok(res):
+        cache.set(database, str(uuid), doc, len(res.content), generation)
+    return doc
+
+
+def read_item_raw(database: str, uuid: UUID) -> Operation[Tuple[bytes, Optional[str]]]:
+    """
+    Gets the document `uuid` as CouchDB sent it, without decoding it, and its revision
+    (`None` if the document doesn't exist, the body is then CouchDB's error).
+    Documents read from the cache are encoded again.
+    """
+    cache = get_watching_cache(database)
+    if cache:
+        generation = cache.get_generation(database)
+        doc = cache.get(database, str(uuid))
+        if doc is not None:
+            return codec.dumps(doc), doc["_rev"]
+    res = yield make_request_with_credentials("GET", f"{database}/{uuid}")
+    if not is_ok(res):
+        return res.content, None
+    if cache:
+        cache.set(database, str(uuid), codec.loads(res.content), len(res.content), generation)
+    return res.content, res.headers["ETag"].strip('"')
+
+
+def read_items(database: str, uuids: List[str]) -> Operation[Dict[str, Dict[str, Any]]]:
+    """
+    Gets the documents `uuids` with a single request, by ID.
+    Documents that don't exist are left out.
+    """
+    docs = {}
+    cache = get_watching_cache(database)
+    if cache:
+        generation = cache.get_generation(database)
+        for uuid in uuids:
+            doc = cache.get(database, uuid)
+            if doc is not None:
+                docs[uuid] = dict(doc)
+        uuids = [uuid for uuid in uuids if uuid not in docs]
+        if not uuids:
+            return docs
+    res = yield make_request_with_credentials(
+        "POST", f"{database}/_all_docs", {"keys": uuids}, params={"include_docs": "true"}
+    )
+    rows = [row for row in res.json().get("rows", []) if row.get("doc") and not is_design_document(row)]
+    for row in rows:
+        docs[row["id"]] = row["doc"]
+        if cache:
+            # The size of each document is not known, share the response's
+            cache.set(database, row["id"], row["doc"], len(res.content) // len(rows), generation)
+    return docs
+
+
+def delete_item(database: str, uuid: UUID, rev: Optional[str] = None) -> Operation[bool]:
+    """
+    Deletes the document `uuid`.
+    `rev` is the current revision of the document, fetched from the database if not given.
+    Raises `RevisionConflictError` if `rev` is not the current revision.
+    """
+    rev = rev or (yield from get_rev(database, uuid))
+    res = yield make_request_with_credentials(
+        "DELETE", f"{database}/{uuid}", params={"rev": rev}
+    )
+    ok = res.json().get("ok", False)
+    invalidate_cached(database, uuid)
+    if res.status_code == 409:
+        raise RevisionConflictError(f"Revision {rev} of {uuid} is not the current one")
+    if not ok:
+        log.error("DB: Error while deleting item: {}", res.json())
+    return ok
+
+
+def list_items(database: str) -> Operation[List[Dict[str, Any]]]:
+    res = yield make_request_with_credentials("GET", f"{database}/_all_docs")
+    rows = res.json().get("rows", [])
+    return [row["doc"] for row in rows if not is_design_document(row)]
+
+
+def list_page(
+    database: str, limit: int, startkey: Optional[str] = None
+) -> Operation[Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]]:
+    """
+    Gets at most `limit` documents, starting at the document whose ID is `startkey`.
+    Returns the documents, the ID of the first document of the next page
+    (`None` if this is the last page) and the sequence of the database.
+    Design documents are left out, the page then has fewer documents.
+    """
+    params = {"include_docs": "true", "limit": limit + 1, "update_seq": "true"}
+    if startkey is not None:
+        params["startkey"] = json.dumps(startkey)
+    res = yield make_request_with_credentials("GET", f"{database}/_all_docs", params=params)
+    body = res.json()
+    rows = body.get("rows", [])
+    next_startkey = rows[limit]["id"] if len(rows) > limit else None
+    docs = [row["doc"] for row in rows[:limit] if not is_design_document(row)]
+    return docs, next_startkey, body.get("update_seq")
+
+
+def find_page(
+    database: str,
+    selector: Dict[str, Any],
+    sort: List[Dict[str, str]],
+    limit: int,
+    bookmark: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+) -> Operation[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Gets at most `limit` documents matching the Mango `selector`,
+    with only the given `fields` if any.
+    Returns the documents and the bookmark of the next page
+    (`None` if this is the last page).
+    Raises `FindError` if CouchDB can't run the query.
+    """
+    query = {"selector": selector, "limit": limit}
+    if sort:
+        query["sort"] = sort
+    if fields is not None:
+        query["fields"] = fields
+    if bookmark:
+        query["bookmark"] = bookmark
+    res = yield make_request_with_credentials("POST", f"{database}/_find", query)
+    body = res.json()
+    if "docs" not in body:
+        log.error("DB: Error while finding items: {}", body)
+        raise FindError(f"{body.get('error')}: {body.get('reason')}", res.status_code)
+    docs = body["docs"]
+    return docs, body["bookmark"] if len(docs) == limit else None
+
+
+def stream_items(database: str) -> Operation[DocumentStream]:
+    """
+    Like `list_items`, but the documents are read from CouchDB one at a time
+    instead of loading the whole database in memory.
+    The sequence of the database is read before the documents.
+    """
+    return (
+        yield make_request_with_credentials(
+            "GET", f"{database}/_all_docs", params={"include_docs": "true", "update_seq": "true"}, stream=True
+        )
+    )
+
+
+def parse_all_docs_header(line: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Parses the first line of an `_all_docs` response, which has the values other than the rows:
+    `{"total_rows":2,"offset":0,"update_seq":"...","rows":[`.
+    Returns `None` if `line` is not that line.
+    """
+    line = line.strip()
+    if not line.endswith(b"["):
+        return None
+    return codec.loads(line + b"]}")
+
+
+def parse_all_docs_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Parses a row of an `_all_docs` response.
+    CouchDB writes each row on its own line:
+    ```
+    {"total_rows":2,"offset":0,"rows":[
+    {"id":"...","key":"...","value":{"rev":"..."},"doc":{...}},
+    {"id":"...","key":"...","value":{"rev":"..."},"doc":{...}}
+    ]}
+    ```
+    Returns `None` for the lines that are not rows, and for the rows of design documents.
+    """
+    line = line.strip().rstrip(b",")
+    if not line or line.startswith(b"]") or line.endswith(b"["):
+        return None
+    row = codec.loads(line)
+    return None if is_design_document(row) else row
+
+
+def is_design_document(row: Dict[str, Any]) -> bool:
+    """
+    Whether the `_all_docs` row `row` is a design document (such as the one holding the filters' indexes),
+    which is not an item of the resource
+    """
+    return row.get("id", "").startswith("_design/")
+
+
+def create_index(database: str, definition: Dict[str, Any]) -> Operation[bool]:
+    res = yield make_request_with_credentials("POST", f"{database}/_index", definition)
+    return res.json().get("result") in ("created", "exists")
+
+
+def delete_database(name: str) -> Operation[bool]:
+    res = yield make_request_with_credentials("DELETE", name)
+    return res.json().get("ok", False)
+
+
+def database_exists(name: str) -> Operation[bool]:
+    dbs = (yield make_request_with_credentials("GET", '_all_dbs')).json()
+    return name in dbs
+
+
+def get_rev(name: str, uuid: UUID) -> Operation[Optional[str]]:
+    """
+    Gets the current revision of the document `uuid`, without reading it.
+    Returns `None` if the document doesn't exist.
+    """
+    res = yield make_request_with_credentials("HEAD", f"{name}/{uuid}")
+    if res.status_code != 200:
+        return None
+    return res.headers["ETag"].strip('"')
+
+
+def get_update_seq(name: str) -> Operation[Optional[str]]:
+    """
+    Gets the sequence of the last change made to the database `name`
+    """
+    res = yield make_request_with_credentials("GET", name)
+    return res.json().get("update_seq") if res.status_code == 200 else None
@@ -4,6 +4,15 @@ from restapiboys.http import Request, Response
 import re
 
 ReturnType = TypeVar("Response")
+
+
+class CustomRoute(NamedTuple):
+    method: str
+    route: str
+    # The user's function, called with the request and the route params as kwargs
+    function: Callable[..., ReturnType]
+
+
 def _get_response_decorator(
     request_method: str,
 ) -> Callable[[str], Callable[[Callable[..., ReturnType]], Callable[..., ReturnType]]]:
@@ -37,6 +46,8 @@ def _get_response_decorator(
                 # with the request object and the extracted values from the route params, as kwargs
                 return func(req, **route_params)
 
+            # Used by `restapiboys.routing` to register the route
+            wrapped.custom_route = CustomRoute(request_method, route, func)
             return wrapped
 
         return inner_decorator
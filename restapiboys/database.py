@@ -1,110 +1,153 @@
+"""
+Runs the operations of `restapiboys.couchdb` with requests, for the WSGI application,
+and exposes them as regular functions.
+"""
+from functools import wraps
 from typing import *
-from uuid import UUID
-from restapiboys.config import get_db_credentials
+from restapiboys.config import DatabaseConfig, DatabaseCredentials, get_api_config, get_db_credentials
+from restapiboys import codec, couchdb, metrics
+from restapiboys.couchdb import (
+    Concurrently,
+    CouchRequest,
+    DocumentStream,
+    Operation,
+    RevisionConflictError,
+    get_cache,
+    invalidate_cached,
+    log_request,
+    parse_all_docs_header,
+    parse_all_docs_line,
+)
 from restapiboys import log
+from restapiboys.http import STREAM_CHUNK_SIZE
+from requests.adapters import HTTPAdapter
+import itertools
 import requests
-import json
-
-COUCHDB_PORT = 5984
-
-def create_database(name: str) -> bool:
-    res = make_request_with_credentials("PUT", name)
-    # Check if response has gone well
-    return res.json().get("ok", False)
-
-
-def create_item(database: str, uuid: UUID, data: Dict[str, Any]) -> Dict[str, Any]:
-    res = make_request_with_credentials("PUT", f"{database}/{uuid}", data)
-    ok = res.json().get('ok', False)
-    if ok:
-        return read_item(database, uuid)
-    else:
-        log.error('DB: Error while creating item: {}', res.json())
-        return res.json()
-
-
-def update_item(database: str, uuid: UUID, data: Dict[str, Any]) -> Dict[str, Any]:
-    res = make_request_with_credentials('PUT', f"{database}/{uuid}", data, params={'rev': get_rev(database, uuid)})
-    ok = res.json().get('ok', False)
-    if ok:
-        return read_item(database, uuid)
-    else:
-        log.error('DB: Error while updating item #{0}: {1}', str(uuid), res.json())
-        return res.json()
-
-
-def read_item(database: str, uuid: UUID) -> Dict[str, Any]:
-    res = make_request_with_credentials("GET", f"{database}/{uuid}")
-    return res.json()
-
-
-def delete_item(database: str, uuid: UUID) -> bool:
-    res = make_request_with_credentials(
-        "DELETE", f"{database}/{uuid}", params={"rev": get_rev(database, uuid)}
-    )
-    ok = res.json().get("ok", False)
-    if not ok:
-        log.error("DB: Error while deleting item: {}", res.json())
-    return ok
-
-
-def list_items(database: str) -> List[Dict[str, Any]]:
-    res = make_request_with_credentials("GET", f"{database}/_all_docs")
-    rows = res.json().get("rows", [])
-    items = [row["doc"] for row in rows]
-    return items
-
-
-def delete_database(name: str) -> bool:
-    res = make_request_with_credentials("DELETE", name)
-    return res.json().get("ok", False)
-
-
-def database_exists(name: str) -> bool:
-    dbs = make_request_with_credentials("GET", '_all_dbs').json()
-    return name in dbs
-
-
-def make_request_with_credentials(
-    method: str,
-    url: str,
-    data: Union[dict, list, None] = None,
-    headers: Optional[Dict[str, Any]] = None,
-    params: Optional[Dict[str, Any]] = None,
-) -> requests.Response:
-    headers = headers or {}
-    params = params or {"include_docs": True}
-
-    base_url = f"http://127.0.0.1:{COUCHDB_PORT}"
-    qs = serialize_query_string(params)
-    full_url = base_url + "/" + url
-    creds = get_db_credentials()
-
-    log.debug("Requesting CouchDB:")
-    log.debug("\t{0} {1}", method, full_url)
-    if headers:
-        log.verbatim.debug(
-            "\t" + "\n\t".join([f"{k}: {v}" for k, v in headers.items()])
-        )
-    if data:
-        log.verbatim.debug("\t" + json.dumps(data))
-    if params:
-        log.debug(
-            "\t With params {}", qs
+import os
+
+COUCHDB_PORT = DatabaseConfig().port
+
+
+class CouchClient:
+    """
+    Connection pool to CouchDB, shared by every request handled by a worker.
+    Connections are kept alive between requests, and the credentials are only read once.
+    """
+
+    def __init__(self, config: DatabaseConfig, credentials: DatabaseCredentials):
+        self.base_url = f"http://{config.host}:{config.port}"
+        self.timeout = (config.connect_timeout, config.read_timeout)
+        self.session = requests.Session()
+        self.session.auth = (credentials.username, credentials.password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # The pool must not be shared with forked processes
+        self.pid = os.getpid()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        data: Union[dict, list, None] = None,
+        headers: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        if data is not None:
+            headers = {**(headers or {}), "Content-Type": "application/json"}
+        return self.session.request(
+            method,
+            self.base_url + "/" + url,
+            data=codec.dumps(data) if data is not None else None,
+            headers=headers,
+            params=params,
+            timeout=self.timeout,
+            stream=stream,
         )
 
-    return requests.request(
-        url=full_url,
-        method=method,
-        json=data,
-        headers=headers,
-        params=params,
-        auth=(creds.username, creds.password),
-    )
-
-
-def get_rev(name: str, uuid: UUID) -> str:
-    return read_item(name, uuid)["_rev"]
-
-def serialize_query_string(params: Dict[str, str]) -> str:
-    return "?" + "&".join([f"{k}={v}" for k, v in params.items()])
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[CouchClient] = None
+
+
+def get_client() -> CouchClient:
+    """
+    Gets the `CouchClient` of this process, creating it on the first call.
+    """
+    global _client
+    if _client is None or _client.pid != os.getpid():
+        _client = CouchClient(get_api_config().database, get_db_credentials())
+    return _client
+
+
+def run(operation: Operation) -> Any:
+    """
+    Runs `operation`, making its requests one after the other
+    """
+    response = None
+    try:
+        while True:
+            step = operation.send(response)
+            if type(step) is Concurrently:
+                response = [run(concurrent) for concurrent in step.operations]
+            else:
+                response = send(step)
+    except StopIteration as stop:
+        return stop.value
+
+
+def send(request: CouchRequest) -> Any:
+    log_request(request)
+    with metrics.timed("db"):
+        res = get_client().request(*request)
+    if not request.stream:
+        return res
+    if not res.ok:
+        log.error("DB: Error while listing items: {}", res.json())
+        res.close()
+        return DocumentStream(None, iter([]))
+    lines = res.iter_lines(chunk_size=STREAM_CHUNK_SIZE)
+    first_line = next(lines, b"")
+    header = parse_all_docs_header(first_line)
+    if header is None:
+        lines = itertools.chain([first_line], lines)
+    return DocumentStream((header or {}).get("update_seq"), iter_docs(res, lines))
+
+
+def iter_docs(res: requests.Response, lines: Iterator[bytes]) -> Iterator[Dict[str, Any]]:
+    # Closes the connection (giving it back to the pool) when the iteration ends or is interrupted
+    with res:
+        for line in lines:
+            row = parse_all_docs_line(line)
+            if row is not None:
+                yield row["doc"]
+
+
+def synchronous(operation: Callable[..., Operation]) -> Callable[..., Any]:
+    @wraps(operation)
+    def run_operation(*args, **kwargs):
+        return run(operation(*args, **kwargs))
+
+    return run_operation
+
+
+create_database = synchronous(couchdb.create_database)
+delete_database = synchronous(couchdb.delete_database)
+database_exists = synchronous(couchdb.database_exists)
+create_index = synchronous(couchdb.create_index)
+create_item = synchronous(couchdb.create_item)
+create_items = synchronous(couchdb.create_items)
+update_item = synchronous(couchdb.update_item)
+read_item = synchronous(couchdb.read_item)
+read_item_raw = synchronous(couchdb.read_item_raw)
+read_items = synchronous(couchdb.read_items)
+delete_item = synchronous(couchdb.delete_item)
+list_items = synchronous(couchdb.list_items)
+list_page = synchronous(couchdb.list_page)
+find_page = synchronous(couchdb.find_page)
+stream_items = synchronous(couchdb.stream_items)
+get_rev = synchronous(couchdb.get_rev)
+get_update_seq = synchronous(couchdb.get_update_seq)
@@ -13,4 +13,6 @@ RESOURCE_DIRECTIVES_SYNONYMS = {
         "extends_from",
         "extend_from",
     ],
+    "default_page_size": ["page_size", "per_page", "items_per_page"],
+    "max_page_size": ["maximum_page_size", "max_per_page"],
 }
@@ -1,15 +1,16 @@
-from datetime import datetime
 from enum import Enum
+from types import MappingProxyType
 from restapiboys.directives import RESOURCE_DIRECTIVES_SYNONYMS
 from typing import *
-from restapiboys import log
+from restapiboys import iso8601, log
 import os
 import re
-import slugify
 from restapiboys.http import RequestMethod
+from restapiboys.expressions import Expression
 from restapiboys.fields import (
     ResourceFieldConfig,
     ResourceFieldConfigError,
+    get_custom_types,
     resolve_fields_config,
 )
 from restapiboys.utils import (
@@ -35,6 +36,11 @@ class ResourceConfig(NamedTuple):
         RequestMethod.DELETE,
     ]
     inherits: Optional[str] = None
+    # Number of items per page on GET /<resource>, unless ?limit= is given.
+    # `None` to only paginate when ?limit= or ?cursor= are given: the whole collection is streamed.
+    default_page_size: Optional[int] = None
+    # Maximum value for ?limit=
+    max_page_size: int = 1000
 
 
 def get_endpoints_routes(parent: str = "") -> Iterable[str]:
@@ -55,14 +61,28 @@ def get_endpoints_routes(parent: str = "") -> Iterable[str]:
         yield filetitle
 
 
-def get_endpoints(directory="endpoints") -> Iterable[ResourceConfig]:
+def get_endpoints(
+    directory="endpoints",
+    default_fields: Optional[List[ResourceFieldConfig]] = None,
+    custom_types: Optional[Dict[str, List[ResourceFieldConfig]]] = None,
+) -> Iterable[ResourceConfig]:
+    """
+    Parses every endpoint defined in `directory`.
+    This reads the YAML files from disk: use `get_registry()` instead,
+    which only does it once per worker.
+    """
+    # Load __default__.yaml and types.yaml once for all the endpoints
+    if default_fields is None:
+        default_fields = get_endpoint_defaults_fields() or []
+    if custom_types is None:
+        custom_types = get_custom_types()
     for filename in os.listdir(get_path(directory)):
         # Get the full path
         filepath = get_path(directory, filename)
         # If its a directory, recursively get endpoints
         if os.path.isdir(filepath):
             # Get the sub endpoints
-            subendpoints = get_endpoints(filepath)
+            subendpoints = get_endpoints(filepath, default_fields, custom_types)
             for subendpoint in subendpoints:
                 # Prepend the current directory
                 yield subendpoint._replace(route="/" + directory + subendpoint.route)
@@ -92,7 +112,7 @@ def get_endpoints(directory="endpoints") -> Iterable[ResourceConfig]:
         # Resolve synonyms
         directives = resolve_synonyms_in_dict(RESOURCE_DIRECTIVES_SYNONYMS, directives)
         # Turn it into a ResourceFieldConfig list
-        fields = resolve_fields_config(fields)
+        fields = resolve_fields_config(fields, custom_types)
         # Create a ResourceConfig
         endpoint = ResourceConfig(
             route=f"/{filetitle}",
@@ -102,7 +122,7 @@ def get_endpoints(directory="endpoints") -> Iterable[ResourceConfig]:
             **directives,
         )
         # Inherit values from __default__
-        endpoint = inherit_default_endpoint(endpoint)
+        endpoint = inherit_default_endpoint(endpoint, default_fields)
         # yield it
         yield endpoint
 
@@ -128,14 +148,15 @@ def is_special_endpoint(endpoint):
     return PATTERN.match(endpoint)
 
 
-def inherit_default_endpoint(endpoint: ResourceConfig) -> ResourceConfig:
+def inherit_default_endpoint(
+    endpoint: ResourceConfig, default_fields: Optional[List[ResourceFieldConfig]]
+) -> ResourceConfig:
     """
-    Adds fields from the __default__ endpoint (endpoints/__default__.yaml)
+    Adds fields from the __default__ endpoint (endpoints/__default__.yaml),
+    as returned by `get_endpoint_defaults_fields()`
     """
-    # Get the fields from __default__
-    default_fields = get_endpoint_defaults_fields()
     # If the __default__ file is not found, no defaults are defined, nothing to inherit from
-    if default_fields is None:
+    if not default_fields:
         return endpoint
     # Get all the field names defined by the endpoint
     endpoint_field_names = [field.name for field in endpoint.fields]
@@ -149,102 +170,249 @@ def inherit_default_endpoint(endpoint: ResourceConfig) -> ResourceConfig:
     return ResourceConfig(**{**endpoint._asdict(), "fields": merged_fields})
 
 
+class EndpointRegistry(NamedTuple):
+    """
+    Every endpoint of the API, parsed once and indexed for constant-time lookups.
+    Fields are already resolved (custom types included) and
+    the `__default__` endpoint's fields are already inherited.
+    """
+
+    resources: Tuple[ResourceConfig, ...]
+    by_route: Mapping[str, ResourceConfig]
+    by_identifier: Mapping[str, ResourceConfig]
+    by_python_identifier: Mapping[str, ResourceConfig]
+    # `restapiboys.validation.ResourceValidator`s, by identifier
+    validators: Mapping[str, Any] = MappingProxyType({})
+    # `ResourceComputations`, by identifier
+    computations: Mapping[str, "ResourceComputations"] = MappingProxyType({})
+
+    @staticmethod
+    def build(directory: str = "endpoints") -> "EndpointRegistry":
+        # Imported here, validation needs `ResourceConfig` from this module
+        from restapiboys.validation import ResourceValidator
+
+        resources = tuple(get_endpoints(directory))
+        log.debug("Built endpoint registry with routes {}", log.lazy(lambda: [r.route for r in resources]))
+        return EndpointRegistry(
+            resources=resources,
+            by_route=MappingProxyType({r.route: r for r in resources}),
+            by_identifier=MappingProxyType({r.identifier: r for r in resources}),
+            by_python_identifier=MappingProxyType(
+                {r.python_identifier: r for r in resources}
+            ),
+            validators=MappingProxyType({r.identifier: ResourceValidator(r) for r in resources}),
+            computations=MappingProxyType({r.identifier: ResourceComputations(r) for r in resources}),
+        )
+
+    @property
+    def routes(self) -> List[str]:
+        return list(self.by_route.keys())
+
+
+_registry: Optional[EndpointRegistry] = None
+
+
+def get_registry() -> EndpointRegistry:
+    """
+    Gets the `EndpointRegistry` of this process, building it on the first call.
+    Each gunicorn worker is a separate process, so this happens once per worker.
+    """
+    global _registry
+    if _registry is None:
+        _registry = EndpointRegistry.build()
+    return _registry
+
+
 def get_resource_config_of_route(route: str) -> Optional[ResourceConfig]:
-    resources = get_endpoints()
-    for resource in resources:
-        if resource.route == route:
-            return resource
-    return None
+    return get_registry().by_route.get(route)
 
 
 def get_resource_headers(resource: ResourceConfig) -> dict:
     return {"Access-Control-Allow-Methods": ", ".join(resource.allowed_methods)}
 
 
+class ComputedField(NamedTuple):
+    field: ResourceFieldConfig
+    # `Expression`, or a static value for the ones that aren't strings, like `set: true`
+    value: Any
+    # Fields that trigger the computation when they change, `None` to react to any change ("*")
+    react: Optional[FrozenSet[str]]
+    # Computed fields whose value must be computed before this one
+    dependencies: FrozenSet[str]
+    # At least one of `when` and all of `if` must be true to set the value
+    when: List[Any] = []
+    if_: List[Any] = []
+
+
+class ResourceComputations:
+    """
+    Expressions of a resource's computed fields and computed defaults, compiled once.
+    Computed fields are sorted so that fields are computed after the ones they depend on.
+    Raises `ExpressionError` if an expression is not valid python,
+    and `ResourceFieldConfigError` if computed fields depend on each other in a cycle.
+    """
+
+    __slots__ = ("resource", "defaults", "computed", "datetimes")
+
+    def __init__(self, resource: ResourceConfig):
+        self.resource = resource
+        # (field name, static value or `Expression`) of the fields that have a default value.
+        # Required fields must be already set, computed ones are handled separately
+        self.defaults: List[Tuple[str, Any]] = []
+        computed = []
+        for field in resource.fields:
+            where = f"{resource.identifier}.{field.name}"
+            if field.computed:
+                computed.append(compile_computed_field(field, resource, where))
+            elif field.required:
+                continue
+            elif is_default_value_computed(field):
+                self.defaults.append((field.name, Expression(field.default.replace("= ", "", 1), where)))
+            else:
+                self.defaults.append((field.name, field.default))
+        self.computed = sort_computed_fields(computed, resource)
+        # Names of the fields whose values are stored in UTC
+        self.datetimes = frozenset(f.name for f in resource.fields if f.type == "datetime")
+
+
+def compile_computed_field(
+    field: ResourceFieldConfig, resource: ResourceConfig, where: str
+) -> ComputedField:
+    # TODO: check if "set" key is in "computation"
+    computation = field.computation
+    value = compile_value(computation["set"], where)
+    when = [compile_value(c, where) for c in as_list(computation.get("when", []))]
+    if_ = [compile_value(c, where) for c in as_list(computation.get("if", []))]
+    react = computation.get("react", "*")
+    react = None if react == "*" else frozenset(as_list(react))
+    # Computed fields read by the expressions must be up to date when they are evaluated
+    names = set(react or [])
+    for expression in [value, *when, *if_]:
+        if type(expression) is Expression:
+            names |= expression.names
+    computed_names = {f.name for f in resource.fields if f.computed}
+    # A field can be computed from its own previous value
+    dependencies = frozenset(names & computed_names - {field.name})
+    return ComputedField(field, value, react, dependencies, when, if_)
+
+
+def sort_computed_fields(
+    computed: List[ComputedField], resource: ResourceConfig
+) -> List[ComputedField]:
+    """
+    Sorts computed fields so that each one comes after the computed fields it depends on,
+    in declaration order otherwise
+    """
+    remaining = {c.field.name: c for c in computed}
+    ordered = []
+    while remaining:
+        ready = [
+            c for c in remaining.values() if not (c.dependencies & remaining.keys())
+        ]
+        if not ready:
+            cycle = ", ".join(
+                f"{c.field.name} -> {', '.join(sorted(c.dependencies & remaining.keys()))}"
+                for c in remaining.values()
+            )
+            raise ResourceFieldConfigError(
+                f"Computed fields of {resource.identifier} depend on each other in a cycle: {cycle}"
+            )
+        for c in ready:
+            del remaining[c.field.name]
+        ordered += ready
+    return ordered
+
+
+def compile_value(value: Any, where: str) -> Any:
+    return Expression(value, where) if type(value) is str else value
+
+
+def evaluate_value(value: Any, values: Mapping[str, Any]) -> Any:
+    return value.evaluate(values) if type(value) is Expression else value
+
+
+def as_list(value: Any) -> List[Any]:
+    return value if type(value) is list else [value]
+
+
+def get_computations(resource: ResourceConfig) -> ResourceComputations:
+    """
+    Gets the computations compiled when building the registry,
+    or compiles them for resources that are not part of it
+    """
+    computations = get_registry().computations.get(resource.identifier)
+    if computations is None or computations.resource is not resource:
+        return ResourceComputations(resource)
+    return computations
+
+
 def add_default_fields_to_request_data(
     resource: ResourceConfig, data: Dict[str, Any]
 ) -> Dict[str, Any]:
     data = flatten_dict(data)
-    for field in resource.fields:
-        # Required field must be already set
-        # Computed field are handled by another function
-        if field.required or field.computed:
-            continue
+    for name, default in get_computations(resource).defaults:
         # If the field is already set
-        if field.name in data.keys():
+        if name in data:
             continue
         # If the default value is computed, compute it
-        if is_default_value_computed(field):
-            # Get the code to run
-            code = field.default.replace("= ", "", 1)
-            default = compute_computed_fields(code)
-        # Else the default is a static value, just grab it
-        else:
-            default = field.default
-        # Add to the returned dict
-        data[field.name] = default
+        if type(default) is Expression:
+            default = default.evaluate({})
+        data[name] = default
     return data
 
 
 def add_computed_values_to_request_data(
-    resource: ResourceConfig,
-    new_data: Dict[str, Any],
-    old_data: Dict[str, Any],
-    exec_context_data: Dict[str, Any],
+    resource: ResourceConfig, new_data: Dict[str, Any], old_data: Dict[str, Any]
 ) -> Dict[str, Any]:
-    new_data = flatten_dict(new_data)
-    computed_fields = [f for f in resource.fields if f.computed]
-    for field in computed_fields:
-        if value_needs_recomputation(field, new_data, old_data):
-            # TODO: check if "set" key is in "computation"
-            code = field.computation["set"]
-            computed = compute_computed_fields(code, context=exec_context_data)
-            log.debug("Computed value of field {}: {}", field.name, f"{computed!r}")
-            new_data[field.name] = computed
+    """
+    Computes the fields whose inputs changed between `old_data` (the stored document,
+    empty when creating it) and `new_data`. A computed value that changes triggers
+    the computed fields depending on it, which come after it.
+    Datetimes, given and computed, are converted to UTC.
+    """
+    datetimes = get_computations(resource).datetimes
+    new_data = {
+        name: datetime_to_utc(value) if name in datetimes else value
+        for name, value in flatten_dict(new_data).items()
+    }
+    dirty = {name for name, value in new_data.items() if name not in old_data or old_data[name] != value}
+    log.debug("Values that changed: {}", log.lazy(sorted, dirty))
+    if not dirty:
+        return new_data
+    # Expressions see the document as it will be stored
+    values = {**old_data, **new_data}
+    for computed in get_computations(resource).computed:
+        triggered = (
+            computed.react is None
+            or not computed.react.isdisjoint(dirty)
+            # Computed fields this one reads changed
+            or not computed.dependencies.isdisjoint(dirty)
+        )
+        if not triggered or not conditions_hold(computed, values):
+            continue
+        name = computed.field.name
+        value = evaluate_value(computed.value, values)
+        if name in datetimes:
+            value = datetime_to_utc(value)
+        log.debug("Computed value of field {}: {}", name, log.lazy(repr, value))
+        new_data[name] = values[name] = value
+        if name not in old_data or old_data[name] != value:
+            dirty.add(name)
     return new_data
 
 
-def compute_computed_fields(code: str, context: Optional[Dict[str, Any]] = None) -> Any:
-    # Set the default value of the argumet `context`
-    context = context or {}
-    # Create the locals dict
-    context = {
-        "now": lambda: datetime.now().isoformat(timespec="seconds"),
-        "slugify": slugify.slugify,
-        **context,  # The context passed as an arg overrides "base" context entries
-    }
-    # Run the code and get the returned value
-    exec(f"global __computed__; __computed__ = {code}", globals(), context)
-    # Return the value
-    global __computed__
-    return __computed__
+def datetime_to_utc(value: Any) -> Any:
+    # Fields holding multiple datetimes are stored as lists
+    if type(value) is list:
+        return [iso8601.to_utc(v) for v in value]
+    return iso8601.to_utc(value)
 
 
-def is_default_value_computed(field: ResourceFieldConfig) -> Any:
-    return type(field.default) is str and field.default.startswith("= ")
+def conditions_hold(computed: ComputedField, values: Mapping[str, Any]) -> bool:
+    if computed.when and not any(evaluate_value(c, values) for c in computed.when):
+        return False
+    return all(evaluate_value(c, values) for c in computed.if_)
 
 
-def value_needs_recomputation(
-    field: ResourceFieldConfig, new_data: Dict[str, Any], old_data: Dict[str, Any]
-) -> bool:
-    react_on = field.computation["react"]
-    # Handle react's special value '*'
-    if react_on == "*":
-        return True
-    # Handle one-item shortcut
-    if type(react_on) is not list:
-        react_on = [react_on]
-    # If any of the fields to react on has its value different in the `new_data`
-    # compared to the `old_data`, we need to recompute the field
-    # Get the map of field_name: value changed?
-    changes = {key: new_data.get(key) != old_data.get(key) for key in react_on}
-    log.debug("\tValues that changed:")
-    for key, changed in changes.items():
-        if changed:
-            log.debug(
-                "\t- {}: {} ~> {}",
-                key,
-                f"{new_data.get(key)!r}",
-                f"{old_data.get(key)!r}",
-            )
-    return any(changes.values())
+def is_default_value_computed(field: ResourceFieldConfig) -> Any:
+    return type(field.default) is str and field.default.startswith("= ")
@@ -0,0 +1,98 @@
+"""
+Expansion of relations from the query string:
+```
+GET /homework?expand=subject,notes
+```
+Relational fields hold the IDs of the referenced documents.
+Expanding them replaces the IDs with the documents, fetched with one request
+per referenced database for the whole page instead of one request per ID.
+"""
+from typing import *
+from restapiboys.endpoints import ResourceConfig, get_registry
+from restapiboys.fields import ResourceFieldConfig, get_relation_target
+from restapiboys.http import Request
+
+
+class ExpansionError(ValueError):
+    """ Used when ?expand= is invalid """
+
+    pass
+
+
+class Expansion(NamedTuple):
+    field: ResourceFieldConfig
+    # Resource the field points to
+    resource: ResourceConfig
+
+
+def get_expansions(req: Request, resource: ResourceConfig) -> List[Expansion]:
+    """
+    Gets the relations to expand requested with ?expand=
+    """
+    fields_by_name = {f.name: f for f in resource.fields}
+    expansions = []
+    for name in filter(None, req.query.get("expand", "").split(",")):
+        field = fields_by_name.get(name)
+        if field is None:
+            raise ExpansionError(f"Unknown field {name!r} in ?expand=")
+        target = get_relation_target(field.type)
+        if target is None:
+            raise ExpansionError(f"Can't expand {name!r}: the field is not a relation")
+        expansions.append(Expansion(field, get_related_resource(target)))
+    return expansions
+
+
+def get_related_resource(target: str) -> ResourceConfig:
+    """
+    Gets the resource a relation points to.
+    Relations may use the singular form of the endpoint's name (<note> for /notes/)
+    """
+    registry = get_registry()
+    resource = registry.by_identifier.get(target) or registry.by_identifier.get(target + "s")
+    if resource is None:
+        raise ExpansionError(f"The relation to {target!r} points to an undefined endpoint")
+    return resource
+
+
+def collect_references(
+    items: List[Dict[str, Any]], expansions: List[Expansion]
+) -> Dict[str, List[str]]:
+    """
+    Gets the IDs referenced by `items` in the expanded fields, by database
+    """
+    references: Dict[str, Dict[str, None]] = {}
+    for expansion in expansions:
+        # Dicts keep the order of the IDs and remove duplicates
+        ids = references.setdefault(expansion.resource.identifier, {})
+        for item in items:
+            value = item.get(expansion.field.name)
+            for uuid in value if type(value) is list else [value]:
+                if type(uuid) is str:
+                    ids[uuid] = None
+    return {database: list(ids) for database, ids in references.items() if ids}
+
+
+def inline_references(
+    items: List[Dict[str, Any]],
+    expansions: List[Expansion],
+    documents: Dict[str, Dict[str, Dict[str, Any]]],
+) -> List[Dict[str, Any]]:
+    """
+    Replaces the IDs of the expanded fields with the `documents` they point to,
+    given by database then by ID. IDs of documents that don't exist are kept as-is.
+    """
+    expanded_items = []
+    for item in items:
+        item = dict(item)
+        for expansion in expansions:
+            name = expansion.field.name
+            if name not in item:
+                continue
+            found = documents.get(expansion.resource.identifier, {})
+            value = item[name]
+            if type(value) is list:
+                item[name] = [found.get(uuid, uuid) for uuid in value]
+            elif type(value) is str:
+                item[name] = found.get(value, value)
+        expanded_items.append(item)
+    return expanded_items
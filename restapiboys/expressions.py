@@ -0,0 +1,92 @@
+"""
+Python expressions of the endpoints' configuration: computed fields' `set`
+and computed defaults (`defaults to: = now()`).
+Each expression is compiled once, then evaluated against the document's values
+and a namespace shared by every expression, made of the built-in helpers
+and of the ones defined in the project's functions/*.py.
+Evaluating doesn't write to any shared state, expressions can be evaluated concurrently.
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from importlib.util import module_from_spec, spec_from_file_location
+from types import CodeType, MappingProxyType, ModuleType
+from typing import *
+from restapiboys import log
+from restapiboys.utils import get_path
+import builtins
+import os
+import slugify
+
+BUILTIN_HELPERS = {
+    # In UTC, like the stored datetimes it gets compared to
+    "now": lambda: datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    "slugify": slugify.slugify,
+}
+
+
+class ExpressionError(ValueError):
+    """ Used when an expression of the endpoints' configuration is not valid python """
+
+    pass
+
+
+class Expression:
+    __slots__ = ("source", "code", "names")
+
+    def __init__(self, source: str, where: str = "<expression>"):
+        self.source = source
+        try:
+            self.code: CodeType = compile(source, where, "eval")
+        except SyntaxError as error:
+            raise ExpressionError(f"{where}: {source!r} is not a valid expression: {error.msg}")
+        # Names the expression may read. Includes attribute names, which is fine
+        # to find which fields it depends on
+        self.names = get_code_names(self.code)
+
+    def evaluate(self, values: Mapping[str, Any]) -> Any:
+        """
+        Evaluates the expression, `values` taking precedence over the helpers.
+        `values` is only read.
+        """
+        return eval(self.code, get_namespace(), MappingProxyType(values))
+
+
+def get_code_names(code: CodeType) -> FrozenSet[str]:
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        # Comprehensions and lambdas are compiled to their own code objects
+        if isinstance(constant, CodeType):
+            names |= get_code_names(constant) | set(constant.co_freevars)
+    return frozenset(names)
+
+
+def load_functions(directory: str = "functions") -> Dict[str, Any]:
+    """
+    Imports the python files of `directory` and gets what they define,
+    except for private names and imported modules
+    """
+    functions = {}
+    folder = get_path(directory)
+    if not os.path.isdir(folder):
+        return functions
+    for filename in sorted(os.listdir(folder)):
+        filetitle, extension = os.path.splitext(filename)
+        if extension != ".py" or filetitle.startswith("_"):
+            continue
+        spec = spec_from_file_location(f"functions.{filetitle}", os.path.join(folder, filename))
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+        for name, value in vars(module).items():
+            if not name.startswith("_") and not isinstance(value, ModuleType):
+                functions[name] = value
+    log.debug("Loaded functions {}", log.lazy(lambda: list(functions.keys())))
+    return functions
+
+
+@lru_cache(maxsize=None)
+def get_namespace() -> Dict[str, Any]:
+    """
+    Gets the globals of the expressions, loading functions/*.py on the first call.
+    The project's functions override the built-in helpers.
+    """
+    return {"__builtins__": builtins, **BUILTIN_HELPERS, **load_functions()}
@@ -1,5 +1,6 @@
 from typing import *
 from restapiboys import log
+import os
 import re
 from restapiboys.utils import (
     get_path,
@@ -20,6 +21,7 @@ CONFIG_KEYS_SYNONYMS = {
     "default": ["defaults_to", "defaults", "in`itial_value"],
     "allow_empty": ["can_be_empty", "empty_allowed", "empty"],
     "read_only": ["read-only", "readonly"],
+    "filterable": ["can_filter", "can_be_filtered", "indexed"],
 }
 
 
@@ -57,6 +59,7 @@ class ResourceFieldConfig(NamedTuple):
         bool
     ] = None  # only positive if True, only negative if False, either if True
     multiple: bool = False  # Can be defined by the shortcut typename[] on the `type` property.
+    filterable: bool = False  # Can be used in ?field=value filters and ?sort=. The field gets indexed.
 
 
 def resolve_synonyms(field_config: Dict[str, Any]) -> Dict[str, Any]:
@@ -64,7 +67,8 @@ def resolve_synonyms(field_config: Dict[str, Any]) -> Dict[str, Any]:
     Resolves synonyms in field configuration keys, as defined
     by `CONFIG_KEYS_SYNONYMS`.
     """
-    return resolve_synonyms_in_dict(CONFIG_KEYS_SYNONYMS, field_config)
+    # Validation messages are not config keys
+    return resolve_synonyms_in_dict(CONFIG_KEYS_SYNONYMS, field_config, keep=["validation"])
 
 
 def resolve_field_name_shortcuts(field: ResourceFieldConfig) -> ResourceFieldConfig:
@@ -113,14 +117,15 @@ def resolve_field_name_shortcuts(field: ResourceFieldConfig) -> ResourceFieldCon
 
 
 def resolve_fields_config(
-    fields_config: Dict[str, Dict[str, Any]]
+    fields_config: Dict[str, Dict[str, Any]],
+    custom_types: Optional[Dict[str, List[ResourceFieldConfig]]] = None,
 ) -> List[ResourceFieldConfig]:
     resolved_fields = []
     for field_name, field_config in fields_config.items():
         orig_field_config = field_config
         log.debug("Resolving field {}", field_name)
-        # First replace whitespace from keys with underscores
-        field_config = replace_whitespace_in_keys(field_config)
+        # First replace whitespace from keys with underscores (except in validation messages)
+        field_config = replace_whitespace_in_keys(field_config, keep=["validation"])
         # Then resolve synonyms
         field_config = resolve_synonyms(field_config)
         log.debug(
@@ -146,7 +151,7 @@ def resolve_fields_config(
         # Append to the fields list
         resolved_fields.append(field)
     # Then resolve custom types
-    fields = resolve_custom_types(resolved_fields)
+    fields = resolve_custom_types(resolved_fields, custom_types)
     #
     return fields
 
@@ -184,20 +189,35 @@ NATIVE_FIELD_TYPES = [
 
 NATIVE_TYPES_MAPPING = {int: "integer", str: "string", float: "number", bool: "boolean"}
 
+# <name> points to the objects of the endpoint /name/, <name>[] to many of them
+RELATIONAL_TYPE_DECLARATION_PATTERN = re.compile(r"^<([^>]+)>(\[\])?$")
+
+
+def get_relation_target(field_type: str) -> Optional[str]:
+    """
+    Gets the name of the endpoint a relational type points to,
+    `None` if `field_type` is not relational.
+    """
+    match = RELATIONAL_TYPE_DECLARATION_PATTERN.match(field_type)
+    return match.group(1) if match else None
+
+
 def get_custom_types() -> Dict[str, List[ResourceFieldConfig]]:
     """
     Gets all custom types and resolve their fields' config
     """
     types = {}
-    types_configs: Dict[str, Dict[str, Dict[str, Any]]] = yaml.load_file(
-        get_path("types.yaml")
-    )
+    filepath = get_path("types.yaml")
+    # No types.yaml means no custom types
+    if not os.path.isfile(filepath):
+        return types
+    types_configs: Dict[str, Dict[str, Dict[str, Any]]] = yaml.load_file(filepath)
     for name, fields in types_configs.items():
         resolved_fields = []
         for field_name, field_config in fields.items():
             # print(f"Resolving type field {field_name!r}")
-            # First replace whitespace from keys with underscores
-            field_config = replace_whitespace_in_keys(field_config)
+            # First replace whitespace from keys with underscores (except in validation messages)
+            field_config = replace_whitespace_in_keys(field_config, keep=["validation"])
             # Then resolve synonyms
             field_config = resolve_synonyms(field_config)
             # Then convert the dict into a ResourceFieldConfig
@@ -221,6 +241,7 @@ def get_custom_types() -> Dict[str, List[ResourceFieldConfig]]:
 
 def resolve_custom_types(
     fields: List[ResourceFieldConfig],
+    custom_types: Optional[Dict[str, List[ResourceFieldConfig]]] = None,
 ) -> List[ResourceFieldConfig]:
     """
     Replaces a custom type by a native one
@@ -246,6 +267,9 @@ def resolve_custom_types(
     my_object.end:
       is: date
     ```
+
+    `custom_types` are the types returned by `get_custom_types()`.
+    They are loaded from `types.yaml` if not given.
     """
     ARRAYED_TYPE_MARKER_PATTERN = re.compile(r"^(.+)\[\]$")
     resolved_fields = []
@@ -262,11 +286,7 @@ def resolve_custom_types(
             continue
 
         # Is a relational type
-        RELATIONAL_TYPE_DECLARATION_PATTERN = re.compile(r"^<([^>]+)>(\[\])?$")
-        if RELATIONAL_TYPE_DECLARATION_PATTERN.match(field.type):
-            referenced_endpoint = RELATIONAL_TYPE_DECLARATION_PATTERN.search(
-                field.type
-            ).groups()
+        if get_relation_target(field.type):
             # if '/' + referenced_endpoint not in get_endpoints_routes():
             #     raise ResourceFieldConfigError(f"{field.name!r} defines a relation with an undefined endpoint ({referenced_endpoint!r}). Create the endpoint in `endpoints/{referenced_endpoint}.yaml`")
             resolved_fields.append(field)
@@ -274,7 +294,8 @@ def resolve_custom_types(
         
 
         # Is an unknown type
-        custom_types = get_custom_types()
+        if custom_types is None:
+            custom_types = get_custom_types()
         if field.type not in custom_types.keys():
             raise ResourceFieldConfigError(
                 f"{field.name!r}'s declared type ({field.type!r}) is not known. Please define it in `types.yaml`"
@@ -297,6 +318,8 @@ def resolve_custom_types(
             )
             # The previous statement also overrides the field.type, so we need to set it to the custom field's "_".type
             field = field._replace(type=type_config[0].type)
+            # The field's validation rules add up to the type's
+            field = field._replace(validation={**type_config[0].validation, **field.validation})
             # Add to list
             resolved_fields.append(field)
         # Multi-field type
@@ -0,0 +1,192 @@
+"""
+Filtering, sorting and projection of collections from the query string, compiled to CouchDB Mango queries:
+```
+GET /homework?type=test&due_at__gte=2026-01-01&sort=-due_at&fields=title,due_at
+```
+Only fields declared `filterable` can be filtered or sorted on.
+`restapiboys manage-db` creates an index for each of them.
+Datetimes are compared in UTC, a date standing for the start of its day.
+Dates and datetimes without an offset (`2026-01-01`, `2026-01-01T08:00:00`) are in UTC.
+Fields of multi-field custom types are stored flattened (`dates.start`): the dots of their
+names are escaped in Mango queries and indexes, where dots separate nested objects' keys.
+"""
+from typing import *
+from restapiboys.endpoints import ResourceConfig
+from restapiboys.fields import ResourceFieldConfig
+from restapiboys.http import Request
+from restapiboys.validation import validate_type
+from restapiboys import iso8601
+
+# Query parameters that are not filters
+RESERVED_QUERY_PARAMETERS = {"limit", "cursor", "sort", "fields", "expand"}
+
+# Always included when ?fields= is used
+INTERNAL_FIELDS = ["_id", "_rev"]
+
+# Suffixes of filters (field__operator=value) to Mango operators
+FILTER_OPERATORS = {
+    "eq": "$eq",
+    "ne": "$ne",
+    "gt": "$gt",
+    "gte": "$gte",
+    "lt": "$lt",
+    "lte": "$lte",
+    "in": "$in",
+}
+
+# Name of the design document holding the indexes created by `manage-db`
+INDEXES_DESIGN_DOCUMENT = "restapiboys-filters"
+
+
+class FilterError(ValueError):
+    """ Used when the filters of the query string are invalid """
+
+    pass
+
+
+class FindQuery(NamedTuple):
+    selector: Dict[str, Any]
+    sort: List[Dict[str, str]] = []
+    # `None` to get whole documents
+    fields: Optional[List[str]] = None
+
+
+def get_find_query(req: Request, resource: ResourceConfig) -> Optional[FindQuery]:
+    """
+    Compiles the filters, `sort` and `fields` of the query string to a Mango query.
+    Returns `None` if the query string has none of them.
+    """
+    fields_by_name = {f.name: f for f in resource.fields}
+    selector: Dict[str, Any] = {}
+    for key, value in req.query.items():
+        if key in RESERVED_QUERY_PARAMETERS:
+            continue
+        name, _, operator = key.partition("__")
+        field = get_filterable_field(fields_by_name, name)
+        if operator and operator not in FILTER_OPERATORS:
+            raise FilterError(
+                f"Unknown filter operator {operator!r}. Use one of {', '.join(FILTER_OPERATORS)}"
+            )
+        if operator == "in":
+            condition = [convert_filter_value(field, v) for v in value.split(",")]
+        else:
+            condition = convert_filter_value(field, value)
+        condition = {FILTER_OPERATORS[operator or "eq"]: condition}
+        # Filters on arrays match if any of the array's elements does
+        if field.multiple:
+            condition = {"$elemMatch": condition}
+        selector.setdefault(escape_field_name(name), {}).update(condition)
+
+    sort = []
+    for name in filter(None, req.query.get("sort", "").split(",")):
+        direction = "desc" if name.startswith("-") else "asc"
+        name = name.lstrip("-")
+        get_filterable_field(fields_by_name, name)
+        sort.append({escape_field_name(name): direction})
+        # CouchDB can only use an index to sort if the field is in the selector
+        selector.setdefault(escape_field_name(name), {"$gt": None})
+
+    fields = get_projection(req, resource)
+    if not selector and fields is None:
+        return None
+    # Projection without filters: select every document, using the primary index
+    if not selector:
+        selector = {"_id": {"$gt": None}}
+    return FindQuery(selector=selector, sort=sort, fields=fields)
+
+
+def get_projection(req: Request, resource: ResourceConfig) -> Optional[List[str]]:
+    """
+    Gets the fields requested with ?fields=, `None` if the parameter is not given.
+    Fields of custom types can be requested as a whole (`dates`) or one by one (`dates.start`)
+    """
+    if "fields" not in req.query:
+        return None
+    # Names that can be requested, and the fields they stand for
+    names: Dict[str, List[str]] = {}
+    for field in resource.fields:
+        names.setdefault(field.name, []).append(field.name)
+        # Parents of dotted subfields of multi-field custom types
+        parts = field.name.split(".")
+        for i in range(1, len(parts)):
+            names.setdefault(".".join(parts[:i]), []).append(field.name)
+    requested = [name for name in req.query["fields"].split(",") if name]
+    unknown = [name for name in requested if name not in names]
+    if unknown:
+        raise FilterError(f"Unknown fields {', '.join(map(repr, unknown))} in ?fields=")
+    fields = list(INTERNAL_FIELDS)
+    for name in requested:
+        for field_name in names[name]:
+            if escape_field_name(field_name) not in fields:
+                fields.append(escape_field_name(field_name))
+    return fields
+
+
+def escape_field_name(name: str) -> str:
+    """
+    Escapes the dots of a field's name for Mango:
+    `dates.start` is a field of the stored document, not `start` in its `dates` object
+    """
+    return name.replace(".", "\\.")
+
+
+def get_filterable_field(
+    fields_by_name: Dict[str, ResourceFieldConfig], name: str
+) -> ResourceFieldConfig:
+    field = fields_by_name.get(name)
+    if field is None:
+        raise FilterError(f"Unknown field {name!r}")
+    if not field.filterable:
+        raise FilterError(
+            f"Can't filter or sort on {name!r}: the field is not declared filterable"
+        )
+    return field
+
+
+def convert_filter_value(field: ResourceFieldConfig, value: str) -> Any:
+    """
+    Converts a value from the query string to the field's type
+    """
+    try:
+        if field.type == "integer":
+            converted = int(value)
+        elif field.type == "number":
+            converted = float(value)
+        elif field.type == "boolean" and value in ("true", "false"):
+            converted = value == "true"
+        else:
+            converted = value
+    except ValueError:
+        converted = value
+    if field.type == "datetime":
+        return convert_datetime_bound(field, value)
+    if not validate_type(converted, field.type):
+        raise FilterError(f"{value!r} is not a valid value for {field.name!r} ({field.type})")
+    return converted
+
+
+def convert_datetime_bound(field: ResourceFieldConfig, value: str) -> str:
+    """
+    Converts a date or datetime to UTC, the one of stored datetimes, where their strings sort chronologically.
+    Values without an offset are in UTC.
+    """
+    for bound in (value, value + "Z"):
+        if validate_type(bound, "datetime") or validate_type(bound, "date"):
+            return iso8601.to_utc(bound)
+    raise FilterError(f"{value!r} is not a valid value for {field.name!r} ({field.type})")
+
+
+def get_index_definitions(resource: ResourceConfig) -> List[Dict[str, Any]]:
+    """
+    Gets the definitions of the `_index`es to create for the filterable fields of `resource`
+    """
+    return [
+        {
+            "index": {"fields": [escape_field_name(field.name)]},
+            "name": f"{field.name}-index",
+            "ddoc": INDEXES_DESIGN_DOCUMENT,
+            "type": "json",
+        }
+        for field in resource.fields
+        if field.filterable
+    ]
@@ -1,8 +1,9 @@
 from enum import Enum
+from functools import lru_cache
 from re import sub
 from typing import *
-from restapiboys import log
-import simplejson as json
+from restapiboys import codec, log, metrics
+import io
 import urllib
 import httpagentparser
 
@@ -92,33 +93,154 @@ class UserAgent(NamedTuple):
     os: NameVersion
 
 
-class Request(NamedTuple):
-    route: str
-    is_ssl: bool
-    method: RequestMethod
-    query: Dict[str, str]
-    scheme: str
-    host: str
-    gunicorn_env: Dict[str, Any]
-    client: UserAgent
-    body: str
+# Marks the attributes of a request that are not parsed yet
+_NOT_PARSED = object()
+
+
+class PayloadTooLargeError(ValueError):
+    """ Used when the body of a request is larger than the configured maximum """
+
+    pass
+
+
+class Request:
+    """
+    `query` and `client` are parsed from `gunicorn_env` on first access, if not given.
+    """
+
+    __slots__ = (
+        "route",
+        "is_ssl",
+        "method",
+        "scheme",
+        "host",
+        "gunicorn_env",
+        "body",
+        "_query",
+        "_client",
+        "_json",
+    )
+
+    def __init__(
+        self,
+        route: str,
+        is_ssl: bool,
+        method: RequestMethod,
+        scheme: str,
+        host: str,
+        gunicorn_env: Dict[str, Any],
+        body: Union[bytes, str],
+        query: Dict[str, str] = _NOT_PARSED,
+        client: UserAgent = _NOT_PARSED,
+    ):
+        self.route = route
+        self.is_ssl = is_ssl
+        self.method = method
+        self.scheme = scheme
+        self.host = host
+        self.gunicorn_env = gunicorn_env
+        self.body = body
+        self._query = query
+        self._client = client
+        self._json = _NOT_PARSED
+
+    @property
+    def query(self) -> Dict[str, str]:
+        if self._query is _NOT_PARSED:
+            self._query = parse_query_string(self.gunicorn_env.get("QUERY_STRING", ""))
+        return self._query
+
+    @property
+    def client(self) -> UserAgent:
+        if self._client is _NOT_PARSED:
+            self._client = parse_useragent(self.gunicorn_env.get("HTTP_USER_AGENT", ""))
+        return self._client
+
+    @property
+    def json(self) -> Any:
+        """
+        The body parsed as JSON, `None` if the body is empty.
+        Parsed on first access only, raises `codec.DecodeError` if it is malformed.
+        """
+        if self._json is _NOT_PARSED:
+            with metrics.timed("parse"):
+                self._json = codec.loads(self.body) if self.body else None
+        return self._json
 
     @staticmethod
-    def from_gunicorn_environ(environ: Dict[str, Any]) -> "Request":
-        body_bytes = environ["wsgi.input"].read()
+    def from_gunicorn_environ(
+        environ: Dict[str, Any], max_body_size: Optional[int] = None
+    ) -> "Request":
         route = remove_route_trailing_slash(environ["PATH_INFO"])
         return Request(
             route=route,
             is_ssl=environ["wsgi.url_scheme"] == "https",
             method=environ["REQUEST_METHOD"],
-            query=parse_query_string(environ["QUERY_STRING"]),
             scheme=environ["wsgi.url_scheme"],
             host=environ["HTTP_HOST"],
-            client=parse_useragent(environ["HTTP_USER_AGENT"]),
             gunicorn_env=environ,
-            body=body_bytes.decode("utf-8"),  # XXX: Assumed utf8
+            body=read_body(environ, max_body_size),
         )
 
+    @staticmethod
+    def from_asgi_scope(scope: Dict[str, Any], body: bytes) -> "Request":
+        return Request.from_gunicorn_environ(asgi_scope_to_environ(scope, body))
+
+    def header(self, name: str) -> Optional[str]:
+        """
+        Gets the value of the request header `name`, `None` if it was not sent
+        """
+        return self.gunicorn_env.get("HTTP_" + name.upper().replace("-", "_"))
+
+
+def read_body(environ: Dict[str, Any], max_size: Optional[int] = None) -> bytes:
+    """
+    Reads the body of a request, without reading more than `max_size` bytes.
+    Raises `PayloadTooLargeError` if the body is larger.
+    """
+    try:
+        length = int(environ.get("CONTENT_LENGTH") or -1)
+    except ValueError:
+        length = -1
+    if max_size is not None and length > max_size:
+        raise PayloadTooLargeError(f"The request body must not be larger than {max_size} bytes")
+    if length >= 0:
+        return environ["wsgi.input"].read(length)
+    # Unknown length (chunked transfer encoding): read one byte past the maximum to detect larger bodies
+    if max_size is None:
+        return environ["wsgi.input"].read()
+    body = environ["wsgi.input"].read(max_size + 1)
+    if len(body) > max_size:
+        raise PayloadTooLargeError(f"The request body must not be larger than {max_size} bytes")
+    return body
+
+
+def asgi_scope_to_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """
+    Builds the WSGI environ equivalent to an ASGI HTTP connection scope,
+    so that requests are handled the same way by both applications.
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "HTTP_HOST": f"{server_name}:{server_port}",
+        "HTTP_USER_AGENT": "",
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = value.decode("latin-1")
+    # The body has already been read whole
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
 
 def remove_route_trailing_slash(route: str) -> str:
     if route == "/":
@@ -128,6 +250,8 @@ def remove_route_trailing_slash(route: str) -> str:
     return route
 
 
+# The same few user agents make most of the requests
+@lru_cache(maxsize=1024)
 def parse_useragent(useragent: str) -> UserAgent:
     parsed = httpagentparser.detect(useragent, fill_none=True)
     return UserAgent(
@@ -139,21 +263,33 @@ def parse_query_string(query_string) -> Dict[str, str]:
     return {k: v[0] for k, v in dict(urllib.parse.parse_qs(query_string)).items()}
 
 
+# Approximate size of the chunks of streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+Stream = Union[Iterator[bytes], AsyncIterator[bytes]]
+
+
 class Response:
     def __init__(
         self,
         status: StatusCode,
         headers: Optional[Dict[str, Any]] = None,
-        body: Union[list, dict, str, bytes] = b"",
+        body: Union[list, dict, str, bytes, Stream] = b"",
+        etag: Optional[str] = None,
     ):
         # Default value for headers
         headers = headers or {}
         # Get the HTTP Status
         self.status = status.value
+        # Version of the resource, without quotes
+        self.etag = etag
         # Store the original body's type
         self.orig_body_type = type(body)
+        # Streamed bodies are sent chunk by chunk as they are produced,
+        # without a Content-Length (the server uses chunked transfer encoding)
+        self.is_streamed = isinstance(body, (Iterator, AsyncIterator))
         # Get the bytes-encoded body
-        self.body = self.encode_body(body)
+        self.body = body if self.is_streamed else self.encode_body(body)
         # Get the headers, with automatic headers defined as a base
         self.headers = list(
             self.stringify_header_values(
@@ -170,16 +306,12 @@ class Response:
         # Body is already bytes
         if type(body) is bytes:
             return body
-        # Body is not just a string
+        # Body is just a string
         if type(body) is str:
-            stringified = body
-        else:
-            # Serialize to JSON
-            stringified = json.dumps(body)
-        # Encode w/ UTF-8
-        encoded = bytes(stringified, "utf-8")
-        # Return encoded data
-        return encoded
+            return bytes(body, "utf-8")
+        # Serialize to UTF-8 encoded JSON
+        with metrics.timed("serialize"):
+            return codec.dumps(body)
 
     @staticmethod
     def stringify_header_values(headers: Dict[str, Any]) -> Dict[str, str]:
@@ -192,8 +324,12 @@ class Response:
         """
         Auto headers like Content-Type or Content-Length
         """
-        # TODO #2: Include Etags
         headers = {}
+        if self.etag is not None:
+            headers["ETag"] = f'"{self.etag}"'
+        # Not Modified responses have no body to describe
+        if self.status == StatusCode.NOT_MODIFIED.value:
+            return headers
         # Get Content-Type
         if self.orig_body_type is bytes:
             headers["Content-Type"] = "application/octet-stream"
@@ -203,10 +339,52 @@ class Response:
             headers["Content-Type"] = "application/json"
 
         # Get Content-Length
-        headers["Content-Length"] = len(self.body)
+        if not self.is_streamed:
+            headers["Content-Length"] = len(self.body)
 
         return headers
 
     def is_error(self) -> bool:
         status_no = int(self.status[:3])
         return status_no >= 400
+
+
+def stream_json_array(items: Union[Iterable[Any], AsyncIterable[Any]]) -> Stream:
+    """
+    Encodes `items` as a JSON array, one chunk of about `STREAM_CHUNK_SIZE` bytes at a time.
+    Asynchronous iterables are encoded asynchronously.
+    """
+    if isinstance(items, AsyncIterable):
+        return astream_json_array(items)
+    return iter_json_array(items)
+
+
+def iter_json_array(items: Iterable[Any]) -> Iterator[bytes]:
+    buffer = bytearray(b"[")
+    for index, item in enumerate(items):
+        if index:
+            buffer += b","
+        buffer += codec.dumps(item)
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+async def astream_json_array(items: AsyncIterable[Any]) -> AsyncIterator[bytes]:
+    """
+    Asynchronous version of `stream_json_array`
+    """
+    buffer = bytearray(b"[")
+    first = True
+    async for item in items:
+        if not first:
+            buffer += b","
+        first = False
+        buffer += codec.dumps(item)
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
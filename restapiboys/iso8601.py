@@ -0,0 +1,96 @@
+"""
+Checks that strings are ISO-8601 dates, times and datetimes, in the formats
+accepted by `date`, `time` and `datetime` fields. The offset is required:
+
+    date        2026-03-01Z, 2026-03-01+01:00
+    time        08:00:00Z, 08:00:00-05:30, 08:00:00+01
+    datetime    2026-03-01T08:00:00+01:00
+
+Nothing is parsed into a datetime object: the ranges of months, hours, minutes,
+seconds and offsets are part of the patterns, only days past the 28th are converted to check
+them against their month.
+
+Datetimes are stored and compared in UTC (see `to_utc`): with different offsets,
+their strings would not sort chronologically.
+"""
+from datetime import datetime, timedelta
+from typing import *
+import re
+
+DATE = r"(?P<year>[0-9]{4})-(?P<month>0[1-9]|1[0-2])-(?P<day>0[1-9]|[12][0-9]|3[01])"
+# 24:00:00 is the midnight ending the day
+TIME = r"(?:(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]|24:00:00)"
+OFFSET = r"(?:Z|[+-](?:[01][0-9]|2[0-3])(?::[0-5][0-9])?)"
+
+DATE_RE = re.compile(DATE + OFFSET)
+TIME_RE = re.compile(TIME + OFFSET)
+DATETIME_RE = re.compile(DATE + "[Tt]" + TIME + OFFSET)
+
+DAYS_IN_MONTH = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def is_leap_year(year: int) -> bool:
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def is_valid_day(match: Match) -> bool:
+    day = match["day"]
+    # Every month has at least 28 days. Two digits compare like the numbers they make
+    if day < "29":
+        return True
+    month = int(match["month"])
+    if month == 2:
+        return day == "29" and is_leap_year(int(match["year"]))
+    return int(day) <= DAYS_IN_MONTH[month]
+
+
+def is_date(value: Any) -> bool:
+    if type(value) is not str:
+        return False
+    match = DATE_RE.fullmatch(value)
+    return match is not None and match["year"] != "0000" and is_valid_day(match)
+
+
+def is_time(value: Any) -> bool:
+    return type(value) is str and TIME_RE.fullmatch(value) is not None
+
+
+def is_datetime(value: Any) -> bool:
+    if type(value) is not str:
+        return False
+    match = DATETIME_RE.fullmatch(value)
+    return match is not None and match["year"] != "0000" and is_valid_day(match)
+
+
+def to_utc(value: Any) -> Any:
+    """
+    Converts a datetime, or a date standing for the start of its day, to UTC:
+    `2026-03-01T08:00:00+01:00` and `2026-03-01+01:00` become `2026-03-01T07:00:00Z` and `2026-02-28T23:00:00Z`.
+    Other values, and the ones out of the range of python's datetimes, are returned as is.
+    """
+    if is_datetime(value):
+        hours, minutes, seconds = int(value[11:13]), int(value[14:16]), int(value[17:19])
+        offset = value[19:]
+    elif is_date(value):
+        hours = minutes = seconds = 0
+        offset = value[10:]
+    else:
+        return value
+    try:
+        utc = datetime(int(value[:4]), int(value[5:7]), int(value[8:10])) + timedelta(
+            hours=hours, minutes=minutes, seconds=seconds
+        )
+        if offset != "Z":
+            sign = -1 if offset[0] == "-" else 1
+            utc -= sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6] or 0))
+    except OverflowError:
+        return value
+    return utc.isoformat() + "Z"
+
+
+# Field types, and the function checking their values
+CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "date": is_date,
+    "time": is_time,
+    "datetime": is_datetime,
+}
@@ -1,9 +1,20 @@
+"""
+Logging, checked against the level before anything gets formatted.
+The level is read once from the `log-level` environment variable (or set with `set_level`),
+and the output is either colored text or JSON lines, chosen with `log-format` ("pretty" or "json").
+Lines are written to stdout by a background thread, so that workers never wait on it.
+"""
 from collections import namedtuple
 from datetime import datetime
 from os import environ
 from typing import *
-from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL, getLogger
+from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL, Formatter, Handler, LogRecord, getLevelName, getLogger
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from restapiboys import codec
+import atexit
 import colorama
+import os
 from termcolor import colored
 
 colorama.init()
@@ -17,6 +28,15 @@ class LogLevelStyling(NamedTuple):
 
 SUCCESS = 666
 
+LEVELS = {
+    "DEBUG": DEBUG,
+    "INFO": INFO,
+    "WARN": WARNING,
+    "WARNING": WARNING,
+    "ERROR": ERROR,
+    "CRITICAL": CRITICAL,
+}
+
 LOG_FORMAT_STYLES: Dict[int, Dict[str, Callable[[str], str]]] = {
     DEBUG: {
         "prepend": lambda o: "  ",
@@ -51,7 +71,58 @@ LOG_FORMAT_STYLES: Dict[int, Dict[str, Callable[[str], str]]] = {
 }
 
 Colorizers = namedtuple("Colorizers", ["base", "emphasis", "prepend"])
-logger = getLogger()
+logger = getLogger("restapiboys")
+logger.propagate = False
+
+
+def parse_level(name: str) -> int:
+    if name.isdigit():
+        return int(name)
+    return LEVELS.get(name.upper(), INFO)
+
+
+level = parse_level(environ.get("log-level", "INFO"))
+output_format = environ.get("log-format", "pretty")
+
+# The background thread writing the lines, and the process it was started in:
+# threads don't survive forks, each worker starts its own.
+listener: Optional[QueueListener] = None
+listener_pid: Optional[int] = None
+
+
+class lazy:
+    """
+    Argument computed only if the line gets logged:
+    log.debug("Payload: {}", log.lazy(json.dumps, data))
+    """
+
+    __slots__ = ("function", "args")
+
+    def __init__(self, function: Callable[..., Any], *args: Any):
+        self.function = function
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.function(*self.args))
+
+    def __format__(self, spec: str) -> str:
+        return format(self.function(*self.args), spec)
+
+
+def set_level(name: Union[str, int]) -> None:
+    global level
+    level = name if isinstance(name, int) else parse_level(name)
+
+
+def set_format(name: str) -> None:
+    global output_format
+    output_format = name
+    if listener is not None:
+        flush()
+
+
+def is_enabled(levelno: int) -> bool:
+    return levelno >= level
 
 
 def get_log_formatter(
@@ -61,73 +132,117 @@ def get_log_formatter(
 
     def formatter(text: str, *emphasized, **emphasized_kwargs) -> str:
         text = colorize.base(text)
-        now = datetime.now().strftime("%H:%M:%S")
         if not verbatim:
             emphasized = [
-                colorize.emphasis(el) + colorize.base("").replace("\033[0m", "")
+                colorize.emphasis(str(el)) + colorize.base("").replace("\033[0m", "")
                 for el in emphasized
             ]
             emphasized_kwargs = {
-                k: colorize.emphasis(v) + colorize.base("").replace("\033[0m", "")
+                k: colorize.emphasis(str(v)) + colorize.base("").replace("\033[0m", "")
                 for k, v in emphasized_kwargs.items()
             }
             text = text.format(*emphasized, **emphasized_kwargs)
-        return colored(now, attrs=["dark"]) + "  " + colorize.prepend(text) + text
+        return colorize.prepend(text) + text
 
     return formatter
 
 
+class PrettyFormatter(Formatter):
+    def format(self, record: LogRecord) -> str:
+        now = datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+        return colored(now, attrs=["dark"]) + "  " + record.getMessage()
+
+
+class JSONLinesFormatter(Formatter):
+    def format(self, record: LogRecord) -> str:
+        return codec.dumps(
+            {
+                "time": datetime.fromtimestamp(record.created).astimezone().isoformat(),
+                "level": "SUCCESS" if record.style == SUCCESS else getLevelName(record.levelno),
+                "pid": record.process,
+                "message": record.getMessage(),
+            }
+        ).decode("utf-8")
+
+
+class StdoutHandler(Handler):
+    """
+    Prints to the current sys.stdout, which may be replaced after the handler is created
+    """
+
+    def emit(self, record: LogRecord) -> None:
+        print(self.format(record), flush=True)
+
+
+def start() -> None:
+    """
+    Starts the background thread of this process
+    """
+    global listener, listener_pid
+    handler = StdoutHandler()
+    handler.setFormatter(JSONLinesFormatter() if output_format == "json" else PrettyFormatter())
+    # A new queue too: one inherited from the parent process could have been locked while forking
+    queue = Queue()
+    logger.handlers = [QueueHandler(queue)]
+    listener = QueueListener(queue, handler)
+    listener.start()
+    if listener_pid is None:
+        atexit.register(flush)
+    listener_pid = os.getpid()
+
+
+def flush() -> None:
+    """
+    Waits for the queued lines to be written. The thread is started again on the next line.
+    """
+    global listener
+    if listener is not None and listener_pid == os.getpid():
+        listener.stop()
+    listener = None
+
+
+def emit(levelno: int, style: int, text: str, verbatim: bool, emphasized, emphasized_kwargs) -> None:
+    if output_format == "json":
+        message = text if verbatim else text.format(*emphasized, **emphasized_kwargs)
+    else:
+        message = get_log_formatter(style, verbatim)(text, *emphasized, **emphasized_kwargs)
+    if listener is None or listener_pid != os.getpid():
+        start()
+    # makeRecord doesn't look for the caller in the stack, unlike logger.log()
+    logger.handle(logger.makeRecord(logger.name, levelno, "", 0, message, (), None, extra={"style": style}))
+
+
 def debug(text: str, *emphasized, **emphasized_kwargs):
-    text = get_log_formatter(DEBUG)(text, *emphasized, **emphasized_kwargs)
-    logger.setLevel(environ.get("log-level", "INFO"))
-    if logger.getEffectiveLevel() <= DEBUG:
-        print(text)
-    # logger.debug(text)
+    if DEBUG >= level:
+        emit(DEBUG, DEBUG, text, False, emphasized, emphasized_kwargs)
 
 
 def info(text: str, *emphasized, **emphasized_kwargs):
-    text = get_log_formatter(INFO)(text, *emphasized, **emphasized_kwargs)
-    logger.setLevel(environ.get("log-level", "INFO"))
-    if logger.getEffectiveLevel() <= INFO:
-        print(text)
-    # logger.info(text)
+    if INFO >= level:
+        emit(INFO, INFO, text, False, emphasized, emphasized_kwargs)
 
 
 def success(text: str, *emphasized, **emphasized_kwargs):
-    text = get_log_formatter(SUCCESS)(text, *emphasized, **emphasized_kwargs)
-    logger.setLevel(environ.get("log-level", "INFO"))
-    if logger.getEffectiveLevel() <= INFO:
-        print(text)
-    # logger.info(text)
+    if INFO >= level:
+        emit(INFO, SUCCESS, text, False, emphasized, emphasized_kwargs)
 
 
 def warn(text: str, *emphasized, **emphasized_kwargs):
-    text = get_log_formatter(WARNING)(text, *emphasized, **emphasized_kwargs)
-    logger.setLevel(environ.get("log-level", "INFO"))
-    if logger.getEffectiveLevel() <= WARNING:
-        print(text)
-    # logger.warn(text)
+    if WARNING >= level:
+        emit(WARNING, WARNING, text, False, emphasized, emphasized_kwargs)
 
 
 def error(text: str, *emphasized, **emphasized_kwargs):
-    text = get_log_formatter(ERROR)(text, *emphasized, **emphasized_kwargs)
-    logger.setLevel(environ.get("log-level", "INFO"))
-    if logger.getEffectiveLevel() <= ERROR:
-        print(text)
-    # logger.error(text)
+    if ERROR >= level:
+        emit(ERROR, ERROR, text, False, emphasized, emphasized_kwargs)
 
 
 def critical(text: str, *emphasized, **emphasized_kwargs):
-    text = get_log_formatter(CRITICAL)(text, *emphasized, **emphasized_kwargs)
-    logger.setLevel(environ.get("log-level", "INFO"))
-    if logger.getEffectiveLevel() <= CRITICAL:
-        print(text)
-    # logger.critical(text)
+    if CRITICAL >= level:
+        emit(CRITICAL, CRITICAL, text, False, emphasized, emphasized_kwargs)
 
 
 class verbatim:
-    def debug(text: str):
-        text = get_log_formatter(DEBUG, verbatim=True)(text)
-        logger.setLevel(environ.get('log-level', 'DEBUG'))
-        if logger.getEffectiveLevel() <= CRITICAL:
-            print(text)
+    def debug(text: Union[str, lazy]):
+        if DEBUG >= level:
+            emit(DEBUG, DEBUG, str(text), True, (), {})
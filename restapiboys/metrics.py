@@ -0,0 +1,284 @@
+"""
+Time spent in each stage of a request (routing, parsing, validation, computed fields,
+CouchDB calls, serialization, compression), measured with a monotonic clock.
+Timings are sent back in a Server-Timing header and aggregated in histograms,
+per endpoint and method, served in Prometheus' text format.
+
+Each worker writes its histograms to a file of a directory shared by the workers,
+and the worker answering a scrape merges them all.
+"""
+from contextvars import ContextVar
+from typing import *
+from restapiboys import codec, log
+from restapiboys.config import MetricsConfig
+import atexit
+import glob
+import os
+import tempfile
+import threading
+import time
+
+# Upper bounds of the histograms' buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Label of requests that matched no route
+UNMATCHED = "unmatched"
+
+
+class RequestTimings:
+    """
+    Durations of the stages of a request, in seconds.
+    A stage's duration doesn't include the stages run inside of it
+    (validation doesn't include parsing the body), so that they add up to at most the total.
+    """
+
+    __slots__ = ("started_at", "stages", "calls")
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.stages: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+
+    def add(self, stage: str, duration: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def total(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def as_header(self) -> str:
+        """
+        Value of the Server-Timing header, durations in milliseconds
+        """
+        metrics = []
+        for stage, duration in self.stages.items():
+            metric = f"{stage};dur={duration * 1000:.3f}"
+            if self.calls[stage] > 1:
+                metric += f';desc="{self.calls[stage]} calls"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={self.total() * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+# Context variables are copied to each asyncio task, so that concurrent stages each see their parent
+current_stage: ContextVar[Optional["timed"]] = ContextVar("current_stage", default=None)
+
+
+class timed:
+    """
+    Times the stage `stage` of the current request, if it is timed:
+    with metrics.timed("validate"): ...
+    """
+
+    __slots__ = ("stage", "timings", "started_at", "nested", "token")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "timed":
+        self.timings = current_timings.get()
+        if self.timings is not None:
+            # Time spent in the stages run inside this one
+            self.nested = 0.0
+            self.token = current_stage.set(self)
+            self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.timings is None:
+            return
+        elapsed = time.monotonic() - self.started_at
+        current_stage.reset(self.token)
+        parent = current_stage.get()
+        if parent is not None:
+            parent.nested += elapsed
+        # Concurrent nested stages can overlap
+        self.timings.add(self.stage, max(elapsed - self.nested, 0.0))
+
+
+def start_timing(config: MetricsConfig) -> Optional[RequestTimings]:
+    """
+    Starts timing the current request (or task, with asyncio), if metrics are enabled
+    """
+    timings = RequestTimings() if config.enabled or config.server_timing else None
+    current_timings.set(timings)
+    return timings
+
+
+class Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        # Not cumulative, the last one is +Inf
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            index = len(BUCKETS)
+        self.buckets[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsStore:
+    """
+    Histograms of this worker, keyed by (endpoint, method, stage).
+    The whole request is the stage "total".
+    """
+
+    def __init__(self, config: MetricsConfig):
+        self.config = config
+        self.directory = get_metrics_directory(config)
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.written_at = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint: str, method: str, status: str, timings: RequestTimings) -> None:
+        total = timings.total()
+        with self.lock:
+            for stage, duration in (*timings.stages.items(), ("total", total)):
+                key = (endpoint, method, stage)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].observe(duration)
+            key = (endpoint, method, status[:3])
+            self.requests[key] = self.requests.get(key, 0) + 1
+        if time.monotonic() - self.written_at >= self.config.flush_interval:
+            self.write()
+
+    def snapshot(self) -> Dict[str, Any]:
+        # Imported here, the database module times its requests with this one
+        from restapiboys.database import get_cache
+
+        cache = get_cache()
+        with self.lock:
+            return {
+                "histograms": [
+                    [*key, histogram.buckets, histogram.sum, histogram.count]
+                    for key, histogram in self.histograms.items()
+                ],
+                "requests": [[*key, count] for key, count in self.requests.items()],
+                "cache": cache.stats.as_dict() if cache else {},
+            }
+
+    def write(self) -> None:
+        """
+        Writes this worker's metrics to its file, replacing it at once
+        so that a worker merging the files never reads half of it
+        """
+        self.written_at = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "wb") as file:
+                file.write(codec.dumps(self.snapshot()))
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            log.warn("Metrics: Can't write {0}: {1}", path, str(error))
+
+
+# Shared by the workers of the same gunicorn master: read on import, so that it is
+# the master's pid both when workers import the application and when they inherit it (--preload)
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), f"restapiboys-metrics-{os.getppid()}")
+
+
+def get_metrics_directory(config: MetricsConfig) -> str:
+    return config.directory or DEFAULT_DIRECTORY
+
+
+_store: Optional[MetricsStore] = None
+_store_pid: Optional[int] = None
+
+
+def get_store(config: MetricsConfig) -> MetricsStore:
+    """
+    Gets the `MetricsStore` of this process: a forked worker doesn't count its parent's requests
+    """
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        _store = MetricsStore(config)
+        _store_pid = os.getpid()
+        atexit.register(_store.write)
+    return _store
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    histograms: Dict[Tuple[str, str, str], list] = {}
+    requests: Dict[Tuple[str, str, str], int] = {}
+    cache: Dict[str, int] = {}
+    for snapshot in snapshots:
+        for endpoint, method, stage, buckets, total, count in snapshot["histograms"]:
+            merged = histograms.setdefault((endpoint, method, stage), [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+        for endpoint, method, status, count in snapshot["requests"]:
+            requests[(endpoint, method, status)] = requests.get((endpoint, method, status), 0) + count
+        for name, value in snapshot["cache"].items():
+            cache[name] = cache.get(name, 0) + value
+    return {"histograms": histograms, "requests": requests, "cache": cache}
+
+
+def read_snapshots(directory: str) -> List[Dict[str, Any]]:
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path, "rb") as file:
+                snapshots.append(codec.loads(file.read()))
+        except (OSError, codec.DecodeError) as error:
+            log.warn("Metrics: Can't read {0}: {1}", path, str(error))
+    return snapshots
+
+
+def format_labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(merged: Dict[str, Any]) -> str:
+    """
+    Renders merged snapshots in Prometheus' text exposition format
+    """
+    lines = [
+        "# HELP restapiboys_stage_duration_seconds Time spent in each stage of the requests",
+        "# TYPE restapiboys_stage_duration_seconds histogram",
+    ]
+    for (endpoint, method, stage), (buckets, total, count) in sorted(merged["histograms"].items()):
+        cumulative = 0
+        for bound, bucket in zip((*BUCKETS, "+Inf"), buckets):
+            cumulative += bucket
+            labels = format_labels(endpoint=endpoint, method=method, stage=stage, le=str(bound))
+            lines.append(f"restapiboys_stage_duration_seconds_bucket{labels} {cumulative}")
+        labels = format_labels(endpoint=endpoint, method=method, stage=stage)
+        lines.append(f"restapiboys_stage_duration_seconds_sum{labels} {total}")
+        lines.append(f"restapiboys_stage_duration_seconds_count{labels} {count}")
+    lines += [
+        "# HELP restapiboys_requests_total Requests handled, by response status",
+        "# TYPE restapiboys_requests_total counter",
+    ]
+    for (endpoint, method, status), count in sorted(merged["requests"].items()):
+        labels = format_labels(endpoint=endpoint, method=method, status=status)
+        lines.append(f"restapiboys_requests_total{labels} {count}")
+    for name, value in sorted(merged["cache"].items()):
+        lines += [
+            f"# TYPE restapiboys_cache_{name}_total counter",
+            f"restapiboys_cache_{name}_total {value}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def render_all_workers(config: MetricsConfig) -> str:
+    store = get_store(config)
+    # Include this worker's latest requests
+    store.write()
+    return render(merge_snapshots(read_snapshots(store.directory)))
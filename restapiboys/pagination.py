@@ -0,0 +1,85 @@
+"""
+Keyset pagination of collections: ?limit= and ?cursor= query parameters.
+Cursors are opaque to clients, they encode where the next page starts
+(a document ID), so that getting any page costs the same.
+"""
+from typing import *
+from restapiboys.endpoints import ResourceConfig
+from restapiboys.http import Request
+import base64
+import binascii
+import json
+import urllib.parse
+
+
+class PaginationError(ValueError):
+    """ Used when ?limit= or ?cursor= are invalid """
+
+    pass
+
+
+class PageRequest(NamedTuple):
+    limit: int
+    # ID of the first document of the page, `None` for the first page
+    startkey: Optional[str] = None
+    # Bookmark returned by CouchDB's _find, for filtered collections
+    bookmark: Optional[str] = None
+
+
+def get_page_request(req: Request, resource: ResourceConfig) -> Optional[PageRequest]:
+    """
+    Gets the requested page from the query string.
+    Returns `None` if the collection should not be paginated.
+    """
+    limit = req.query.get("limit")
+    cursor = req.query.get("cursor")
+    if limit is None and cursor is None and resource.default_page_size is None:
+        return None
+    if limit is None:
+        limit = resource.default_page_size or resource.max_page_size
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError(f"?limit= must be an integer, not {limit!r}")
+        if not 1 <= limit <= resource.max_page_size:
+            raise PaginationError(
+                f"?limit= must be between 1 and {resource.max_page_size}"
+            )
+    position = decode_cursor(cursor) if cursor else {}
+    return PageRequest(
+        limit=limit, startkey=position.get("startkey"), bookmark=position.get("bookmark")
+    )
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, ValueError):
+        raise PaginationError(f"Invalid cursor {cursor!r}")
+    if type(position) is not dict:
+        raise PaginationError(f"Invalid cursor {cursor!r}")
+    return position
+
+
+def get_pagination_headers(
+    req: Request, page: PageRequest, next_position: Optional[Dict[str, Any]]
+) -> Dict[str, str]:
+    """
+    Gets the Link header pointing to the next page, if there is one.
+    `next_position` is what the cursor encodes: `{"startkey": ...}` or `{"bookmark": ...}`.
+    Other query parameters are kept as is.
+    """
+    if next_position is None:
+        return {}
+    query = {
+        **req.query,
+        "limit": page.limit,
+        "cursor": encode_cursor(next_position),
+    }
+    url = f"{req.scheme}://{req.host}{req.route}?{urllib.parse.urlencode(query)}"
+    return {"Link": f'<{url}>; rel="next"'}
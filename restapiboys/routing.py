@@ -0,0 +1,213 @@
+"""
+Resolves requests' method and path to what should handle them,
+using a trie of path segments built once per worker.
+"""
+from enum import Enum
+from importlib.util import module_from_spec, spec_from_file_location
+from typing import *
+import os
+from restapiboys import log
+from restapiboys.config import get_api_config
+from restapiboys.custom_routes.decorators import CustomRoute
+from restapiboys.endpoints import ResourceConfig, get_registry, is_special_endpoint
+from restapiboys.http import RequestMethod, StatusCode
+from restapiboys.utils import get_path, string_to_identifier
+
+# Methods available on /<resource> and /<resource>/:uuid
+COLLECTION_METHODS = [RequestMethod.GET, RequestMethod.POST]
+ITEM_METHODS = [RequestMethod.GET, RequestMethod.PATCH, RequestMethod.DELETE]
+
+
+class RouteKind(str, Enum):
+    collection = "collection"
+    item = "item"
+    custom = "custom"
+    specs = "specs"
+    root = "root"
+    metrics = "metrics"
+
+
+class RouteTarget(NamedTuple):
+    kind: RouteKind
+    # Names of the route's :params, in order of appearance
+    params: List[str] = []
+    resource: Optional[ResourceConfig] = None
+    handler: Optional[Callable[..., Any]] = None
+    # The route as declared, with its :params. Set by `Router.add`
+    route: Optional[str] = None
+
+
+class RouteMatch(NamedTuple):
+    # OK, NOT_FOUND or METHOD_NOT_ALLOWED
+    status: StatusCode
+    kind: Optional[RouteKind] = None
+    resource: Optional[ResourceConfig] = None
+    handler: Optional[Callable[..., Any]] = None
+    params: Dict[str, str] = {}
+    allowed_methods: List[str] = []
+    route: Optional[str] = None
+
+
+class RouteNode:
+    __slots__ = ("children", "param_child", "targets")
+
+    def __init__(self):
+        # Static segments
+        self.children: Dict[str, "RouteNode"] = {}
+        # :param segment, matches any segment
+        self.param_child: Optional["RouteNode"] = None
+        # Targets of the route ending at this node, by request method
+        self.targets: Dict[str, RouteTarget] = {}
+
+
+class Router:
+    def __init__(self):
+        self.root = RouteNode()
+
+    def add(self, method: str, route: str, target: RouteTarget) -> None:
+        node = self.root
+        for segment in split_route(route):
+            if segment.startswith(":"):
+                if node.param_child is None:
+                    node.param_child = RouteNode()
+                node = node.param_child
+            else:
+                node = node.children.setdefault(segment, RouteNode())
+        node.targets[method] = target._replace(route=route)
+
+    def has(self, method: str, route: str) -> bool:
+        node = self.root
+        for segment in split_route(route):
+            if segment.startswith(":"):
+                node = node.param_child
+            else:
+                node = node.children.get(segment)
+            if node is None:
+                return False
+        return method in node.targets
+
+    def resolve(self, method: str, path: str) -> RouteMatch:
+        """
+        Finds the target of `method` on `path`.
+        Static segments take precedence over :params.
+        """
+        found = find_node(self.root, split_route(path), 0, [])
+        if found is None:
+            return RouteMatch(StatusCode.NOT_FOUND)
+        node, values = found
+        target = node.targets.get(method)
+        if target is None:
+            return RouteMatch(
+                StatusCode.METHOD_NOT_ALLOWED, allowed_methods=list(node.targets.keys())
+            )
+        return RouteMatch(
+            StatusCode.OK,
+            kind=target.kind,
+            resource=target.resource,
+            handler=target.handler,
+            params=dict(zip(target.params, values)),
+            allowed_methods=list(node.targets.keys()),
+            route=target.route,
+        )
+
+
+def find_node(
+    node: RouteNode, segments: List[str], index: int, values: List[str]
+) -> Optional[Tuple[RouteNode, List[str]]]:
+    if index == len(segments):
+        return (node, values) if node.targets else None
+    segment = segments[index]
+    child = node.children.get(segment)
+    if child is not None:
+        found = find_node(child, segments, index + 1, values)
+        if found:
+            return found
+    if node.param_child is not None:
+        return find_node(node.param_child, segments, index + 1, values + [segment])
+    return None
+
+
+def split_route(route: str) -> List[str]:
+    return [segment for segment in route.split("/") if segment]
+
+
+def route_params_names(route: str) -> List[str]:
+    return [
+        string_to_identifier(segment[1:])
+        for segment in split_route(route)
+        if segment.startswith(":")
+    ]
+
+
+def load_custom_routes(directory: str = "endpoints") -> List[CustomRoute]:
+    """
+    Imports the python files of `directory` and gets the functions
+    decorated with the decorators from `restapiboys.custom_routes.decorators`
+    """
+    custom_routes = []
+    folder = get_path(directory)
+    for filename in sorted(os.listdir(folder)):
+        filetitle, extension = os.path.splitext(filename)
+        if extension != ".py" or is_special_endpoint(filetitle):
+            continue
+        spec = spec_from_file_location(f"endpoints.{filetitle}", os.path.join(folder, filename))
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+        for value in vars(module).values():
+            custom_route = getattr(value, "custom_route", None)
+            if isinstance(custom_route, CustomRoute):
+                custom_routes.append(custom_route)
+    return custom_routes
+
+
+def build_router() -> Router:
+    router = Router()
+    # Custom routes first: they take precedence over the ones generated from resources
+    for custom_route in load_custom_routes():
+        router.add(
+            custom_route.method,
+            custom_route.route,
+            RouteTarget(
+                RouteKind.custom,
+                params=route_params_names(custom_route.route),
+                handler=custom_route.function,
+            ),
+        )
+    for resource in get_registry().resources:
+        for kind, route, methods in (
+            (RouteKind.collection, resource.route, COLLECTION_METHODS),
+            (RouteKind.item, resource.route + "/:uuid", ITEM_METHODS),
+        ):
+            for method in methods:
+                if method not in resource.allowed_methods or router.has(method.value, route):
+                    continue
+                router.add(
+                    method.value,
+                    route,
+                    RouteTarget(kind, params=route_params_names(route), resource=resource),
+                )
+    # Built-in routes, unless an endpoint overrides them
+    metrics = get_api_config().metrics
+    for kind, route in (
+        (RouteKind.root, "/"),
+        (RouteKind.specs, "/specs"),
+        (RouteKind.specs, "/specs/:endpoint"),
+        *([(RouteKind.metrics, metrics.route)] if metrics.enabled else []),
+    ):
+        if not router.has(RequestMethod.GET.value, route):
+            router.add(RequestMethod.GET.value, route, RouteTarget(kind, params=route_params_names(route)))
+    log.debug("Built router")
+    return router
+
+
+_router: Optional[Router] = None
+
+
+def get_router() -> Router:
+    """
+    Gets the `Router` of this process, building it on the first call.
+    """
+    global _router
+    if _router is None:
+        _router = build_router()
+    return _router
@@ -1,20 +1,27 @@
-from restapiboys.database import create_item, delete_item, list_items, read_item, update_item
-from restapiboys.validation import validate_request_data
-from restapiboys.config import get_api_config
-from restapiboys.utils import recursive_namedtuple_to_dict, extract_uuid_from_path
-from restapiboys.http import Request, StatusCode, Response
+from restapiboys.couchdb import Concurrently, FindError, Operation, RevisionConflictError, create_item, create_items, delete_item, find_page, get_rev, get_update_seq, list_page, read_item, read_item_raw, read_items, stream_items, update_item
+from restapiboys.validation import validate_item_data, validate_patched_item, validate_request_data
+from restapiboys.config import APIConfig, get_api_config
+from restapiboys.utils import recursive_namedtuple_to_dict
+from restapiboys.http import PayloadTooLargeError, Request, StatusCode, Response, stream_json_array
+from restapiboys.expansion import Expansion, ExpansionError, collect_references, get_expansions, inline_references
+from restapiboys.conditional import PreconditionError, get_collection_etag, get_expected_rev, get_item_etag, is_not_modified
+from restapiboys.compression import compress_response
+from restapiboys.filtering import FilterError, get_find_query, get_projection
+from restapiboys.pagination import PageRequest, PaginationError, get_page_request, get_pagination_headers
+from restapiboys.routing import RouteKind, RouteMatch, get_router
 from restapiboys.endpoints import (
-    add_computed_values_to_request_data, add_default_fields_to_request_data, get_endpoints,
-    get_endpoints_routes,
+    ResourceConfig,
+    add_computed_values_to_request_data, add_default_fields_to_request_data,
+    get_registry,
     get_resource_config_of_route,
     get_resource_headers,
 )
+from functools import lru_cache
 from typing import *
-from restapiboys import log
+from restapiboys import database, log, metrics
 import multiprocessing
 import traceback
 from uuid import UUID, uuid4
-import json
 import re
 
 DEFAULT_GUNICORN_OPTIONS = {
@@ -23,71 +30,184 @@ DEFAULT_GUNICORN_OPTIONS = {
     "reload_extra_files": "",
 }
 
+# Parse the endpoints and build the router when the worker boots instead of on its first request
+get_router()
+
 
 def requests_handler(environ, start_response):
     try:
-        req = Request.from_gunicorn_environ(environ)
         config = get_api_config()
+        timings = metrics.start_timing(config.metrics)
+        req = Request.from_gunicorn_environ(environ, config.max_request_body_size)
+    except PayloadTooLargeError as error:
+        res = Response(StatusCode.PAYLOAD_TOO_LARGE, {}, {"error": str(error)})
+        start_response(res.status, res.headers)
+        return [res.body]
     except Exception as exception:
         log.critical(str(exception))
         return
+    match = None
     try:
-        resource_id, uuid = extract_uuid_from_path(req.route) or (req.route, None)
-        resource = get_resource_config_of_route(resource_id)
-        log.debug('resource_id = {0}  uuid = {1}', resource_id, uuid)
-        log.debug("Request body: {}", req.body)
-        available_routes = get_endpoints_routes()
-        if resource and req.method not in resource.allowed_methods:
-            res = Response(StatusCode.METHOD_NOT_ALLOWED, {}, b"")
-        elif req.route.startswith("/specs") and "/specs" not in available_routes:
-            res = handle_spec_route(req)
-        elif req.route == "/" and "/" not in available_routes:
-            res = Response(StatusCode.FOUND, {"Location": "/specs"}, {})
-        elif not endpoint_exists(resource_id):
-            res = Response(
-                StatusCode.NOT_FOUND,
-                {},
-                {"error": f"The resource {req.route} was not found"},
-            )
-        else:
-            res = handle_endpoint(req)
+        with metrics.timed("route"):
+            match, res = route_request(req, config)
+        if res is None and match.kind is RouteKind.custom:
+            res = check_custom_route_response(req, match.handler(req, **match.params))
+        elif res is None:
+            res = database.run(handle_endpoint(req, match))
+        with metrics.timed("compress"):
+            res = compress_response(req, res, config.compression, static=is_static(match))
+        record_timings(req, res, match, timings, config)
     except Exception as exception:
+        res = get_internal_error_response(exception, config)
+    start_response(res.status, res.headers)
+    log_response(req, res)
+    return res.body if res.is_streamed else [res.body]
+
+
+def route_request(req: Request, config: APIConfig) -> Tuple[RouteMatch, Optional[Response]]:
+    """
+    Resolves the request's route, and responds directly to requests
+    that don't need to touch the database or run user code.
+    Shared by the WSGI and ASGI applications.
+    """
+    match = get_router().resolve(req.method, req.route)
+    log.debug("Route {0} resolved to {1} with params {2}", req.route, match.kind, match.params)
+    log.debug("Request body: {}", req.body)
+    if match.status is StatusCode.METHOD_NOT_ALLOWED:
         res = Response(
-            StatusCode.INTERNAL_SERVER_ERROR,
+            StatusCode.METHOD_NOT_ALLOWED,
+            {"Allow": ", ".join(match.allowed_methods)},
+            b"",
+        )
+    elif match.status is StatusCode.NOT_FOUND:
+        res = Response(
+            StatusCode.NOT_FOUND,
             {},
-            {
-                "error": str(exception),
-                "please_contact": f"{config.contact_info.name} <{config.contact_info.email}>",
-                "traceback": traceback.format_exc().split('\n')
-            },
+            {"error": f"The resource {req.route} was not found"},
         )
-    start_response(res.status, res.headers)
+    elif match.kind is RouteKind.specs:
+        res = handle_spec_route(req, match, config)
+    elif match.kind is RouteKind.root:
+        res = Response(StatusCode.FOUND, {"Location": "/specs"}, {})
+    elif match.kind is RouteKind.metrics:
+        res = Response(
+            StatusCode.OK,
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            metrics.render_all_workers(config.metrics),
+        )
+    else:
+        res = None
+    return match, res
+
+
+def check_custom_route_response(req: Request, res: Any) -> Response:
+    """
+    Checks the value returned by the function of a custom route:
+    `None` means that it has nothing to respond, anything else than a `Response` is an error.
+    """
+    if res is None:
+        return Response(
+            StatusCode.NOT_FOUND,
+            {},
+            {"error": f"The resource {req.route} was not found"},
+        )
+    if not isinstance(res, Response):
+        raise TypeError(f"The function of the route {req.route} returned a {type(res).__name__}, not a Response")
+    return res
+
+
+def get_find_error_response(error: FindError) -> Response:
+    # CouchDB refuses queries it can't run, such as a sort without an index to use
+    status = StatusCode.BAD_REQUEST if error.status_code == 400 else StatusCode.INTERNAL_SERVER_ERROR
+    return Response(status, {}, {"error": str(error)})
+
+
+def get_internal_error_response(exception: Exception, config: APIConfig) -> Response:
+    return Response(
+        StatusCode.INTERNAL_SERVER_ERROR,
+        {},
+        {
+            "error": str(exception),
+            "please_contact": f"{config.contact_info.name} <{config.contact_info.email}>",
+            "traceback": traceback.format_exc().split('\n')
+        },
+    )
+
+
+def is_static(match: Optional[RouteMatch]) -> bool:
+    """
+    Checks if the response to `match` only depends on the endpoints' configuration
+    """
+    return match is not None and match.kind is RouteKind.specs
+
+
+def can_pass_through(resource: ResourceConfig, fields: Optional[List[str]], expansions: List[Any]) -> bool:
+    """
+    Checks if documents of `resource` can be sent as CouchDB stored them, without decoding them
+    """
+    return fields is None and not expansions and not any(f.serialization for f in resource.fields)
+
+
+def get_conflict_response(expected_rev: Optional[str]) -> Response:
+    # The client's copy of the document is outdated
+    if expected_rev:
+        return Response(
+            StatusCode.PRECONDITION_FAILED,
+            {},
+            {"error": f"The document has been modified since revision {expected_rev}"},
+        )
+    # The document was written by someone else between reading and writing it
+    return Response(
+        StatusCode.CONFLICT,
+        {},
+        {"error": "The document has been modified while handling the request, please retry"},
+    )
+
+
+def record_timings(
+    req: Request,
+    res: Response,
+    match: Optional[RouteMatch],
+    timings: Optional[metrics.RequestTimings],
+    config: APIConfig,
+) -> None:
+    """
+    Adds the request's timings to the metrics and to the Server-Timing header.
+    Streamed bodies are produced after this, their serialization is not counted.
+    """
+    if timings is None:
+        return
+    if config.metrics.server_timing:
+        res.headers.append(("Server-Timing", timings.as_header()))
+    if config.metrics.enabled:
+        endpoint = match.route if match is not None and match.route else metrics.UNMATCHED
+        metrics.get_store(config.metrics).observe(endpoint, req.method, res.status, timings)
+
+
+def log_response(req: Request, res: Response) -> None:
     if res.is_error():
         log.warn(f"{req.method} {req.route} {{}} {res.status}", "-->")
     else:
         log.success(f"{req.method} {req.route} {{}} {res.status}", "-->")
-    return [res.body]
 
 
-def endpoint_exists(route: str) -> bool:
-    routes = ["/" + r for r in get_endpoints_routes()]
-    return route in routes
-
-
-def handle_endpoint(req: Request) -> Response:
+def handle_endpoint(req: Request, match: RouteMatch) -> Operation[Response]:
+    """
+    Handles requests to the resources' endpoints, as a CouchDB operation
+    run by the WSGI and the ASGI applications
+    """
     # 1. validation of the request's body
-    resource = get_resource_config_of_route(req.route)
-    headers = {}
-    if resource:
-        headers = get_resource_headers(resource)
-    error = validate_request_data(req)
+    resource = match.resource
+    headers = get_resource_headers(resource)
+    with metrics.timed("validate"):
+        error = validate_request_data(req, resource)
     if error:
         message, data = error
         return Response(StatusCode.BAD_REQUEST, headers, {"error": message, **data})
 
     # 2. execute code for custom routes
     # 3. (or) interact with the database
-    res = interact_with_db(req)
+    res = yield from interact_with_db(req, match)
     
     # 4. serialize the response (handle fieldname.serialization)
     return res
@@ -96,23 +216,14 @@ def handle_endpoint(req: Request) -> Response:
     # )
 
 
-def handle_spec_route(req: Request) -> Response:
-    config = get_api_config()
-    endpoints = get_endpoints()
-    if req.route == "/specs":
-        specs_urls_map = {}
-        for endpoint in endpoints:
-            specs_urls_map[
-                endpoint.identifier
-            ] = f"{req.scheme}://{req.host}/specs{endpoint.route}"
-        return Response(StatusCode.OK, {}, specs_urls_map)
+def handle_spec_route(req: Request, match: RouteMatch, config: APIConfig) -> Response:
+    if "endpoint" not in match.params:
+        return Response(StatusCode.OK, {"Content-Type": "application/json"}, get_specs_index(req.scheme, req.host))
     else:
-        requested_endpoint = req.route.replace("/specs", "", 1)
-        for endpoint in endpoints:
-            if requested_endpoint == endpoint.route:
-                return Response(
-                    StatusCode.OK, {}, recursive_namedtuple_to_dict(endpoint)
-                )
+        requested_endpoint = "/" + match.params["endpoint"]
+        specs = get_endpoint_specs(requested_endpoint)
+        if specs:
+            return Response(StatusCode.OK, {"Content-Type": "application/json"}, specs)
         return Response(
             StatusCode.NOT_FOUND,
             {},
@@ -123,36 +234,184 @@ def handle_spec_route(req: Request) -> Response:
         )
 
 
-def interact_with_db(req: Request) -> Response:
-    route, uuid = extract_uuid_from_path(req.route) or (req.route, None)
-    resource = get_resource_config_of_route(route)
-    req_data = json.loads(req.body) if req.body else None
-    if resource is None:
-        return Response(StatusCode.INTERNAL_SERVER_ERROR, {}, {'error': f"Could not determine resource from route {route!r}"})
+# The specs only change when the endpoints do, which requires restarting the workers:
+# they are serialized once, so that they can be compressed once too.
+@lru_cache(maxsize=64)
+def get_specs_index(scheme: str, host: str) -> bytes:
+    return Response.encode_body(
+        {
+            endpoint.identifier: f"{scheme}://{host}/specs{endpoint.route}"
+            for endpoint in get_registry().resources
+        }
+    )
+
+
+@lru_cache(maxsize=None)
+def get_endpoint_specs(route: str) -> Optional[bytes]:
+    endpoint = get_resource_config_of_route(route)
+    if endpoint is None:
+        return None
+    return Response.encode_body(recursive_namedtuple_to_dict(endpoint))
+
+
+def interact_with_db(req: Request, match: RouteMatch) -> Operation[Response]:
+    resource, uuid = match.resource, match.params.get("uuid")
+    # Already parsed during validation
+    req_data = req.json
     if req.method == 'GET' and not uuid:
-        data = list_items(resource.identifier)
+        try:
+            page = get_page_request(req, resource)
+            query = get_find_query(req, resource)
+            expansions = get_expansions(req, resource)
+        except (PaginationError, FilterError, ExpansionError) as error:
+            return Response(StatusCode.BAD_REQUEST, {}, {'error': str(error)})
+        # Relations are expanded for a whole page at once
+        if expansions and page is None:
+            page = PageRequest(resource.max_page_size)
+        # Expanded documents come from other databases, their changes can't be tracked
+        tracked = not expansions
+        etag = None
+        # _all_docs gives the database's sequence with the documents, _find doesn't.
+        # Check a client's copy before listing the documents
+        if tracked and (query is not None or req.header("If-None-Match")):
+            etag = get_collection_etag((yield from get_update_seq(resource.identifier)), req)
+            if is_not_modified(req, etag):
+                return Response(StatusCode.NOT_MODIFIED, etag=etag)
+        if query is not None:
+            page = page or PageRequest(resource.max_page_size)
+            try:
+                items, bookmark = yield from find_page(resource.identifier, query.selector, query.sort, page.limit, page.bookmark, query.fields)
+            except FindError as error:
+                return get_find_error_response(error)
+            next_position = {"bookmark": bookmark} if bookmark else None
+            items = yield from expand_items(items, expansions)
+            return Response(StatusCode.OK, get_pagination_headers(req, page, next_position), items, etag=etag)
+        if page is None:
+            stream = yield from stream_items(resource.identifier)
+            etag = get_collection_etag(stream.update_seq, req) if tracked else None
+            return Response(StatusCode.OK, {}, stream_json_array(stream.docs), etag=etag)
+        items, next_startkey, update_seq = yield from list_page(resource.identifier, page.limit, page.startkey)
+        etag = get_collection_etag(update_seq, req) if tracked else None
+        next_position = {"startkey": next_startkey} if next_startkey else None
+        items = yield from expand_items(items, expansions)
+        return Response(StatusCode.OK, get_pagination_headers(req, page, next_position), items, etag=etag)
     elif req.method == 'GET' and uuid:
-        data = read_item(resource.identifier, uuid)
+        try:
+            fields = get_projection(req, resource)
+            expansions = get_expansions(req, resource)
+        except (FilterError, ExpansionError) as error:
+            return Response(StatusCode.BAD_REQUEST, {}, {'error': str(error)})
+        # Only check the current revision if the client has a copy
+        if not expansions and req.header("If-None-Match"):
+            etag = get_item_etag((yield from get_rev(resource.identifier, uuid)), req)
+            if is_not_modified(req, etag):
+                return Response(StatusCode.NOT_MODIFIED, etag=etag)
+        if can_pass_through(resource, fields, expansions):
+            body, rev = yield from read_item_raw(resource.identifier, uuid)
+            status = StatusCode.NOT_FOUND if rev is None else StatusCode.OK
+            return Response(status, {"Content-Type": "application/json"}, body, etag=rev)
+        try:
+            data = yield from read_item(resource.identifier, uuid, fields)
+        except FindError as error:
+            return get_find_error_response(error)
+        if "error" in data:
+            return Response(StatusCode.NOT_FOUND, {}, data)
+        etag = None if expansions else get_item_etag(data["_rev"], req)
+        return Response(StatusCode.OK, {}, (yield from expand_items([data], expansions))[0], etag=etag)
     elif req.method == 'DELETE' and uuid:
-        data = delete_item(resource.identifier, uuid)
+        try:
+            expected_rev = get_expected_rev(req)
+            # Without If-Match, the current revision is looked up
+            data = yield from delete_item(resource.identifier, uuid, rev=expected_rev)
+        except PreconditionError as error:
+            return Response(StatusCode.PRECONDITION_FAILED, {}, {'error': str(error)})
+        except RevisionConflictError:
+            return get_conflict_response(expected_rev)
     elif req.method == 'PATCH' and uuid:
         if not req_data:
             return Response(StatusCode.BAD_REQUEST, {}, {'error': f'Request body is empty'})
-        current_data = read_item(resource.identifier, uuid)
-        data = add_computed_values_to_request_data(resource, req_data, current_data, current_data)
+        try:
+            expected_rev = get_expected_rev(req)
+        except PreconditionError as error:
+            return Response(StatusCode.PRECONDITION_FAILED, {}, {'error': str(error)})
+        # CouchDB checks the client's revision on write, so a cached copy of it can be used
+        current_data = yield from read_item(resource.identifier, uuid, cached=expected_rev is not None)
+        if expected_rev and current_data.get("_rev") != expected_rev:
+            current_data = yield from read_item(resource.identifier, uuid, cached=False)
+            if current_data.get("_rev") != expected_rev:
+                return get_conflict_response(expected_rev)
+        with metrics.timed("validate"):
+            error = validate_patched_item(req_data, current_data, resource)
+        if error:
+            message, error_data = error
+            return Response(StatusCode.BAD_REQUEST, {}, {'error': message, **error_data})
+        with metrics.timed("compute"):
+            data = add_computed_values_to_request_data(resource, req_data, current_data)
         data = {**current_data, **data}
-        data = update_item(resource.identifier, uuid, data)
+        try:
+            data = yield from update_item(resource.identifier, uuid, data, rev=current_data["_rev"])
+        except RevisionConflictError:
+            return get_conflict_response(expected_rev)
     elif req.method == 'POST':
         if not req_data:
             return Response(StatusCode.BAD_REQUEST, {}, {'error': f'Request body is empty'})
-        data = add_default_fields_to_request_data(resource, req_data)
-        data = add_computed_values_to_request_data(resource, data, {}, data)
-        data = create_item(resource.identifier, uuid4(), data)
+        if type(req_data) is list:
+            documents, errors = prepare_bulk_items(resource, req_data)
+            created = (yield from create_items(resource.identifier, documents)) if documents else []
+            return Response(StatusCode.OK, {}, merge_bulk_results(errors, created))
+        with metrics.timed("compute"):
+            data = add_default_fields_to_request_data(resource, req_data)
+            data = add_computed_values_to_request_data(resource, data, {})
+        data = yield from create_item(resource.identifier, uuid4(), data)
     else:
         return Response(StatusCode.METHOD_NOT_ALLOWED, {}, {'error': f'Method {req.method!r}', 'allowed_methods': resource.allowed_methods})
     if type(data) is bool:
         data = {'success': data}
         if not data['success']:
             return Response(StatusCode.INTERNAL_SERVER_ERROR, {}, data)
-    return Response(StatusCode.OK, {}, data)
-        
+    # Written documents are tagged with their new revision, to be used in If-Match
+    return Response(StatusCode.OK, {}, data, etag=data.get("_rev"))
+
+
+def prepare_bulk_items(
+    resource: ResourceConfig, items: List[Any]
+) -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, Any]]]:
+    """
+    Validates each of `items` and adds their default and computed values.
+    Returns the documents to create and the errors of the invalid items, by index.
+    """
+    documents, errors = [], {}
+    for index, item in enumerate(items):
+        error = validate_item_data(item, "POST", resource)
+        if error:
+            message, data = error
+            errors[index] = {"error": message, **data}
+            continue
+        with metrics.timed("compute"):
+            data = add_default_fields_to_request_data(resource, item)
+            data = add_computed_values_to_request_data(resource, data, {})
+        documents.append({**data, "_id": str(uuid4())})
+    return documents, errors
+
+
+def merge_bulk_results(
+    errors: Dict[int, Dict[str, Any]], created: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Puts the results of a bulk creation back in the order of the request's items
+    """
+    count = len(errors) + len(created)
+    created = iter(created)
+    return [errors[index] if index in errors else next(created) for index in range(count)]
+
+
+def expand_items(items: List[Dict[str, Any]], expansions: List[Expansion]) -> Operation[List[Dict[str, Any]]]:
+    """
+    Replaces the IDs of the relations to expand with the documents they point to,
+    with one request per referenced database, made concurrently by the ASGI application
+    """
+    if not expansions:
+        return items
+    references = collect_references(items, expansions)
+    fetched = yield Concurrently([read_items(name, uuids) for name, uuids in references.items()])
+    return inline_references(items, expansions, dict(zip(references.keys(), fetched)))
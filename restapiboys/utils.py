@@ -81,16 +81,18 @@ def recursive_namedtuple_to_dict(obj: NamedTuple) -> dict:
     for key, value in dict(obj._asdict()).items():
         if isinstance_namedtuple(value):
             value = recursive_namedtuple_to_dict(value)
+        # Lists of namedtuples, eg. an endpoint's fields
+        elif type(value) is list:
+            value = [
+                recursive_namedtuple_to_dict(item) if isinstance_namedtuple(item) else item
+                for item in value
+            ]
         as_dict[key] = value
     return as_dict
 
 
 def isinstance_namedtuple(obj: Any) -> bool:
-    return (
-        hasattr(obj, "_asdict")
-        and obj._asdict.__doc__
-        == "Return a new OrderedDict which maps field names to their values."
-    )
+    return isinstance(obj, tuple) and hasattr(obj, "_asdict")
 
 
 def string_to_identifier(string: str) -> str:
@@ -111,18 +113,21 @@ def string_to_identifier(string: str) -> str:
     return string
 
 
-def replace_whitespace_in_keys(obj: Dict[str, Any], sub: str = "_") -> Dict[str, Any]:
+def replace_whitespace_in_keys(
+    obj: Dict[str, Any], sub: str = "_", keep: Collection[str] = ()
+) -> Dict[str, Any]:
     """
     Removes whitespace from dict keys
     
     :param sub: Replace whitespace characters with this
     :param obj: The dictionnary to replace keys in
+    :param keep: Keys whose values' keys are left as they are
     """
     normalized = {}
     PATTERN = re.compile(r"")
     for key, value in obj.items():
-        if type(value) is dict:
-            value = replace_whitespace_in_keys(value)
+        if type(value) is dict and key not in keep:
+            value = replace_whitespace_in_keys(value, sub, keep)
         key = re.sub(r"\s", sub, key)
         normalized[key] = value
     return normalized
@@ -159,15 +164,20 @@ def resolve_synonyms_to_primary(
     return None
 
 
-def resolve_synonyms_in_dict(synonyms_map: Dict[str, List[str]], obj: dict) -> dict:
+def resolve_synonyms_in_dict(
+    synonyms_map: Dict[str, List[str]], obj: dict, keep: Collection[str] = ()
+) -> dict:
+    """
+    Replaces synonyms by their primary key, except in the values of the keys of `keep`
+    """
     resolved = {}
     for key, value in obj.items():
         resolved_key = key
         for primary, synonym in synonyms_map.items():
             if key == primary or key in synonym:
                 resolved_key = primary
-        if type(value) is dict:
-            value = resolve_synonyms_in_dict(synonyms_map, value)
+        if type(value) is dict and resolved_key not in keep:
+            value = resolve_synonyms_in_dict(synonyms_map, value, keep)
         resolved[resolved_key] = value
     return resolved
 
@@ -179,13 +189,6 @@ def swap_keys_and_values(dikt: dict) -> dict:
     """
     return {v: k for k, v in dikt.items()}
 
-def extract_uuid_from_path(path: str) -> Optional[Tuple[str, str]]:
-    UUID_PATTERN = re.compile(r'^(.+)/([a-fA-F0-9-]+)/?$')
-    if UUID_PATTERN.match(path):
-        route, uuid = UUID_PATTERN.search(path).groups()
-        return route, uuid
-    return None
-
 def flatten_dict(obj: dict, key_separator: str = '.', parent_key: Union[int, str] = '') -> Dict[str, Any]:
     """
     Turns a nested dict into a flat one, with key names computed.
@@ -1,21 +1,18 @@
-from json.decoder import JSONDecodeError
-from restapiboys.fields import NATIVE_TYPES_MAPPING
-from restapiboys.endpoints import get_endpoints, get_resource_config_of_route
+from restapiboys.fields import NATIVE_TYPES_MAPPING, ResourceFieldConfig, get_relation_target
+from restapiboys.endpoints import ResourceConfig, get_registry, is_default_value_computed
+from restapiboys.expressions import Expression
 from restapiboys.http import Request, RequestMethod, BODYLESS_REQUEST_METHODS
-from restapiboys.utils import extract_uuid_from_path
-from restapiboys import log
+from restapiboys import codec, iso8601, log
+from functools import lru_cache
 from typing import *
-import json
 from restapiboys.utils import swap_keys_and_values
-import arrow
 from slugify import slugify
 
 
-def validate_request_data(req: Request) -> Optional[Tuple[str, Dict[str, Any]]]:
+def validate_request_data(
+    req: Request, resource: Optional[ResourceConfig]
+) -> Optional[Tuple[str, Dict[str, Any]]]:
     log.debug("Starting validation")
-    resource_id, uuid = extract_uuid_from_path(req.route) or (req.route, None)
-    resource = get_resource_config_of_route(resource_id)
-    fields_by_name = {field.name: field for field in resource.fields}
     # If the request has no associated resource config, this is a custom route.
     # Skip traditional validation, go straigth to custom validators
     if not resource:
@@ -24,153 +21,288 @@ def validate_request_data(req: Request) -> Optional[Tuple[str, Dict[str, Any]]]:
         return None
     # 1. Check if its well-formed JSON
     try:
-        req_data: dict = json.loads(req.body)
-    except JSONDecodeError:
+        req_data: dict = req.json
+    except codec.DecodeError:
         return "The JSON request body is malformed", {}
     log.debug("Request is well-formed JSON")
 
-    # 3. For inserting NEW objects, check if the required fields are there
-    if req.method in ("POST", "PUT"):
-        missing_fields = []
-        required_fields = [f for f in resource.fields if f.required]
-        log.debug(
-            "Got required fields to test for: {}", [f.name for f in required_fields]
-        )
-        for field in required_fields:
-            # TODO: handle fieldname.subfieldname (nested objects)
-            if field.name not in req_data.keys():
-                missing_fields.append(field.name)
-
-        if missing_fields:
-            return "Some fields are missing", {"missing_fields": missing_fields}
-    
-    # 4. To _modify_ objects, check that we aren't trying to modify read-only field
-    if req.method in ('PATCH', 'PUT', 'POST'):
-        readonly_fields_names = {f.name for f in resource.fields if f.read_only}
-        request_fields_names  = {name for name, value in req_data.items()}
-        readonly_fields_in_request = list(readonly_fields_names & request_fields_names)
-        
-        if readonly_fields_in_request:
-            return "Some fields are read-only", {'readonly_fields': list(readonly_fields_names), 'fields_to_remove': readonly_fields_in_request}
-
-    # 4. Check the type of each field
-    log.debug("Checking types")
-    fields_with_wrong_types = []
-    unknown_fields = []
-    for name, value in req_data.items():
-        # Get the field configuration
-        field = fields_by_name.get(name)
-        if field is None:
-            log.debug("    Request field {} is unknown", name)
-            unknown_fields.append(name)
-            continue
-        # Check the type
-        log.debug(
-            "    Checking if type of {0} (with value {1}) is {2}",
-            field.name,
-            repr(value),
-            field.type,
-        )
-        # Check for `multiple` types
+    # 2. Arrays of items are created in bulk, each item is validated on its own
+    if req.method == "POST" and type(req_data) is list:
+        return None
+    return validate_item_data(req_data, req.method, resource)
+
+
+def validate_item_data(
+    req_data: Any, method: str, resource: ResourceConfig
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    return get_validator(resource).validate(req_data, method)
+
+
+def validate_patched_item(
+    patch: Dict[str, Any], current_data: Dict[str, Any], resource: ResourceConfig
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Checks the `validation:` rules that read both fields of the PATCH request's body
+    and fields only the stored document has, once it is read
+    """
+    return get_validator(resource).check_rules({**current_data, **patch}, patch)
+
+
+def get_validator(resource: ResourceConfig) -> "ResourceValidator":
+    """
+    Gets the validator compiled when building the registry,
+    or compiles one for resources that are not part of it
+    """
+    validator = get_registry().validators.get(resource.identifier)
+    if validator is None or validator.resource is not resource:
+        return ResourceValidator(resource)
+    return validator
+
+
+class FieldValidator:
+    """
+    Checks of a field, decided once from its configuration
+    """
+
+    __slots__ = ("name", "type_name", "check_type", "check_bounds")
+
+    def __init__(self, field: ResourceFieldConfig):
+        self.name = field.name
+        # Shown to the client when the value is of the wrong type
+        self.type_name = field.type + ("[]" if field.multiple else "")
+        check_item_type = get_type_check(field.type)
         if field.multiple:
-            if type(value) is not list:
-                validated = False
-            else:
-                validated = all((validate_type(item, field.type) for item in value))
+            self.check_type = lambda value: type(value) is list and all(
+                check_item_type(item) for item in value
+            )
         else:
-            validated = validate_type(value, field.type)
-
-        if not validated:
-            fields_with_wrong_types.append(field)
-    if fields_with_wrong_types:
-        return (
-            "Some fields' values are of the wrong type",
-            {
-                "correct_types_for_fields": {
-                    field.name: field.type + ("[]" if field.multiple else "")
-                    for field in fields_with_wrong_types
-                }
-            },
-        )
-    if unknown_fields:
-        return ("Unknown fields in request", {"unknown_fields": unknown_fields,})
-
-    # 5. Check max/min (length)
-    for name, value in req_data.items():
-        # Get the field configuration
-        field = fields_by_name.get(name)
-        # Check for min/max values
-        # TODO: Move `return message, data` to `validate_*` functions
-        if field.minimum is not None or field.maximum is not None:
-            log.debug(
-                "    Checking for bounds of {0}: {1} ∈ [{2}, {3}]",
-                repr(value),
-                name,
-                (field.minimum if field.minimum is not None else "-∞"),
-                (field.maximum if field.maximum is not None else "+∞"),
+            self.check_type = check_item_type
+        self.check_bounds = get_bounds_check(field)
+
+
+class ValidationRule:
+    """
+    A `validation:` rule of a field: an expression that must be true, and the message sent when it isn't.
+    `_` is the value of the field. The fields of a multi-field custom type's value
+    see each other by the names they have in the type (`start`, `end`).
+    """
+
+    __slots__ = ("field", "message", "expression", "reads", "inputs", "each")
+
+    def __init__(self, field: ResourceFieldConfig, message: str, source: Any, resource: ResourceConfig):
+        self.field = field.name
+        self.message = message
+        self.expression = Expression(str(source), f"{resource.identifier}.{field.name}: {message}")
+        # `field.subfield` for the fields of a multi-field custom type
+        prefix = field.name.rpartition(".")[0] + "." if "." in field.name else ""
+        local_names = {
+            f.name[len(prefix):]: f.name
+            for f in resource.fields
+            if f.name.startswith(prefix) and "." not in f.name[len(prefix):]
+        }
+        # Names in the expression and the fields they are read from
+        self.reads = {name: local_names[name] for name in self.expression.names if name in local_names}
+        if "_" in self.expression.names:
+            self.reads["_"] = field.name
+        self.inputs = frozenset((field.name, *self.reads.values()))
+        # `_` is each of the values of a field holding many of them
+        self.each = field.multiple and "_" in self.reads
+
+    def check(self, data: Mapping[str, Any]) -> bool:
+        """
+        Evaluates the rule against `data`, which has all of its inputs.
+        Failing to evaluate it counts as not passing it.
+        """
+        values = {name: data[field] for name, field in self.reads.items()}
+        try:
+            if self.each:
+                return all(self.expression.evaluate({**values, "_": item}) for item in values["_"])
+            return bool(self.expression.evaluate(values))
+        except Exception as error:
+            log.debug("Validation rule {0} of {1} raised {2}", self.expression.source, self.field, repr(error))
+            return False
+
+
+class ResourceValidator:
+    """
+    Validates the body of requests to `resource`, with checks compiled from its fields' configuration.
+    The body is gone through once, looking up each of its fields.
+    """
+
+    __slots__ = (
+        "resource",
+        "fields",
+        "required",
+        "required_names",
+        "read_only",
+        "read_only_names",
+        "rules",
+        "defaults",
+    )
+
+    def __init__(self, resource: ResourceConfig):
+        self.resource = resource
+        self.fields = {field.name: FieldValidator(field) for field in resource.fields}
+        self.required = frozenset(f.name for f in resource.fields if f.required)
+        # In the order of the configuration, for error messages
+        self.required_names = [f.name for f in resource.fields if f.required]
+        self.read_only = frozenset(f.name for f in resource.fields if f.read_only)
+        self.read_only_names = [f.name for f in resource.fields if f.read_only]
+        self.rules = [
+            ValidationRule(field, message, source, resource)
+            for field in resource.fields
+            for message, source in field.validation.items()
+        ]
+        # Values the rules see for the fields left out when creating an item
+        self.defaults = {
+            f.name: f.default
+            for f in resource.fields
+            if f.default is not None and not f.computed and not is_default_value_computed(f)
+        }
+        log.debug("Compiled validator of {}", resource.identifier)
+
+    def validate(self, req_data: Any, method: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if type(req_data) is not dict:
+            return "The JSON request body must be an object", {}
+
+        # For inserting NEW objects, check if the required fields are there
+        # TODO: handle fieldname.subfieldname (nested objects)
+        if method in ("POST", "PUT") and not self.required.issubset(req_data):
+            missing_fields = [name for name in self.required_names if name not in req_data]
+            return "Some fields are missing", {"missing_fields": missing_fields}
+
+        # To _modify_ objects, check that we aren't trying to modify read-only field
+        if method in ("PATCH", "PUT", "POST") and not self.read_only.isdisjoint(req_data):
+            return "Some fields are read-only", {
+                "readonly_fields": self.read_only_names,
+                "fields_to_remove": [name for name in req_data if name in self.read_only],
+            }
+
+        # Check the type, then the bounds of each field
+        fields_with_wrong_types = []
+        unknown_fields = []
+        out_of_bounds = None
+        for name, value in req_data.items():
+            field = self.fields.get(name)
+            if field is None:
+                unknown_fields.append(name)
+            elif not field.check_type(value):
+                fields_with_wrong_types.append(field)
+            elif out_of_bounds is None and field.check_bounds is not None:
+                out_of_bounds = field.check_bounds(value)
+
+        if fields_with_wrong_types:
+            return (
+                "Some fields' values are of the wrong type",
+                {
+                    "correct_types_for_fields": {
+                        field.name: field.type_name for field in fields_with_wrong_types
+                    }
+                },
             )
-        if not validate_max_min(value, field.minimum, field.maximum):
+        if unknown_fields:
+            return ("Unknown fields in request", {"unknown_fields": unknown_fields,})
+        if out_of_bounds is not None or not self.rules:
+            return out_of_bounds
+        # Rules reading fields the body doesn't have are checked once the stored document is read
+        if method == "PATCH":
+            return self.check_rules(req_data)
+        return self.check_rules({**self.defaults, **req_data})
+
+    def check_rules(
+        self, data: Mapping[str, Any], patch: Optional[Mapping[str, Any]] = None
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Checks the rules whose inputs are all in `data`, reporting every rule that fails at once.
+        With the `patch` merged into `data`, only the rules reading fields of both are checked:
+        the ones reading fields of `patch` only were checked with the request's body.
+        """
+        failed: Dict[str, List[str]] = {}
+        for rule in self.rules:
+            if not rule.inputs.issubset(data):
+                continue
+            if patch is not None and (rule.inputs.isdisjoint(patch) or rule.inputs.issubset(patch)):
+                continue
+            if not rule.check(data):
+                failed.setdefault(rule.field, []).append(rule.message)
+        if failed:
+            return "Some fields' values are not valid", {"failed_validations": failed}
+        return None
+
+
+def get_bounds_check(
+    field: ResourceFieldConfig,
+) -> Optional[Callable[[Any], Optional[Tuple[str, Dict[str, Any]]]]]:
+    """
+    Gets the check of the field's min/max and min/max length, `None` if it has none
+    """
+    minimum, maximum, max_length = field.minimum, field.maximum, field.max_length
+    min_length = field.min_length
+    # If we don't allow empty values, the min length is at least one.
+    if not field.allow_empty and (field.type == "string" or field.multiple):
+        min_length = max(min_length or 0, 1)
+    has_bounds = minimum is not None or maximum is not None
+    has_length = min_length is not None or max_length is not None
+    if not has_bounds and not has_length:
+        return None
+
+    def check_bounds(value: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if has_bounds and not validate_max_min(value, minimum, maximum):
             return (
-                f"`{name}` is out of bounds",
+                f"`{field.name}` is out of bounds",
                 {
                     "actual_value": value,
-                    "minimum_value": field.minimum,
-                    "maximum_value": field.maximum,
+                    "minimum_value": minimum,
+                    "maximum_value": maximum,
                 },
             )
-        # If we don't allow empty values, the min length is one.
-        if not field.allow_empty and (field.type in ("string") or field.multiple):
-            field = field._replace(min_length=1)
-        if field.min_length is not None or field.max_length is not None:
-            log.debug(
-                "    Checking for length of {0}: len({1}) ∈ [{2}, {3}]",
-                repr(value),
-                name,
-                (field.min_length if field.min_length is not None else "-∞"),
-                (field.max_length if field.max_length is not None else "+∞"),
-            )
-        if not validate_max_min_length(value, field.min_length, field.max_length):
+        if has_length and not validate_max_min_length(value, min_length, max_length):
             return (
-                f"`{name}` is either too long or too short",
+                f"`{field.name}` is either too long or too short",
                 {
                     "actual_length": len(value),
-                    "minimum_length": (field.min_length or 0),
-                    "maximum_length": field.max_length,
+                    "minimum_length": (min_length or 0),
+                    "maximum_length": max_length,
                 },
             )
+        return None
 
-    # 6. Check
-
-    return None
+    return check_bounds
 
 
 def validate_type(value: Any, correct_type: str) -> bool:
+    return get_type_check(correct_type)(value)
+
+
+@lru_cache(maxsize=None)
+def get_type_check(correct_type: str) -> Callable[[Any], bool]:
+    """
+    Gets the function checking that a value is of type `correct_type`
+    """
     # `number`s can be `float`s or `int`s but are stored as `float`s.
-    if correct_type == "number" and type(value) is int:
-        value = float(value)
+    if correct_type == "number":
+        return lambda value: type(value) is float or type(value) is int
 
     # For types bound to native python types, its just a matter of checking `value`'s `type()`
     if correct_type in NATIVE_TYPES_MAPPING.values():
-        return type(value) is swap_keys_and_values(NATIVE_TYPES_MAPPING)[correct_type]
+        native_type = swap_keys_and_values(NATIVE_TYPES_MAPPING)[correct_type]
+        return lambda value: type(value) is native_type
 
     # Datetime checking: ISO-8601
-    if correct_type in ("date", "datetime", "time"):
-        PATTERNS = {
-            "date": "YYYY-MM-DDZZ",
-            "time": "HH:mm:ssZZ",
-            "datetime": "YYYY-MM-DD[T]HH:mm:ssZZ",
-        }
-        try:
-            arrow.get(value, PATTERNS[correct_type])
-            return True
-        except arrow.parser.ParserError:
-            return False
+    if correct_type in iso8601.CHECKS:
+        return iso8601.CHECKS[correct_type]
+
+    # Relations are stored as the referenced document's ID
+    if get_relation_target(correct_type):
+        return lambda value: type(value) is str
 
     if correct_type == "slug":
-        log.debug('    ' * 2 + 'Slugified value: {}', f'{slugify(value)!r}')
-        return type(value) is str and slugify(value) == value
+        return lambda value: type(value) is str and slugify(value) == value
+
+    def check_unknown(value: Any) -> bool:
+        raise ValueError(f"Can't check for unknown type {correct_type!r}.")
 
-    raise ValueError(f"Can't check for unknown type {correct_type!r}.")
+    return check_unknown
 
 
 Number = Union[int, float]
@@ -0,0 +1,56 @@
+from typing import *
+from restapiboys import database, log
+from restapiboys.http import Request
+import pytest
+
+
+def make_request(
+    query: Optional[Dict[str, str]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    body: Union[bytes, str] = "",
+    method: str = "GET",
+    route: str = "/homework",
+) -> Request:
+    """
+    Builds a request as the servers would, `headers` are put in the WSGI environ
+    """
+    return Request(
+        route=route,
+        is_ssl=False,
+        method=method,
+        query=query or {},
+        scheme="http",
+        host="localhost",
+        gunicorn_env={
+            "HTTP_" + name.upper().replace("-", "_"): value
+            for name, value in (headers or {}).items()
+        },
+        client=None,
+        body=body,
+    )
+
+
+@pytest.fixture
+def round_trips(monkeypatch) -> List[Tuple[str, str]]:
+    """
+    Records the (method, url) of every request made to CouchDB
+    """
+    calls = []
+    request = database.CouchClient.request
+
+    def recording_request(self, method, url, *args, **kwargs):
+        calls.append((method, url))
+        return request(self, method, url, *args, **kwargs)
+
+    monkeypatch.setattr(database.CouchClient, "request", recording_request)
+    return calls
+
+
+@pytest.hookimpl(hookwrapper=True, trylast=True)
+def pytest_runtest_call(item):
+    """
+    Writes the lines logged by a test while its output is still captured
+    (trylast: inside the capture plugin's wrapper)
+    """
+    yield
+    log.flush()
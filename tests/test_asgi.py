@@ -0,0 +1,148 @@
+from typing import *
+from http import HTTPStatus
+from tests import test_server
+from uuid import uuid4
+import asyncio
+import json
+import pytest
+
+httpx = pytest.importorskip("httpx")
+from restapiboys import asgi, async_database, couchdb, database
+from restapiboys.asgi import application
+from restapiboys.http import PayloadTooLargeError
+
+
+def request(method: str, path: str, body: Any = None) -> Tuple[str, Any]:
+    status, _, body = request_with_headers(method, path, body)
+    return status, body
+
+
+def request_with_headers(
+    method: str,
+    path: str,
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    decode: bool = True,
+) -> Tuple[str, Dict[str, str], Any]:
+    body_bytes = json.dumps(body).encode("utf-8") if body is not None else b""
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string.encode("latin-1"),
+        "scheme": "http",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"content-length", str(len(body_bytes)).encode("latin-1")),
+            *[(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items()],
+        ],
+    }
+    # The body is sent in two messages
+    messages = [
+        {"type": "http.request", "body": body_bytes[:5], "more_body": True},
+        {"type": "http.request", "body": body_bytes[5:], "more_body": False},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async def call():
+        try:
+            await application(scope, receive, send)
+        finally:
+            # The client is bound to the event loop of this call
+            await async_database.close_client()
+
+    asyncio.run(call())
+    start = sent[0]
+    status = f"{start['status']} {HTTPStatus(start['status']).phrase}"
+    response_headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in start["headers"]}
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    if not decode:
+        return status, response_headers, body
+    return status, response_headers, json.loads(body) if body else None
+
+
+@pytest.fixture
+def round_trips(monkeypatch) -> List[Tuple[str, str]]:
+    """
+    Records the (method, url) of every request made to CouchDB by the ASGI application
+    """
+    calls = []
+    request = async_database.AsyncCouchClient.request
+
+    async def recording_request(self, method, url, *args, **kwargs):
+        calls.append((method, url))
+        return await request(self, method, url, *args, **kwargs)
+
+    monkeypatch.setattr(async_database.AsyncCouchClient, "request", recording_request)
+    return calls
+
+
+class Test(test_server.Test):
+    request = staticmethod(request)
+    request_with_headers = staticmethod(request_with_headers)
+
+    def test_concurrent_operations(self, round_trips):
+        created = database.create_item("subjects", uuid4(), {"name": "Maths"})
+
+        def operation():
+            return (yield couchdb.Concurrently([
+                couchdb.read_items("subjects", [created["_id"]]),
+                couchdb.get_rev("subjects", created["_id"]),
+            ]))
+
+        async def call():
+            try:
+                return await async_database.run(operation())
+            finally:
+                await async_database.close_client()
+
+        assert asyncio.run(call()) == [{created["_id"]: created}, created["_rev"]]
+        # the document was created with the synchronous client
+        assert len(round_trips) == 2
+
+    def test_lifespan(self):
+        received = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(application({"type": "lifespan"}, receive, send))
+        assert [message["type"] for message in sent] == [
+            "lifespan.startup.complete",
+            "lifespan.shutdown.complete",
+        ]
+
+
+def read_body(body: bytes, content_length: Optional[int], max_size: Optional[int]) -> bytes:
+    headers = [(b"content-length", str(content_length).encode("latin-1"))] if content_length is not None else []
+    messages = [
+        {"type": "http.request", "body": body[:5], "more_body": True},
+        {"type": "http.request", "body": body[5:], "more_body": False},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    return asyncio.run(asgi.read_body({"type": "http", "headers": headers}, receive, max_size))
+
+
+@pytest.mark.parametrize("content_length", [11, None])
+def test_request_body_too_large(content_length):
+    with pytest.raises(PayloadTooLargeError):
+        read_body(b"x" * 11, content_length, 10)
+
+
+@pytest.mark.parametrize("content_length", [11, None])
+def test_request_body_size_is_not_limited_without_max_size(content_length):
+    assert read_body(b"x" * 11, content_length, None) == b"x" * 11
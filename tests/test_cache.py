@@ -0,0 +1,131 @@
+from restapiboys import couchdb, database
+from restapiboys.cache import ChangesFollower, DocumentCache
+from restapiboys.config import CacheConfig, get_api_config, get_db_credentials
+from uuid import uuid4
+import os
+import threading
+import time
+
+
+def make_cache(**overrides) -> DocumentCache:
+    config = get_api_config().database
+    return DocumentCache(
+        CacheConfig(enabled=True, **overrides),
+        lambda: database.CouchClient(config, get_db_credentials()),
+    )
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = make_cache(max_entries=2)
+    cache.set("db", "a", {"_id": "a"}, 10)
+    cache.set("db", "b", {"_id": "b"}, 10)
+    cache.get("db", "a")
+    cache.set("db", "c", {"_id": "c"}, 10)
+    assert cache.get("db", "b") is None
+    assert cache.get("db", "a") == {"_id": "a"}
+    assert cache.stats.as_dict() == {"hits": 2, "misses": 1, "evictions": 1, "invalidations": 0}
+
+
+def test_size_is_bounded():
+    cache = make_cache(max_bytes=25)
+    cache.set("db", "a", {}, 10)
+    cache.set("db", "b", {}, 10)
+    cache.set("db", "c", {}, 10)
+    assert cache.size == 20
+    assert cache.get("db", "a") is None
+
+
+def test_entries_expire():
+    cache = make_cache(ttl=0)
+    cache.set("db", "a", {}, 10)
+    assert cache.get("db", "a") is None
+
+
+def test_invalidating_a_document_keeps_the_others():
+    cache = make_cache()
+    cache.set("db", "a", {}, 10)
+    cache.set("db", "b", {}, 10)
+    cache.invalidate("db", "a")
+    assert list(cache.entries) == [("db", "b")]
+    assert cache.stats.invalidations == 1
+
+
+def test_documents_invalidated_while_read_are_not_cached():
+    cache = make_cache()
+    generation = cache.get_generation("db")
+    # Reported by the _changes feed while "a" was being read
+    cache.invalidate("db", "a")
+    cache.set("db", "a", {"_id": "a"}, 10, generation)
+    assert not cache.entries
+    cache.set("db", "a", {"_id": "a"}, 10, cache.get_generation("db"))
+    assert list(cache.entries) == [("db", "a")]
+
+
+class Test:
+    def setup_method(self, test_method):
+        database.create_database("subjects")
+
+    def teardown_method(self, test_method):
+        database.delete_database("subjects")
+
+    def test_changes_invalidate_cached_documents(self, monkeypatch):
+        cache = make_cache()
+        monkeypatch.setattr(couchdb, "_cache", cache)
+        monkeypatch.setattr(couchdb, "_cache_pid", os.getpid())
+        item = database.create_item("subjects", uuid4(), {"name": "Maths"})
+        database.read_item("subjects", item["_id"])
+        assert cache.followers["subjects"].ready.wait(5)
+        database.read_item("subjects", item["_id"])
+        assert database.read_item("subjects", item["_id"])["name"] == "Maths"
+        assert cache.stats.hits == 1
+        # Written by someone else: only the _changes feed can tell
+        database.get_client().request(
+            "PUT", f"subjects/{item['_id']}", {**item, "name": "Physics"}
+        )
+        deadline = time.monotonic() + 5
+        while cache.entries and time.monotonic() < deadline:
+            time.sleep(0.05)
+        cache.stop()
+        assert database.read_item("subjects", item["_id"])["name"] == "Physics"
+
+    def test_documents_are_not_cached_before_changes_are_followed(self, monkeypatch):
+        cache = make_cache()
+        monkeypatch.setattr(couchdb, "_cache", cache)
+        monkeypatch.setattr(couchdb, "_cache_pid", os.getpid())
+        update_seq_fetched = threading.Event()
+        get_update_seq = ChangesFollower.get_update_seq
+
+        def slow_get_update_seq(follower):
+            update_seq_fetched.wait(5)
+            return get_update_seq(follower)
+
+        monkeypatch.setattr(ChangesFollower, "get_update_seq", slow_get_update_seq)
+        item = database.create_item("subjects", uuid4(), {"name": "Maths"})
+        # Reading doesn't wait for the follower to get the current sequence
+        assert database.read_item("subjects", item["_id"])["name"] == "Maths"
+        assert not cache.entries
+        update_seq_fetched.set()
+        assert cache.followers["subjects"].ready.wait(5)
+        database.read_item("subjects", item["_id"])
+        cache.stop()
+        assert list(cache.entries) == [("subjects", item["_id"])]
+
+    def test_change_reported_during_a_read_is_not_cached_over(self, monkeypatch):
+        cache = make_cache()
+        monkeypatch.setattr(couchdb, "_cache", cache)
+        monkeypatch.setattr(couchdb, "_cache_pid", os.getpid())
+        item = database.create_item("subjects", uuid4(), {"name": "Maths"})
+        database.read_item("subjects", item["_id"])
+        assert cache.followers["subjects"].ready.wait(5)
+        request = database.CouchClient.request
+
+        def request_then_invalidate(self, method, url, *args, **kwargs):
+            res = request(self, method, url, *args, **kwargs)
+            # The follower reports a change after CouchDB answered, before the document is cached
+            cache.invalidate("subjects", item["_id"])
+            return res
+
+        monkeypatch.setattr(database.CouchClient, "request", request_then_invalidate)
+        database.read_item("subjects", item["_id"])
+        cache.stop()
+        assert not cache.entries
@@ -0,0 +1,52 @@
+from restapiboys import compression
+from restapiboys.config import CompressionConfig
+from restapiboys.http import Response, StatusCode, stream_json_array
+import gzip
+import json
+import pytest
+from tests.conftest import make_request
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip, deflate", "gzip"),
+        ("deflate", None),
+        ("gzip;q=0", None),
+        ("*", "zstd"),
+        ("gzip;q=1, zstd;q=0.5", "gzip"),
+        ("gzip, zstd", "zstd"),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(header, expected):
+    assert compression.negotiate_encoding(header, ["zstd", "gzip"]) == expected
+
+
+def test_small_responses_are_not_compressed():
+    res = Response(StatusCode.OK, {}, {"a": 1})
+    req = make_request(headers={"Accept-Encoding": "gzip"})
+    res = compression.compress_response(req, res, CompressionConfig())
+    assert "Content-Encoding" not in dict(res.headers)
+
+
+def test_compressed_response():
+    items = [{"title": f"Homework {i}"} for i in range(1000)]
+    res = Response(StatusCode.OK, {}, items, etag="1-abc")
+    req = make_request(headers={"Accept-Encoding": "gzip"})
+    res = compression.compress_response(req, res, CompressionConfig())
+    headers = dict(res.headers)
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Content-Length"] == str(len(res.body))
+    assert headers["ETag"] == 'W/"1-abc"'
+    assert json.loads(gzip.decompress(res.body)) == items
+
+
+def test_compressed_stream():
+    items = [{"title": f"Homework {i}"} for i in range(10000)]
+    res = Response(StatusCode.OK, {}, stream_json_array(iter(items)))
+    req = make_request(headers={"Accept-Encoding": "gzip"})
+    res = compression.compress_response(req, res, CompressionConfig())
+    chunks = list(res.body)
+    assert len(chunks) > 1
+    assert json.loads(gzip.decompress(b"".join(chunks))) == items
@@ -0,0 +1,6 @@
+from restapiboys.config import MetricsConfig, get_api_config
+
+
+def test_api_config_is_parsed_once():
+    assert get_api_config() is get_api_config()
+    assert get_api_config().metrics == MetricsConfig(enabled=True, server_timing=True)
@@ -1,5 +1,22 @@
 from uuid import uuid4
-from restapiboys import database
+from restapiboys import couchdb, database
+
+def test_parse_all_docs_header():
+    assert database.parse_all_docs_header(b'{"total_rows":2,"offset":0,"update_seq":"2-a","rows":[\r') == {
+        "total_rows": 2, "offset": 0, "update_seq": "2-a", "rows": []
+    }
+    assert database.parse_all_docs_header(b'{"id":"a","key":"a","value":{},"doc":{"_id":"a"}},') is None
+
+
+def test_parse_all_docs_line():
+    assert database.parse_all_docs_line(b'{"total_rows":2,"offset":0,"rows":[') is None
+    assert database.parse_all_docs_line(b'{"id":"a","key":"a","value":{},"doc":{"_id":"a"}},\r') == {
+        "id": "a", "key": "a", "value": {}, "doc": {"_id": "a"}
+    }
+    assert database.parse_all_docs_line(b']}') is None
+    assert database.parse_all_docs_line(b'') is None
+    assert database.parse_all_docs_line(b'{"id":"_design/a","key":"_design/a","value":{},"doc":{}},') is None
+
 
 def test_create_delete_database():
     assert database.create_database('john')
@@ -27,3 +44,53 @@ class Test:
         item = database.read_item('john', uuid)
         assert item['lorem'] == 'ipsum'
         assert item['_id'] == str(uuid)
+
+    def test_stream_items(self):
+        for _ in range(3):
+            database.create_item('john', uuid4(), dict(lorem='ipsum'))
+        stream = database.stream_items('john')
+        assert stream.update_seq == database.get_update_seq('john')
+        assert [item['lorem'] for item in stream.docs] == ['ipsum'] * 3
+
+    def test_create_item_round_trips(self, round_trips):
+        item = database.create_item('john', uuid4(), dict(lorem='ipsum'))
+        assert item['lorem'] == 'ipsum'
+        assert item['_rev']
+        assert len(round_trips) == 1
+
+    def test_update_item_round_trips(self, round_trips):
+        uuid = uuid4()
+        created = database.create_item('john', uuid, dict(lorem='ipsum'))
+        item = database.update_item('john', uuid, dict(lorem='dolor'), rev=created['_rev'])
+        assert item['lorem'] == 'dolor'
+        assert item['_rev'] != created['_rev']
+        assert database.read_item('john', uuid) == item
+        # create, update, read
+        assert len(round_trips) == 3
+
+    def test_delete_item_round_trips(self, round_trips):
+        uuid = uuid4()
+        created = database.create_item('john', uuid, dict(lorem='ipsum'))
+        assert database.delete_item('john', uuid, rev=created['_rev'])
+        assert len(round_trips) == 2
+
+    def test_concurrent_operations(self, round_trips):
+        created = database.create_item('john', uuid4(), dict(lorem='ipsum'))
+
+        def operation():
+            return (yield couchdb.Concurrently([
+                couchdb.read_items('john', [created['_id']]),
+                couchdb.get_rev('john', created['_id']),
+            ]))
+
+        assert database.run(operation()) == [{created['_id']: created}, created['_rev']]
+        assert len(round_trips) == 3
+
+    def test_design_documents_are_not_listed(self):
+        # Creates the design document _design/restapiboys-filters
+        assert database.create_index('john', {'index': {'fields': ['lorem']}, 'ddoc': 'restapiboys-filters', 'name': 'lorem'})
+        created = database.create_item('john', uuid4(), dict(lorem='ipsum'))
+        assert database.list_items('john') == [created]
+        assert list(database.stream_items('john').docs) == [created]
+        assert database.list_page('john', 10)[:2] == ([created], None)
+        assert database.read_items('john', ['_design/restapiboys-filters']) == {}
@@ -0,0 +1,97 @@
+from restapiboys import endpoints
+from restapiboys.fields import ResourceFieldConfigError
+import pytest
+
+
+def test_registry_indexes():
+    registry = endpoints.EndpointRegistry.build()
+    homework = registry.by_route["/homework"]
+    assert registry.by_identifier["homework"] is homework
+    assert registry.by_python_identifier["schedule_mutations"].route == "/schedule-mutations"
+    assert "/homework" in registry.routes
+
+
+def test_registry_inherits_default_fields():
+    registry = endpoints.EndpointRegistry.build()
+    for resource in registry.resources:
+        field_names = [f.name for f in resource.fields]
+        assert "created_at" in field_names
+        assert "updated_at" in field_names
+
+
+def test_registry_resolves_custom_types():
+    registry = endpoints.EndpointRegistry.build()
+    field_names = [f.name for f in registry.by_route["/settings"].fields]
+    assert "year_layout.start" in field_names
+    assert "year_layout.end" in field_names
+
+
+def test_get_registry_is_built_once():
+    assert endpoints.get_registry() is endpoints.get_registry()
+
+
+def computed_resource(**computations) -> endpoints.ResourceConfig:
+    return endpoints.ResourceConfig(
+        route="/test",
+        identifier="test",
+        python_identifier="test",
+        fields=[
+            endpoints.ResourceFieldConfig(name="name", type="string"),
+            *[
+                endpoints.ResourceFieldConfig(name=name, type="string", computed=True, computation=computation)
+                for name, computation in computations.items()
+            ],
+        ],
+    )
+
+
+def test_computed_fields_sorted_by_dependencies():
+    resource = computed_resource(
+        title={"react": "slug", "set": "slug.upper()"},
+        slug={"react": "name", "set": "slugify(name)"},
+        edited={"react": "*", "set": True, "if": ["name != slug"]},
+    )
+    computations = endpoints.ResourceComputations(resource)
+    assert [c.field.name for c in computations.computed] == ["slug", "title", "edited"]
+    stored = {"name": "Maths", "slug": "maths", "title": "MATHS"}
+    assert endpoints.add_computed_values_to_request_data(resource, {"name": "Physique chimie"}, stored) == {
+        "name": "Physique chimie",
+        "slug": "physique-chimie",
+        "title": "PHYSIQUE-CHIMIE",
+        "edited": True,
+    }
+    # nothing changed, nothing is computed
+    assert endpoints.add_computed_values_to_request_data(resource, {"name": "Maths"}, stored) == {"name": "Maths"}
+
+
+def test_datetimes_are_stored_in_utc():
+    resource = endpoints.ResourceConfig(
+        route="/test",
+        identifier="test",
+        python_identifier="test",
+        fields=[
+            endpoints.ResourceFieldConfig(name="due_at", type="datetime"),
+            endpoints.ResourceFieldConfig(name="reminders", type="datetime", multiple=True),
+            endpoints.ResourceFieldConfig(
+                name="completed_at",
+                type="datetime",
+                computed=True,
+                computation={"react": "due_at", "set": "'2026-03-01+01:00'"},
+            ),
+        ],
+    )
+    data = {"due_at": "2026-03-01T08:00:00+01:00", "reminders": ["2026-02-28T20:00:00-05:00"]}
+    assert endpoints.add_computed_values_to_request_data(resource, data, {}) == {
+        "due_at": "2026-03-01T07:00:00Z",
+        "reminders": ["2026-03-01T01:00:00Z"],
+        "completed_at": "2026-02-28T23:00:00Z",
+    }
+
+
+def test_computed_fields_cycle():
+    resource = computed_resource(
+        a={"react": "b", "set": "b"},
+        b={"react": "a", "set": "a"},
+    )
+    with pytest.raises(ResourceFieldConfigError):
+        endpoints.ResourceComputations(resource)
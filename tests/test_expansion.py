@@ -0,0 +1,43 @@
+from restapiboys import expansion
+from restapiboys.endpoints import get_resource_config_of_route
+from tests.conftest import make_request
+import pytest
+
+
+def get_expansions(expand):
+    return expansion.get_expansions(make_request({"expand": expand}), get_resource_config_of_route("/homework"))
+
+
+def test_relation_targets():
+    subject, notes = get_expansions("subject,notes")
+    assert subject.resource.identifier == "subjects"
+    # <note>[] points to /notes/
+    assert notes.resource.identifier == "notes"
+
+
+@pytest.mark.parametrize("expand", ["title", "nope"])
+def test_invalid_expansions(expand):
+    with pytest.raises(expansion.ExpansionError):
+        get_expansions(expand)
+
+
+def test_references_are_collected_once_per_database():
+    expansions = get_expansions("subject,notes")
+    items = [
+        {"subject": "s1", "notes": ["n1", "n2"]},
+        {"subject": "s1", "notes": []},
+        {"subject": "s2"},
+    ]
+    assert expansion.collect_references(items, expansions) == {
+        "subjects": ["s1", "s2"],
+        "notes": ["n1", "n2"],
+    }
+
+
+def test_inline_references():
+    expansions = get_expansions("subject,notes")
+    items = [{"subject": "s1", "notes": ["n1", "missing"]}]
+    documents = {"subjects": {"s1": {"_id": "s1"}}, "notes": {"n1": {"_id": "n1"}}}
+    assert expansion.inline_references(items, expansions, documents) == [
+        {"subject": {"_id": "s1"}, "notes": [{"_id": "n1"}, "missing"]}
+    ]
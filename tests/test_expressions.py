@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+from restapiboys.expressions import Expression, ExpressionError
+import pytest
+
+
+def test_helpers():
+    # functions/utils.py and functions/validators.py
+    assert Expression("is_url('https://example.com') and is_valid_hex_color('#ff0000')").evaluate({})
+    assert Expression("slugify(name)").evaluate({"name": "Maths Avancées"}) == "maths-avancees"
+    # the document's values take precedence
+    assert Expression("now").evaluate({"now": 1}) == 1
+
+
+def test_syntax_error():
+    with pytest.raises(ExpressionError):
+        Expression("slugify(name", "subjects.slug")
+
+
+def test_concurrent_evaluations():
+    expression = Expression("slugify(name) + '-' + str(weight)")
+    with ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(lambda i: expression.evaluate({"name": f"Subject {i}", "weight": i}), range(2000))
+        )
+    assert results == [f"subject-{i}-{i}" for i in range(2000)]
@@ -0,0 +1,89 @@
+from restapiboys import filtering
+from restapiboys.endpoints import get_resource_config_of_route
+from tests.conftest import make_request
+import pytest
+
+
+def find_query(query):
+    resource = get_resource_config_of_route("/homework")
+    return filtering.get_find_query(make_request(query), resource)
+
+
+def test_no_filters():
+    assert find_query({"limit": "10"}) is None
+
+
+def test_filters_and_sort():
+    query = find_query(
+        {"type": "test", "due_at__gte": "2026-01-01T00:00:00+00:00", "sort": "-due_at"}
+    )
+    assert query.selector == {
+        "type": {"$eq": "test"},
+        "due_at": {"$gte": "2026-01-01T00:00:00Z"},
+    }
+    assert query.sort == [{"due_at": "desc"}]
+
+
+def test_datetime_bounds_are_converted_to_utc():
+    query = find_query({"due_at__gte": "2026-01-01+01:00", "due_at__lt": "2026-01-02T08:00:00-05:00"})
+    assert query.selector == {
+        "due_at": {"$gte": "2025-12-31T23:00:00Z", "$lt": "2026-01-02T13:00:00Z"},
+    }
+
+
+def test_datetime_bounds_without_offset_are_in_utc():
+    query = find_query({"type": "test", "due_at__gte": "2026-01-01", "sort": "-due_at"})
+    assert query.selector == {
+        "type": {"$eq": "test"},
+        "due_at": {"$gte": "2026-01-01T00:00:00Z"},
+    }
+    query = find_query({"due_at__lt": "2026-01-01T08:00:00"})
+    assert query.selector == {"due_at": {"$lt": "2026-01-01T08:00:00Z"}}
+
+
+def test_sorted_field_is_added_to_selector():
+    query = find_query({"sort": "due_at"})
+    assert query.selector == {"due_at": {"$gt": None}}
+
+
+def test_in_operator():
+    query = find_query({"type__in": "test,exercise"})
+    assert query.selector == {"type": {"$in": ["test", "exercise"]}}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"title": "lorem"},  # not filterable
+        {"nope": "lorem"},  # unknown field
+        {"type__like": "test"},  # unknown operator
+        {"due_at": "tomorrow"},  # wrong type
+        {"sort": "title"},
+    ],
+)
+def test_invalid_filters(query):
+    with pytest.raises(filtering.FilterError):
+        find_query(query)
+
+
+def test_index_definitions():
+    resource = get_resource_config_of_route("/homework")
+    indexed = [d["index"]["fields"] for d in filtering.get_index_definitions(resource)]
+    assert indexed == [["subject"], ["type"], ["due_at"]]
+
+
+def test_projection():
+    query = find_query({"fields": "due_at,subject"})
+    assert query.selector == {"_id": {"$gt": None}}
+    assert query.fields == ["_id", "_rev", "due_at", "subject"]
+
+
+def test_projection_of_flattened_fields():
+    resource = get_resource_config_of_route("/schedule-mutations")
+    fields = filtering.get_projection(make_request({"fields": "deleted_in,added_in.end"}), resource)
+    assert fields == ["_id", "_rev", "deleted_in\\.start", "deleted_in\\.end", "added_in\\.end"]
+
+
+def test_projection_of_unknown_field():
+    with pytest.raises(filtering.FilterError):
+        find_query({"fields": "due_at,nope"})
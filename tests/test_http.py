@@ -0,0 +1,73 @@
+from typing import *
+from restapiboys import codec, http
+import io
+import json
+import pytest
+from tests.conftest import make_request
+
+
+def test_stream_json_array():
+    items = [{"index": i, "text": "lorem ipsum" * 100} for i in range(500)]
+    chunks = list(http.stream_json_array(iter(items)))
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == items
+
+
+def test_stream_json_array_empty():
+    assert b"".join(http.stream_json_array(iter([]))) == b"[]"
+
+
+def test_streamed_response_has_no_content_length():
+    res = http.Response(http.StatusCode.OK, {}, http.stream_json_array(iter([])))
+    assert res.is_streamed
+    assert "Content-Length" not in dict(res.headers)
+
+
+def test_request_json_is_parsed_once():
+    req = make_request(method="POST", body='{"title": "Révisions"}'.encode("utf-8"))
+    assert req.json == {"title": "Révisions"}
+    assert req.json is req.json
+
+
+def test_request_json_malformed():
+    with pytest.raises(codec.DecodeError):
+        make_request(method="POST", body=b"{").json
+
+
+def test_request_json_empty():
+    assert make_request(method="POST", body=b"").json is None
+
+
+def make_environ(body: bytes, content_length: Optional[int]) -> Dict[str, Any]:
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": "/homework/",
+        "QUERY_STRING": "limit=10&sort=-due_at",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "HTTP_HOST": "localhost",
+        "HTTP_USER_AGENT": "Mozilla/5.0 (X11; Linux x86_64; rv:75.0) Gecko/20100101 Firefox/75.0",
+    }
+    if content_length is not None:
+        environ["CONTENT_LENGTH"] = str(content_length)
+    return environ
+
+
+def test_request_from_environ_is_lazy():
+    req = http.Request.from_gunicorn_environ(make_environ(b"{}", 2))
+    assert req.route == "/homework"
+    assert req._query is http._NOT_PARSED and req._client is http._NOT_PARSED
+    assert req.query == {"limit": "10", "sort": "-due_at"}
+    assert req.client.browser.name == "Firefox"
+
+
+@pytest.mark.parametrize("content_length", [11, None])
+def test_request_body_too_large(content_length):
+    with pytest.raises(http.PayloadTooLargeError):
+        http.Request.from_gunicorn_environ(make_environ(b"x" * 11, content_length), 10)
+
+
+@pytest.mark.parametrize("content_length", [10, None])
+def test_request_body_is_read_up_to_its_length(content_length):
+    req = http.Request.from_gunicorn_environ(make_environ(b"x" * 10, content_length), 10)
+    assert req.body == b"x" * 10
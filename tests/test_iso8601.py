@@ -0,0 +1,114 @@
+from restapiboys import iso8601
+from restapiboys.validation import validate_type
+import pytest
+
+CONFORMANCE = [
+    # Dates
+    ("date", "2026-03-01Z", True),
+    ("date", "2026-03-01+01:00", True),
+    ("date", "2026-03-01-05:30", True),
+    ("date", "2026-03-01+01", True),
+    ("date", "2026-03-01-00", True),
+    ("date", "2026-03-01+23:59", True),
+    ("date", "0001-01-01Z", True),
+    ("date", "9999-12-31Z", True),
+    ("date", "2026-01-31Z", True),
+    ("date", "2026-04-30Z", True),
+    ("date", "2024-02-29Z", True),
+    ("date", "2000-02-29Z", True),
+    ("date", "2026-03-01", False),  # no offset
+    ("date", "2026-3-1Z", False),
+    ("date", "20260301Z", False),
+    ("date", "2026/03/01Z", False),
+    ("date", "0000-01-01Z", False),
+    ("date", "2026-00-01Z", False),
+    ("date", "2026-13-01Z", False),
+    ("date", "2026-03-00Z", False),
+    ("date", "2026-03-32Z", False),
+    ("date", "2026-04-31Z", False),
+    ("date", "2026-02-30Z", False),
+    ("date", "2023-02-29Z", False),
+    ("date", "1900-02-29Z", False),
+    ("date", "2026-03-01z", False),
+    ("date", "2026-03-01ZZ", False),
+    ("date", "2026-03-01+01:00Z", False),
+    ("date", "2026-03-01+0100", False),
+    ("date", "2026-03-01+1", False),
+    ("date", "2026-03-01+01:", False),
+    ("date", "2026-03-01+01:0", False),
+    ("date", "2026-03-01+24:00", False),
+    ("date", "2026-03-01+14:60", False),
+    ("date", "2026-03-0101:00", False),
+    ("date", "2026-03-01T08:00:00Z", False),
+    ("date", " 2026-03-01Z", False),
+    ("date", "2026-03-01Z\n", False),
+    ("date", "２026-03-01Z", False),  # non-ASCII digits
+    ("date", "", False),
+    # Times
+    ("time", "08:00:00Z", True),
+    ("time", "08:00:00+01:00", True),
+    ("time", "08:00:00+01", True),
+    ("time", "00:00:00-23:59", True),
+    ("time", "23:59:59Z", True),
+    ("time", "24:00:00Z", True),
+    ("time", "08:00:00", False),
+    ("time", "8:00:00Z", False),
+    ("time", "08:00Z", False),
+    ("time", "08:00:00.123Z", False),
+    ("time", "24:00:01Z", False),
+    ("time", "25:00:00Z", False),
+    ("time", "08:60:00Z", False),
+    ("time", "23:59:60Z", False),
+    ("time", "08:00:00 +01:00", False),
+    ("time", "08:00:00−01:00", False),  # minus sign
+    ("time", "08:00:00+0100", False),
+    # Datetimes
+    ("datetime", "2026-03-01T08:00:00+01:00", True),
+    ("datetime", "2026-03-01T08:00:00Z", True),
+    ("datetime", "2026-03-01T08:00:00-00:00", True),
+    ("datetime", "2026-03-01T08:00:00+01", True),
+    ("datetime", "2026-03-01t08:00:00Z", True),
+    ("datetime", "2026-03-01T24:00:00Z", True),
+    ("datetime", "2024-02-29T12:00:00Z", True),
+    ("datetime", "2026-03-01T08:00:00", False),
+    ("datetime", "2026-03-01 08:00:00Z", False),
+    ("datetime", "2026-03-01T08:00Z", False),
+    ("datetime", "2026-03-01T08:00:00.123+01:00", False),
+    ("datetime", "2026-03-01T08:00:00+0100", False),
+    ("datetime", "2026-03-01T08:00:00+01:00:00", False),
+    ("datetime", "2026-03-01T25:00:00Z", False),
+    ("datetime", "2026-03-01T08:00:60Z", False),
+    ("datetime", "2023-02-29T12:00:00Z", False),
+    ("datetime", "0000-03-01T08:00:00Z", False),
+    ("datetime", "2026-03-01Z", False),
+    ("datetime", "08:00:00Z", False),
+]
+
+
+@pytest.mark.parametrize("type_name,value,valid", CONFORMANCE)
+def test_conformance(type_name, value, valid):
+    assert iso8601.CHECKS[type_name](value) is valid
+    assert validate_type(value, type_name) is valid
+
+
+@pytest.mark.parametrize("value", [None, 20260301, 1.5, ["2026-03-01Z"], b"2026-03-01Z"])
+def test_not_a_string(value):
+    assert not any(check(value) for check in iso8601.CHECKS.values())
+
+
+@pytest.mark.parametrize(
+    "value,utc",
+    [
+        ("2026-03-01T08:00:00+01:00", "2026-03-01T07:00:00Z"),
+        ("2026-03-01T08:00:00Z", "2026-03-01T08:00:00Z"),
+        ("2026-03-01t20:00:00-05:30", "2026-03-02T01:30:00Z"),
+        ("2026-03-01T24:00:00+01", "2026-03-01T23:00:00Z"),
+        ("2026-03-01+01:00", "2026-02-28T23:00:00Z"),
+        ("2026-03-01Z", "2026-03-01T00:00:00Z"),
+        ("0001-01-01T00:00:00+01:00", "0001-01-01T00:00:00+01:00"),
+        ("2026-03-01T08:00:00", "2026-03-01T08:00:00"),
+        (None, None),
+    ],
+)
+def test_to_utc(value, utc):
+    assert iso8601.to_utc(value) == utc
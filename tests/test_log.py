@@ -0,0 +1,31 @@
+from restapiboys import log
+import json
+
+
+class Test:
+    def setup_method(self, test_method):
+        self.level, self.output_format = log.level, log.output_format
+
+    def teardown_method(self, test_method):
+        log.set_level(self.level)
+        log.set_format(self.output_format)
+
+    def test_level_checked_before_formatting(self, capsys):
+        calls = []
+        log.set_level("INFO")
+        log.debug("Payload: {}", log.lazy(calls.append, "computed"))
+        log.flush()
+        assert calls == []
+        assert capsys.readouterr().out == ""
+
+    def test_json_lines(self, capsys):
+        log.set_level("DEBUG")
+        log.set_format("json")
+        log.debug("Route {0} resolved to {1}", "/subjects", log.lazy(lambda: "resource"))
+        log.success("{} done", "Request")
+        log.flush()
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [(line["level"], line["message"]) for line in lines] == [
+            ("DEBUG", "Route /subjects resolved to resource"),
+            ("SUCCESS", "Request done"),
+        ]
@@ -0,0 +1,52 @@
+from restapiboys import database, metrics
+from restapiboys.config import MetricsConfig
+from tests.test_server import request_with_headers
+import os
+import time
+
+
+def test_nested_stages_are_not_counted_twice():
+    metrics.start_timing(MetricsConfig(server_timing=True))
+    timings = metrics.current_timings.get()
+    with metrics.timed("validate"):
+        with metrics.timed("parse"):
+            time.sleep(0.02)
+    assert timings.stages["parse"] >= 0.02
+    assert timings.stages["validate"] < 0.01
+    metrics.current_timings.set(None)
+
+
+def test_merge_worker_snapshots():
+    snapshot = {
+        "histograms": [["/subjects", "GET", "db", [1] + [0] * len(metrics.BUCKETS), 0.0002, 1]],
+        "requests": [["/subjects", "GET", "200", 1]],
+        "cache": {"hits": 2},
+    }
+    text = metrics.render(metrics.merge_snapshots([snapshot, snapshot]))
+    labels = 'endpoint="/subjects",method="GET",stage="db"'
+    assert f'restapiboys_stage_duration_seconds_bucket{{{labels},le="0.0005"}} 2' in text
+    assert f'restapiboys_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"restapiboys_stage_duration_seconds_count{{{labels}}} 2" in text
+    assert 'restapiboys_requests_total{endpoint="/subjects",method="GET",status="200"} 2' in text
+    assert "restapiboys_cache_hits_total 4" in text
+
+
+class Test:
+    def setup_method(self, test_method):
+        database.create_database("subjects")
+
+    def teardown_method(self, test_method):
+        database.delete_database("subjects")
+
+    def test_timings(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(metrics, "_store", metrics.MetricsStore(MetricsConfig(enabled=True, directory=str(tmp_path))))
+        monkeypatch.setattr(metrics, "_store_pid", os.getpid())
+        _, headers, _ = request_with_headers("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        stages = [metric.split(";")[0] for metric in headers["Server-Timing"].split(", ")]
+        assert stages == ["route", "parse", "validate", "compute", "db", "serialize", "compress", "total"]
+        # another worker
+        (tmp_path / "1.json").write_bytes(metrics.codec.dumps(metrics.get_store(MetricsConfig()).snapshot()))
+        status, headers, text = request_with_headers("GET", "/metrics", decode=False)
+        assert status == "200 OK"
+        assert headers["Content-Type"].startswith("text/plain")
+        assert 'restapiboys_requests_total{endpoint="/subjects",method="POST",status="200"} 2' in text.decode("utf-8")
@@ -0,0 +1,43 @@
+from restapiboys import pagination
+from restapiboys.endpoints import get_resource_config_of_route
+from tests.conftest import make_request
+import pytest
+
+
+def test_default_page_size():
+    resource = get_resource_config_of_route("/homework")
+    page = pagination.get_page_request(make_request({}), resource)
+    assert page == pagination.PageRequest(limit=50)
+
+
+def test_pagination_is_opt_in():
+    resource = get_resource_config_of_route("/subjects")
+    assert pagination.get_page_request(make_request({}), resource) is None
+    page = pagination.get_page_request(make_request({"limit": "10"}), resource)
+    assert page == pagination.PageRequest(limit=10)
+
+
+def test_limit_is_bounded():
+    resource = get_resource_config_of_route("/homework")
+    with pytest.raises(pagination.PaginationError):
+        pagination.get_page_request(make_request({"limit": "0"}), resource)
+    with pytest.raises(pagination.PaginationError):
+        pagination.get_page_request(
+            make_request({"limit": str(resource.max_page_size + 1)}), resource
+        )
+
+
+def test_cursor_round_trip():
+    resource = get_resource_config_of_route("/homework")
+    req = make_request({"limit": "10"})
+    headers = pagination.get_pagination_headers(
+        req, pagination.PageRequest(10), {"startkey": "some-id"}
+    )
+    cursor = headers["Link"].split("cursor=")[1].split(">")[0]
+    cursor = cursor.replace("%3D", "=")
+    page = pagination.get_page_request(make_request({"cursor": cursor}), resource)
+    assert page.startkey == "some-id"
+
+
+def test_no_link_on_last_page():
+    assert pagination.get_pagination_headers(make_request({}), pagination.PageRequest(10), None) == {}
@@ -0,0 +1,40 @@
+from restapiboys.http import StatusCode
+from restapiboys.routing import RouteKind, get_router
+
+
+def test_resolve_collection_and_item():
+    router = get_router()
+    match = router.resolve("GET", "/homework")
+    assert match.status is StatusCode.OK
+    assert match.kind is RouteKind.collection
+    assert match.resource.route == "/homework"
+
+    match = router.resolve("PATCH", "/homework/0c7b6e52-4fd3-4c49-a5c6-2e6b4e2e0f3d")
+    assert match.kind is RouteKind.item
+    assert match.params == {"uuid": "0c7b6e52-4fd3-4c49-a5c6-2e6b4e2e0f3d"}
+
+
+def test_resolve_not_found():
+    assert get_router().resolve("GET", "/nope").status is StatusCode.NOT_FOUND
+    assert get_router().resolve("GET", "/homework/a/b").status is StatusCode.NOT_FOUND
+
+
+def test_resolve_method_not_allowed():
+    # settings.yaml only allows GET and PATCH
+    match = get_router().resolve("POST", "/settings")
+    assert match.status is StatusCode.METHOD_NOT_ALLOWED
+    assert match.allowed_methods == ["GET"]
+
+
+def test_resolve_custom_route():
+    match = get_router().resolve("GET", "/courses/2020-01-01/2020-02-01")
+    assert match.kind is RouteKind.custom
+    assert match.params == {"start": "2020-01-01", "end": "2020-02-01"}
+    assert match.handler.__name__ == "response"
+
+
+def test_resolve_builtin_routes():
+    assert get_router().resolve("GET", "/").kind is RouteKind.root
+    match = get_router().resolve("GET", "/specs/homework")
+    assert match.kind is RouteKind.specs
+    assert match.params == {"endpoint": "homework"}
@@ -0,0 +1,266 @@
+from typing import *
+from restapiboys import database, metrics
+from restapiboys.server import check_custom_route_response, requests_handler
+from types import SimpleNamespace
+from uuid import uuid4
+import io
+import json
+import pytest
+
+
+def request(method: str, path: str, body: Any = None) -> Tuple[str, Any]:
+    status, _, body = request_with_headers(method, path, body)
+    return status, body
+
+
+def request_with_headers(
+    method: str,
+    path: str,
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    decode: bool = True,
+) -> Tuple[str, Dict[str, str], Any]:
+    body_bytes = json.dumps(body).encode("utf-8") if body is not None else b""
+    path, _, query_string = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "CONTENT_LENGTH": str(len(body_bytes)),
+        "wsgi.input": io.BytesIO(body_bytes),
+        "wsgi.url_scheme": "http",
+        "HTTP_HOST": "localhost",
+        "HTTP_USER_AGENT": "Mozilla/5.0 (X11; Linux x86_64; rv:75.0) Gecko/20100101 Firefox/75.0",
+    }
+    for name, value in (headers or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    response = {}
+
+    def start_response(status, headers):
+        response["status"] = status
+        response["headers"] = dict(headers)
+
+    body = b"".join(requests_handler(environ, start_response))
+    if not decode:
+        return response["status"], response["headers"], body
+    return response["status"], response["headers"], json.loads(body) if body else None
+
+
+def test_custom_route_response_must_be_a_response():
+    with pytest.raises(TypeError):
+        check_custom_route_response(SimpleNamespace(route="/courses/a/b"), {"not": "a response"})
+
+
+class Test:
+    # Overridden to test the ASGI application with the same tests
+    request = staticmethod(request)
+    request_with_headers = staticmethod(request_with_headers)
+
+    def setup_method(self, test_method):
+        database.create_database('subjects')
+
+    def teardown_method(self, test_method):
+        database.delete_database('subjects')
+
+    def test_post_round_trips(self, round_trips):
+        status, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        assert status == "200 OK"
+        assert item["slug"] == "maths"
+        assert len(round_trips) == 1
+
+    def test_patch_round_trips(self, round_trips):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        round_trips.clear()
+        status, item = self.request("PATCH", f"/subjects/{item['_id']}", {"room": "B204"})
+        assert status == "200 OK"
+        assert item["room"] == "B204"
+        # read the current document, write the new one
+        assert len(round_trips) == 2
+
+    def test_patch_validation_rules(self, round_trips):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        round_trips.clear()
+        status, error = self.request("PATCH", f"/subjects/{item['_id']}", {"color": "red"})
+        assert status == "400 Bad Request"
+        assert error["failed_validations"] == {"color": ["Must be a valid CSS hex color"]}
+        # Rejected before reading the document
+        assert len(round_trips) == 0
+
+    def test_delete_round_trips(self, round_trips):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        round_trips.clear()
+        status, _ = self.request("DELETE", f"/subjects/{item['_id']}")
+        assert status == "200 OK"
+        assert len(round_trips) == 2
+
+    def test_bulk_post(self, round_trips):
+        status, items = self.request(
+            "POST",
+            "/subjects",
+            [{"name": "Maths", "color": "#ff0000"}, {"name": "Physics"}, {"name": "French", "color": "#0000ff"}],
+        )
+        assert status == "200 OK"
+        assert [item.get("slug") for item in items] == ["maths", None, "french"]
+        assert items[1]["missing_fields"] == ["color"]
+        assert len(round_trips) == 1
+
+    def test_get_item_passthrough(self, round_trips, monkeypatch):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        round_trips.clear()
+        # the document is forwarded as CouchDB sent it
+        monkeypatch.setattr(database.codec, "loads", None)
+        status, headers, body = self.request_with_headers("GET", f"/subjects/{item['_id']}")
+        assert status == "200 OK"
+        assert body == item
+        assert headers["Content-Type"] == "application/json"
+        assert headers["ETag"] == f'"{item["_rev"]}"'
+        assert len(round_trips) == 1
+
+    def test_get_missing_item(self):
+        status, headers, body = self.request_with_headers("GET", "/subjects/missing")
+        assert status == "404 Not Found"
+        assert body["error"] == "not_found"
+        assert "ETag" not in headers
+
+    def test_get_missing_item_fields(self):
+        status, body = self.request("GET", "/subjects/missing?fields=name")
+        assert status == "404 Not Found"
+        assert "error" in body
+
+    def test_not_modified_item(self, round_trips):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        _, headers, _ = self.request_with_headers("GET", f"/subjects/{item['_id']}")
+        assert headers["ETag"] == f'"{item["_rev"]}"'
+        round_trips.clear()
+        status, headers, body = self.request_with_headers(
+            "GET", f"/subjects/{item['_id']}", headers={"If-None-Match": headers["ETag"]}
+        )
+        assert status == "304 Not Modified"
+        assert body is None
+        # a HEAD request, the document is not read
+        assert round_trips == [("HEAD", f"subjects/{item['_id']}")]
+
+    def test_modified_collection(self):
+        _, headers, _ = self.request_with_headers("GET", "/subjects")
+        self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        status, new_headers, items = self.request_with_headers(
+            "GET", "/subjects", headers={"If-None-Match": headers["ETag"]}
+        )
+        assert status == "200 OK"
+        assert len(items) == 1
+        assert new_headers["ETag"] != headers["ETag"]
+
+    def test_design_documents_are_not_listed(self):
+        database.create_index("subjects", {"index": {"fields": ["name"]}, "ddoc": "restapiboys-filters"})
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        status, items = self.request("GET", "/subjects")
+        assert status == "200 OK"
+        assert items == [item]
+
+    def test_streamed_collection(self):
+        created = [
+            self.request("POST", "/subjects", {"name": name, "color": "#ff0000"})[1]
+            for name in ["Maths", "Physics", "History"]
+        ]
+        status, headers, items = self.request_with_headers("GET", "/subjects")
+        assert status == "200 OK"
+        # Not paginated: the whole collection is streamed
+        assert "Content-Length" not in headers and "Link" not in headers
+        assert sorted(items, key=lambda item: item["_id"]) == sorted(created, key=lambda item: item["_id"])
+
+    def test_get_collection_round_trips(self, round_trips):
+        self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        for path in ["/subjects", "/subjects?limit=1"]:
+            round_trips.clear()
+            status, headers, items = self.request_with_headers("GET", path)
+            assert status == "200 OK"
+            assert len(items) == 1
+            assert headers["ETag"]
+            # The ETag comes from the sequence _all_docs gives with the documents
+            assert [method for method, _ in round_trips] == ["GET"]
+            assert round_trips[0][1] == "subjects/_all_docs"
+
+    def test_not_modified_collection(self, round_trips):
+        self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        _, headers, _ = self.request_with_headers("GET", "/subjects")
+        round_trips.clear()
+        status, _, _ = self.request_with_headers("GET", "/subjects", headers={"If-None-Match": headers["ETag"]})
+        assert status == "304 Not Modified"
+        # The documents are not listed
+        assert round_trips == [("GET", "subjects")]
+
+    def test_projection_of_flattened_fields(self):
+        database.create_database("schedule-mutations")
+        try:
+            _, item = self.request(
+                "POST",
+                "/schedule-mutations",
+                {"room": "B204", "deleted_in.start": "2026-03-01T08:00:00Z", "deleted_in.end": "2026-03-01T10:00:00Z"},
+            )
+            status, projected = self.request("GET", f"/schedule-mutations/{item['_id']}?fields=deleted_in")
+            assert status == "200 OK"
+            assert projected == {
+                "_id": item["_id"],
+                "_rev": item["_rev"],
+                "deleted_in.start": "2026-03-01T08:00:00Z",
+                "deleted_in.end": "2026-03-01T10:00:00Z",
+            }
+            status, items = self.request("GET", "/schedule-mutations?fields=room,deleted_in.end")
+            assert status == "200 OK"
+            assert items == [
+                {"_id": item["_id"], "_rev": item["_rev"], "room": "B204", "deleted_in.end": "2026-03-01T10:00:00Z"}
+            ]
+        finally:
+            database.delete_database("schedule-mutations")
+
+    def test_custom_route_without_response(self):
+        database.create_database("events")
+        try:
+            status, _ = self.request("GET", "/courses/a/b")
+            assert status == "204 No Content"
+            database.create_item("events", uuid4(), {"name": "Maths"})
+            # The route's function returns None when there are events
+            status, body = self.request("GET", "/courses/a/b")
+            assert status == "404 Not Found"
+            assert body == {"error": "The resource /courses/a/b was not found"}
+        finally:
+            database.delete_database("events")
+
+    def test_error_after_handling_the_request(self, monkeypatch):
+        def fail(timings):
+            raise RuntimeError("Can't write the timings")
+
+        monkeypatch.setattr(metrics.RequestTimings, "as_header", fail)
+        status, body = self.request("GET", "/subjects?limit=1")
+        assert status == "500 Internal Server Error"
+        assert body["error"] == "Can't write the timings"
+
+    def test_query_couchdb_cannot_run(self):
+        database.create_database("homework")
+        try:
+            # CouchDB only sorts in one direction
+            status, body = self.request("GET", "/homework?sort=type,-due_at")
+            assert status == "400 Bad Request"
+            assert body["error"].startswith("unsupported_mixed_sort")
+        finally:
+            database.delete_database("homework")
+
+    def test_write_with_if_match(self, round_trips):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        round_trips.clear()
+        status, headers, _ = self.request_with_headers(
+            "DELETE", f"/subjects/{item['_id']}", headers={"If-Match": f'"{item["_rev"]}"'}
+        )
+        assert status == "200 OK"
+        # no revision lookup
+        assert len(round_trips) == 1
+
+    def test_outdated_if_match(self):
+        _, item = self.request("POST", "/subjects", {"name": "Maths", "color": "#ff0000"})
+        _, headers, _ = self.request_with_headers("PATCH", f"/subjects/{item['_id']}", {"room": "B204"})
+        assert headers["ETag"] != f'"{item["_rev"]}"'
+        for method, body in (("PATCH", {"room": "A1"}), ("DELETE", None)):
+            status, _, _ = self.request_with_headers(
+                method, f"/subjects/{item['_id']}", body, headers={"If-Match": f'"{item["_rev"]}"'}
+            )
+            assert status == "412 Precondition Failed"
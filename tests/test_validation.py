@@ -0,0 +1,92 @@
+from restapiboys.endpoints import get_registry
+from restapiboys.expressions import ExpressionError
+from restapiboys.validation import ResourceValidator, get_validator, validate_item_data, validate_patched_item
+from uuid import uuid4
+import pytest
+
+homework = get_registry().by_identifier["homework"]
+
+
+def test_validators_compiled_with_registry():
+    assert get_validator(homework) is get_registry().validators["homework"]
+
+
+def test_validate_item_data():
+    body = {
+        "title": "Exercices 4 à 9",
+        "subject": str(uuid4()),
+        "type": "exercise",
+        "due_at": "2026-03-01T08:00:00+01:00",
+        "progress": 0.5,
+    }
+    assert validate_item_data(body, "POST", homework) is None
+    assert validate_item_data({"title": "Exercices"}, "POST", homework) == (
+        "Some fields are missing",
+        {"missing_fields": ["subject", "type", "due_at"]},
+    )
+    assert validate_item_data({"progress": "half", "room": "B204"}, "PATCH", homework) == (
+        "Some fields' values are of the wrong type",
+        {"correct_types_for_fields": {"progress": "number"}},
+    )
+    assert validate_item_data({"room": "B204"}, "PATCH", homework) == (
+        "Unknown fields in request",
+        {"unknown_fields": ["room"]},
+    )
+    assert validate_item_data({"progress": 2, "notes": []}, "PATCH", homework)[0] == "`progress` is out of bounds"
+    assert validate_item_data({"notes": []}, "PATCH", homework)[0] == "`notes` is either too long or too short"
+    assert validate_item_data({"is_late": True}, "PATCH", homework) == (
+        "Some fields are read-only",
+        {"readonly_fields": ["updated_at", "completed_at", "is_late"], "fields_to_remove": ["is_late"]},
+    )
+
+
+def test_validation_rules():
+    subjects = get_registry().by_identifier["subjects"]
+    events = get_registry().by_identifier["events"]
+    mutations = get_registry().by_identifier["schedule-mutations"]
+    # Rules of single-field custom types, with functions/validators.py
+    assert validate_item_data({"name": "Maths", "color": "#ff0000"}, "POST", subjects) is None
+    assert validate_item_data({"color": "red"}, "PATCH", subjects) == (
+        "Some fields' values are not valid",
+        {"failed_validations": {"color": ["Must be a valid CSS hex color"]}},
+    )
+    # Rules reading other fields
+    event = {"subject": str(uuid4()), "start": "09:00:00Z", "end": "08:00:00Z", "day": 1}
+    assert validate_item_data(event, "POST", events) == (
+        "Some fields' values are not valid",
+        {"failed_validations": {"end": ["Must be in the future relative to `start`"]}},
+    )
+    # Fields of multi-field custom types read each other by their name in the type, errors are batched
+    mutation = {
+        "event": str(uuid4()),
+        "deleted_in.start": "2026-03-02T00:00:00Z",
+        "deleted_in.end": "2026-03-01T00:00:00Z",
+        "added_in.start": "2026-03-04T00:00:00Z",
+        "added_in.end": "2026-03-03T00:00:00Z",
+    }
+    assert validate_item_data(mutation, "POST", mutations)[1] == {
+        "failed_validations": {
+            "deleted_in.end": ["The end must be after the start"],
+            "added_in.end": ["The end must be after the start"],
+        }
+    }
+
+
+def test_validation_rules_on_patch():
+    events = get_registry().by_identifier["events"]
+    stored = {"start": "09:00:00Z", "end": "10:00:00Z"}
+    # Needs the stored document
+    assert validate_item_data({"end": "08:00:00Z"}, "PATCH", events) is None
+    assert validate_patched_item({"end": "08:00:00Z"}, stored, events)[1] == {
+        "failed_validations": {"end": ["Must be in the future relative to `start`"]}
+    }
+    assert validate_patched_item({"end": "11:00:00Z"}, stored, events) is None
+    # Checked with the request's body already
+    assert validate_patched_item({"start": "09:00:00Z", "end": "08:00:00Z"}, stored, events) is None
+
+
+def test_invalid_validation_rule():
+    homework = get_registry().by_identifier["homework"]
+    field = homework.fields[0]._replace(validation={"Must be valid": "len(_) >"})
+    with pytest.raises(ExpressionError):
+        ResourceValidator(homework._replace(fields=[field]))